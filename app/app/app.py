@@ -4,12 +4,16 @@ from flask import Flask, json
 from flask.helpers import send_from_directory
 from .processor import processor
 from .auth import auth
+from .metrics import metrics, init_metrics
+from .instrumentation import init_instrumentation
+from .profiling import init_profiling
 import logging
 
 
 BLUEPRINTS = (
     auth,
     processor,
+    metrics,
 )
 
 
@@ -35,6 +39,7 @@ def configure_general(app):
 
 def configure_db(app):
     from .database import db, init_db
+    from .jobs import models
     init_db(db, app)
 
     @app.teardown_appcontext
@@ -60,6 +65,9 @@ def create_app(config_object, config_pyfile, instance_relative_config=True):
     app.config.from_pyfile(config_pyfile)
     register_blueprints(app)
     configure_db(app)
+    init_metrics(app)
+    init_instrumentation(app)
+    init_profiling(app)
     configure_general(app)
     ensure_configs(app)
 
@@ -0,0 +1,196 @@
+"""
+API benchmark suite.
+
+For every dataset size the benchmark database is recreated, seeded with
+`DatasetSeeder` and every endpoint of `endpoints` is requested through the
+test client: first a few warm-up requests, then timed ones (p50/p95 latency,
+statements per request from `X-DB-Query-Count`), then a few traced with
+`tracemalloc` for peak memory. Results are saved as `<output>/<git sha>.json`
+and can be compared with results of another commit, e.g.::
+
+    $ python manage.py benchmark --sizes 100,1000 --compare benchmarks/<other sha>.json
+"""
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from .database import db, setup_db
+from .processor.models import Action, Analysis, Model, ModelStatus, ModelType, PersonType, Profile
+from .seed import DatasetSeeder
+
+SERVER_PATH = '/app/api/v1'
+WARMUP_REQUESTS = 3
+MEMORY_REQUESTS = 3
+
+
+def _analysis_ids(rnd):
+    """Random analyses which may be updated, i.e. not being computed."""
+    unfinished_ids = [ModelStatus.by_name(name).id for name in ModelStatus.unfinished_names()]
+    computed = db.session.query(Model.analysis_id).filter(Model.status_id.in_(unfinished_ids))
+    ids = [row[0] for row in db.session.query(Analysis.id).join(Action, Action.id == Analysis.action_id).
+           filter(Action.deleted == False, Analysis.deleted == False, ~Analysis.id.in_(computed)).
+           order_by(Analysis.id)]
+    return lambda: rnd.choice(ids)
+
+
+def _patch_body(analysis_id):
+    """Analysis update as sent by the frontend: changed field with unchanged models and profiles."""
+    analysis = Analysis.query.get(analysis_id)
+    return {'description': 'benchmark',
+            'models': [{'model_type_id': model.model_type_id, 'weight': model.weight}
+                       for model in analysis.models if not model.complex] +
+                      [{'model_type_id': model.model_type_id, 'weight': None}
+                       for model in analysis.models if model.complex],
+            'profiles': [{'person_type_id': profile.person_type_id, 'weight': profile.weight}
+                         for profile in Profile.query.filter_by(analysis_id=analysis_id)]}
+
+
+def _patch_request(analysis_id):
+    return 'patch', '/analyses/{}'.format(analysis_id), _patch_body(analysis_id)
+
+
+def _action_body(now):
+    """New action with one draft analysis, as created by the frontend."""
+    model_types = ModelType.query.filter_by(complex=False).order_by(ModelType.id)
+    return {'name': 'Benchmark action', 'lost_time': now,
+            'analyses': [{'name': 'Benchmark analysis',
+                          'models': [{'model_type_id': model_type.id, 'weight': 1} for model_type in model_types],
+                          'profiles': [{'person_type_id': PersonType.query.order_by(PersonType.id).first().id,
+                                        'weight': 1}]}]}
+
+
+def endpoints(rnd):
+    """
+    :return: list of (name, request factory) pairs, factories return (method, path, json body)
+    """
+    analysis_id = _analysis_ids(rnd)
+    page_ts = int(time.time())
+    return [
+        ('GET /actions', lambda: ('get', '/actions', None)),
+        ('GET /actions?per_page=20', lambda: ('get', '/actions?per_page=20&page_ts={}'.format(page_ts), None)),
+        ('GET /analyses', lambda: ('get', '/analyses', None)),
+        ('GET /analyses/<id>', lambda: ('get', '/analyses/{}'.format(analysis_id()), None)),
+        ('PATCH /analyses/<id>', lambda: _patch_request(analysis_id())),
+        ('POST /actions', lambda: ('post', '/actions', _action_body(page_ts))),
+    ]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def _request(app, client, factory):
+    with app.app_context():
+        method, path, body = factory()
+    kwargs = {'data': json.dumps(body), 'content_type': 'application/json'} if body is not None else {}
+    start = time.perf_counter()
+    response = getattr(client, method)(SERVER_PATH + path, **kwargs)
+    duration = time.perf_counter() - start
+    return response, duration
+
+
+def measure(app, client, factory, requests):
+    """
+    :return: dict of latency, statement count and memory statistics of one endpoint
+    """
+    for _ in range(WARMUP_REQUESTS):
+        _request(app, client, factory)
+    durations, queries, errors = [], [], 0
+    for _ in range(requests):
+        response, duration = _request(app, client, factory)
+        if response.status_code >= 400:
+            errors += 1
+            continue
+        durations.append(duration * 1000)
+        if 'X-DB-Query-Count' in response.headers:
+            queries.append(int(response.headers['X-DB-Query-Count']))
+
+    peaks = []
+    for _ in range(MEMORY_REQUESTS):
+        tracemalloc.start()
+        try:
+            _request(app, client, factory)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024.0)
+        finally:
+            tracemalloc.stop()
+    return {'requests': requests, 'errors': errors,
+            'p50_ms': _round(percentile(durations, 0.5)), 'p95_ms': _round(percentile(durations, 0.95)),
+            'queries': percentile(queries, 0.5), 'peak_kib': _round(max(peaks))}
+
+
+def reset_database(app):
+    with app.app_context():
+        db.session.close()
+        db.drop_all()
+        db.create_all()
+        setup_db(db.session)
+
+
+def run_benchmark(app, sizes, requests=30, analyses=5, profiles=2, random_seed=0):
+    """
+    Recreates the database of `app` for every size in `sizes` (numbers of actions), so it must
+    not be a database with real data.
+
+    :return: benchmark report
+    """
+    results = []
+    for size in sizes:
+        reset_database(app)
+        with app.app_context():
+            DatasetSeeder(db.session, analyses, profiles, random_seed).insert(size)
+            requests_by_endpoint = endpoints(random.Random(random_seed))
+            db.session.remove()
+        client = app.test_client()
+        for name, factory in requests_by_endpoint:
+            result = measure(app, client, factory, requests)
+            result.update(actions=size, endpoint=name)
+            results.append(result)
+    return {'commit': git_commit(), 'created': datetime.datetime.now().isoformat(),
+            'database': db.get_engine(app).dialect.name, 'python': platform.python_version(),
+            'settings': {'analyses': analyses, 'profiles': profiles, 'requests': requests, 'seed': random_seed},
+            'results': results}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode('utf8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save_report(report, directory):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, '{}.json'.format(report['commit']))
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True)
+    return path
+
+
+def compare(previous, current):
+    """
+    :return: lines with p95 latency and statement count of both reports, for endpoints and sizes in both
+    """
+    before = {(r['actions'], r['endpoint']): r for r in previous['results']}
+    lines = ['{:>8} {:<26} {:>23} {:>13}'.format('actions', 'endpoint', 'p95 ms {}..{}'.format(
+        previous['commit'], current['commit']), 'queries')]
+    for result in current['results']:
+        old = before.get((result['actions'], result['endpoint']))
+        if old is None or old['p95_ms'] is None or result['p95_ms'] is None:
+            continue
+        change = (result['p95_ms'] / old['p95_ms'] - 1) * 100 if old['p95_ms'] else 0.0
+        lines.append('{:>8} {:<26} {:>9.1f} {:>6.1f} {:+5.0f}% {:>6} {:>6}'.format(
+            result['actions'], result['endpoint'], old['p95_ms'], result['p95_ms'], change,
+            old['queries'], result['queries']))
+    return lines
@@ -1,11 +1,200 @@
-from flask_sqlalchemy import SQLAlchemy
+"""
+Database access with optional read replica.
 
-db = SQLAlchemy()
+If `SQLALCHEMY_READ_REPLICA_URI` is set, reads made by views decorated with
+`read_replica` go to the replica. Everything else uses the primary: flushes,
+INSERT/UPDATE/DELETE and locking statements, requests of clients that wrote
+within the last `READ_YOUR_WRITES_SEC` (remembered in a cookie) and all reads
+while the replica lags more than `REPLICA_MAX_LAG_SEC` or is unreachable.
+"""
+import functools
+import logging
+import threading
+import time
+from flask import g, request, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import text, and_, bindparam, DateTime
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA = 'replica'
+PRIMARY_COOKIE = 'db_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingSession(SignallingSession):
+
+    def _writes(self, clause):
+        return self._flushing or isinstance(clause, UpdateBase) or \
+            getattr(clause, '_for_update_arg', None) is not None or \
+            (clause is not None and not hasattr(clause, 'froms'))     # plain text statements
+
+    def get_bind(self, mapper=None, clause=None):
+        if getattr(g, 'db_route', None) == REPLICA and not self._writes(clause):
+            state = get_state(self.app)
+            return state.db.get_engine(self.app, bind=REPLICA)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class ReplicaMonitor(object):
+    """
+    Caches replica health for `REPLICA_LAG_CHECK_SEC`, so lag is checked at most once per interval.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._available = False
+
+    @staticmethod
+    def lag(connection):
+        """Replication delay in seconds; only PostgreSQL standbys report it, other replicas are trusted."""
+        if connection.dialect.name != 'postgresql':
+            return 0.0
+        return connection.execute(text(
+            'SELECT CASE WHEN NOT pg_is_in_recovery() '
+            'OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+            'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END')).scalar() or 0.0
+
+    def available(self, app, engine):
+        now = time.time()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < app.config['REPLICA_LAG_CHECK_SEC']:
+                return self._available
+            try:
+                with engine.connect() as connection:
+                    lag = self.lag(connection)
+                self._available = lag <= app.config['REPLICA_MAX_LAG_SEC']
+                if not self._available:
+                    logging.warning('Read replica lags {:.1f} s, reading from primary'.format(lag))
+            except SQLAlchemyError as e:
+                logging.warning('Read replica unavailable, reading from primary: {}'.format(e))
+                self._available = False
+            self._checked_at = now
+            return self._available
+
+    def reset(self):
+        with self._lock:
+            self._checked_at = None
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def __init__(self, *args, **kwargs):
+        SQLAlchemy.__init__(self, *args, **kwargs)
+        self.replica_monitor = ReplicaMonitor()
+
+    def create_session(self, options):
+        return RoutingSession(self, **options)
+
+    def replica_enabled(self, app):
+        return bool(app.config.get('SQLALCHEMY_READ_REPLICA_URI'))
+
+    def use_replica(self, app):
+        """Tells if reads of the current request may go to the replica."""
+        if not self.replica_enabled(app) or request.method not in SAFE_METHODS:
+            return False
+        try:
+            if float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time():
+                return False    # read your own writes
+        except ValueError:
+            pass
+        return self.replica_monitor.available(app, self.get_engine(app, bind=REPLICA))
+
+    def reads_replica(self):
+        """Tells if reads of the current request go to the replica."""
+        return has_request_context() and g.get('db_route') == REPLICA
+
+    def use_primary(self):
+        """Sends the remaining reads of the current request to the primary, e.g. after a view wrote."""
+        if has_request_context():
+            g.db_route = None
+
+
+db = RoutingSQLAlchemy()
+
+
+def read_replica(function):
+    """
+    Marks read-only view: its reads may be served by the read replica.
+    """
+    @functools.wraps(function)
+    def decorated(*args, **kwargs):
+        if not has_request_context() or not db.use_replica(db.get_app()):
+            return function(*args, **kwargs)
+        g.db_route = REPLICA
+        try:
+            return function(*args, **kwargs)
+        finally:
+            g.db_route = None
+    return decorated
+
+
+class clock_timestamp(FunctionElement):
+    """
+    Current time of the statement. PostgreSQL `now()` is the start of the transaction, so rows of a long
+    transaction would get `updated_at` older than rows committed meanwhile, and delta sync would miss them.
+    """
+    type = DateTime()
+    name = 'clock_timestamp'
+
+
+@compiles(clock_timestamp)
+def _default_clock_timestamp(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
+
+@compiles(clock_timestamp, 'postgresql')
+def _postgresql_clock_timestamp(element, compiler, **kw):
+    return 'clock_timestamp()'
+
+
+def upsert(session, table, rows, index_elements, update_columns):
+    """
+    Inserts `rows` (list of dicts), rows conflicting with existing ones on unique `index_elements`
+    update their `update_columns` instead. On PostgreSQL it is a single `INSERT ... ON CONFLICT DO UPDATE`,
+    other databases (SQLite in tests) update existing rows first and insert the rest.
+    """
+    if not rows:
+        return
+    if session.get_bind().dialect.name == 'postgresql':
+        statement = postgresql.insert(table).values(rows)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=index_elements, set_={column: statement.excluded[column] for column in update_columns}))
+        return
+    update = table.update().\
+        where(and_(*[table.c[column] == bindparam('key_' + column) for column in index_elements])).\
+        values({column: bindparam('value_' + column) for column in update_columns})
+    missing = []
+    for row in rows:
+        params = dict([('key_' + column, row[column]) for column in index_elements] +
+                      [('value_' + column, row[column]) for column in update_columns])
+        if not session.execute(update, params).rowcount:
+            missing.append(row)
+    if missing:
+        session.execute(table.insert().values(missing))
+
+
+def configure_replica(app):
+    uri = app.config.get('SQLALCHEMY_READ_REPLICA_URI')
+    if uri:
+        app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **{REPLICA: uri})
 
 
 def init_db(database, app):
+    configure_replica(app)
     database.init_app(app)
 
+    @app.after_request
+    def remember_write(response):
+        if database.replica_enabled(app) and request.method not in SAFE_METHODS and response.status_code < 400:
+            until = time.time() + app.config['READ_YOUR_WRITES_SEC']
+            response.set_cookie(PRIMARY_COOKIE, '{:.3f}'.format(until), max_age=app.config['READ_YOUR_WRITES_SEC'])
+        return response
+
 
 def setup_db(database_session):
     from app.processor.models import ModelType, PersonType, ActionStatus, ModelStatus
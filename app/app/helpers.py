@@ -6,6 +6,10 @@ def resource_does_not_exist():
     abort(404, message='Resource does not exist.', internal_code='error_does_not_exist')
 
 
+def unauthorized():
+    abort(401, message='Unauthorized.', internal_code='error_unauthorized')
+
+
 def server_not_available():
     abort(503, message='Server not available', internal_code='error_server_not_available')
 
@@ -18,6 +22,19 @@ def request_resource_unavailable():
     abort(405, message='Request to resource unavailable.', internal_code='error_request_unavailable')
 
 
+def conflict():
+    abort(409, message='Resource was modified by another request.', internal_code='error_conflict')
+
+
+def request_in_progress():
+    abort(409, message='Request with this Idempotency-Key is in progress.', internal_code='error_request_in_progress')
+
+
+def idempotency_key_reused():
+    abort(422, message='Idempotency-Key was already used with another request.',
+          internal_code='error_idempotency_key_reused')
+
+
 def validation_failed(invalid_fields=None):
     abort(422, message='Validation failed.', internal_code='error_validation_failed', invalid_fields=invalid_fields)
 
@@ -0,0 +1,134 @@
+"""
+SQL statement counting hooked into SQLAlchemy engine events.
+
+Statements executed by the current thread are added to every active `QueryStats`
+collector, so one request (or one background job) gets its own counts even when
+collectors are nested, e.g. `max_queries` in tests wrapping a test client request.
+Request totals are returned in `X-DB-Query-Count` and `X-DB-Time-Ms` headers and
+logged as a JSON line by the `montracker.sql` logger.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger('montracker.sql')
+_local = threading.local()
+
+
+class QueryStats(object):
+
+    def __init__(self, record=False):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = [] if record else None
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        if self.statements is not None:
+            self.statements.append(statement)
+
+    @property
+    def duration_ms(self):
+        return self.duration * 1000
+
+    def as_dict(self):
+        return {'queries': self.count, 'db_ms': round(self.duration_ms, 2)}
+
+
+def _collectors():
+    if not hasattr(_local, 'collectors'):
+        _local.collectors = []
+    return _local.collectors
+
+
+def push(record=False):
+    stats = QueryStats(record)
+    _collectors().append(stats)
+    return stats
+
+
+def pop(stats):
+    collectors = _collectors()
+    if stats in collectors:
+        collectors.remove(stats)
+    return stats
+
+
+@contextmanager
+def collect(record=False):
+    stats = push(record)
+    try:
+        yield stats
+    finally:
+        pop(stats)
+
+
+@contextmanager
+def max_queries(limit):
+    """
+    Fails with AssertionError listing executed statements if the block executes more than `limit` of them::
+
+        with max_queries(5):
+            client.get('/app/api/v1/actions')
+    """
+    with collect(record=True) as stats:
+        yield stats
+    if stats.count > limit:
+        raise AssertionError('{} statements executed, at most {} expected:\n{}'.format(
+            stats.count, limit, '\n'.join(stats.statements)))
+
+
+def log_stats(kind, name, stats, **extra):
+    line = dict(extra, kind=kind, name=name, **stats.as_dict())
+    logger.info(json.dumps(line, sort_keys=True))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start'].pop()
+    for stats in _collectors():
+        stats.add(statement, duration)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    starts = context.connection.info.get('query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def init_instrumentation(app):
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+
+    @app.before_request
+    def start_sql_stats():
+        g.sql_stats = push()
+
+    @app.after_request
+    def report_sql_stats(response):
+        stats = getattr(g, 'sql_stats', None)
+        if stats is not None:
+            response.headers['X-DB-Query-Count'] = str(stats.count)
+            response.headers['X-DB-Time-Ms'] = '{:.2f}'.format(stats.duration_ms)
+            log_stats('request', request.endpoint, stats, method=request.method, path=request.path,
+                      status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def stop_sql_stats(exception=None):
+        stats = getattr(g, 'sql_stats', None)
+        if stats is not None:
+            pop(stats)
@@ -0,0 +1,2 @@
+from .leader import LeaderElection, election
+from .queue import task, enqueue, JobWorker, start_workers
@@ -0,0 +1,101 @@
+"""
+Leader election through a lease row in the main database.
+
+Every process tries to acquire or renew the lease every `SCH_LEADER_RENEW_SEC`.
+Only the holder of a non expired lease runs singleton jobs (e.g. polling the
+Calculation Server), so when the leader dies another process takes over after
+at most `SCH_LEADER_TTL_SEC`. Lease times are compared using app servers' UTC clocks.
+"""
+import datetime
+import logging
+import os
+import socket
+from sqlalchemy import or_, case
+from sqlalchemy.exc import IntegrityError
+from ..database import db
+from ..metrics import Gauge, registry
+from ..metrics.registry import Sample
+from .models import SchedulerLease
+
+
+leader_gauge = Gauge('montracker_scheduler_is_leader',
+                     'Whether this process holds the scheduler lease', ('holder',), multiprocess_mode='max')
+
+
+class LeaderElection(object):
+
+    def __init__(self, name='scheduler', ttl=15, clock=datetime.datetime.utcnow):
+        self.name = name
+        self.ttl = datetime.timedelta(seconds=ttl)
+        self.clock = clock
+        self.holder = None
+        self._valid_until = None
+
+    def configure(self, config):
+        self.ttl = datetime.timedelta(seconds=config['SCH_LEADER_TTL_SEC'])
+
+    @staticmethod
+    def process_id():
+        return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    @property
+    def is_leader(self):
+        return self._valid_until is not None and self.clock() < self._valid_until
+
+    def acquire(self):
+        """
+        Acquires or renews the lease, must be called within app context.
+
+        :return: True if this process is the leader
+        """
+        self.holder = self.holder or self.process_id()
+        now = self.clock()
+        expires_at = now + self.ttl
+        table = SchedulerLease.__table__
+        result = db.session.execute(
+            table.update().
+            where(table.c.name == self.name).
+            where(or_(table.c.holder == self.holder, table.c.expires_at <= now)).
+            values(holder=self.holder,
+                   expires_at=expires_at,
+                   acquired_at=case([(table.c.holder == self.holder, table.c.acquired_at)], else_=now)))
+        acquired = result.rowcount == 1
+        if not acquired and SchedulerLease.current(self.name) is None:
+            try:
+                db.session.add(SchedulerLease(name=self.name, holder=self.holder,
+                                              acquired_at=now, expires_at=expires_at))
+                db.session.flush()
+                acquired = True
+            except IntegrityError:
+                db.session.rollback()
+        db.session.commit()
+
+        if acquired != self.is_leader:
+            logging.info('{} {} scheduler leadership'.format(self.holder, 'acquired' if acquired else 'lost'))
+        self._valid_until = expires_at if acquired else None
+        leader_gauge.set(1 if acquired else 0, holder=self.holder)
+        return acquired
+
+    def release(self):
+        if not self.is_leader:
+            return
+        table = SchedulerLease.__table__
+        db.session.execute(table.update().
+                           where(table.c.name == self.name).
+                           where(table.c.holder == self.holder).
+                           values(expires_at=self.clock()))
+        db.session.commit()
+        self._valid_until = None
+        leader_gauge.set(0, holder=self.holder)
+
+
+election = LeaderElection()
+
+
+@registry.add_collector
+def collect_leases():
+    now = datetime.datetime.utcnow()
+    samples = [Sample('montracker_scheduler_leader', {'name': lease.name, 'holder': lease.holder},
+                      1 if lease.expires_at > now else 0)
+               for lease in SchedulerLease.query.all()]
+    return [('montracker_scheduler_leader', 'gauge', 'Current holder of each scheduler lease', samples)]
@@ -0,0 +1,49 @@
+import json
+from sqlalchemy import String, DateTime, Integer, Text
+from ..database import db
+
+
+class SchedulerLease(db.Model):
+    __tablename__ = 'scheduler_leases'
+
+    # columns
+    name = db.Column(String(64), primary_key=True)
+    holder = db.Column(String(256), nullable=False)
+    acquired_at = db.Column(DateTime, nullable=False)
+    expires_at = db.Column(DateTime, nullable=False)
+
+    @classmethod
+    def current(cls, name):
+        return cls.query.get(name)
+
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_claim', 'status', 'priority', 'run_at'),
+    )
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    # columns
+    id = db.Column(Integer, primary_key=True, autoincrement=True)
+    name = db.Column(String(128), nullable=False)
+    payload = db.Column(Text, nullable=True)
+    priority = db.Column(Integer, nullable=False, default=0)
+    status = db.Column(String(16), nullable=False, default=QUEUED)
+    attempts = db.Column(Integer, nullable=False, default=0)
+    max_attempts = db.Column(Integer, nullable=False)
+    run_at = db.Column(DateTime, nullable=False)
+    locked_by = db.Column(String(256), nullable=True)
+    locked_until = db.Column(DateTime, nullable=True)
+    visibility_timeout_sec = db.Column(Integer, nullable=True)     # JOB_VISIBILITY_TIMEOUT_SEC if not set
+    last_error = db.Column(Text, nullable=True)
+    created_at = db.Column(DateTime, nullable=False)
+    finished_at = db.Column(DateTime, nullable=True)
+
+    @property
+    def data(self):
+        return json.loads(self.payload) if self.payload else {}
@@ -0,0 +1,184 @@
+"""
+Job queue stored in the main database.
+
+Jobs are claimed by worker threads of any app process with
+`SELECT ... FOR UPDATE SKIP LOCKED` followed by a conditional UPDATE, so a job is
+executed by one worker at a time. Claimed job is invisible to other workers for
+its own visibility timeout (`JOB_VISIBILITY_TIMEOUT_SEC` by default); if its
+worker dies, the job is claimed again after the timeout. Failed jobs are retried with exponential backoff up to `max_attempts`.
+"""
+import datetime
+import json
+import logging
+import threading
+import traceback
+from sqlalchemy import or_, and_
+from ..database import db
+from ..instrumentation import collect, log_stats
+from .leader import LeaderElection
+from .models import Job
+
+
+tasks = {}
+
+
+def task(name):
+    """
+    Registers function as a handler of jobs with given name. Handler is called
+    with job payload dict within app context.
+    """
+    def decorator(function):
+        tasks[name] = function
+        return function
+    return decorator
+
+
+def enqueue(name, payload=None, priority=0, run_at=None, max_attempts=None, unique=False, visibility_timeout=None):
+    """
+    Adds job to the queue, must be called within app context.
+
+    :param unique: if True, job is not added when another job with the same name waits or runs
+    :param visibility_timeout: seconds after which a claimed job is claimed again, e.g. of periodic jobs
+        to fail over within their interval (default `JOB_VISIBILITY_TIMEOUT_SEC`)
+    :return: added Job or None if unique job is already queued
+    """
+    from flask import current_app
+    if name not in tasks:
+        raise ValueError('No task registered for job {}'.format(name))
+    if unique and Job.query.filter(Job.name == name,
+                                   Job.status.in_([Job.QUEUED, Job.RUNNING])).first() is not None:
+        return None
+    now = datetime.datetime.utcnow()
+    job = Job(name=name,
+              payload=json.dumps(payload) if payload is not None else None,
+              priority=priority,
+              status=Job.QUEUED,
+              attempts=0,
+              max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+              run_at=run_at or now,
+              visibility_timeout_sec=visibility_timeout,
+              created_at=now)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+class JobWorker(object):
+
+    def __init__(self, app, name=None, clock=datetime.datetime.utcnow):
+        self.app = app
+        self.name = name or LeaderElection.process_id()
+        self.clock = clock
+        self.visibility_timeout = datetime.timedelta(seconds=app.config['JOB_VISIBILITY_TIMEOUT_SEC'])
+        self.retry_delay = app.config['JOB_RETRY_DELAY_SEC']
+        self.poll_interval = app.config['JOB_POLL_INTERVAL_SEC']
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _visibility_timeout(self, job):
+        if job.visibility_timeout_sec is None:
+            return self.visibility_timeout
+        return datetime.timedelta(seconds=job.visibility_timeout_sec)
+
+    def _claimable(self, now):
+        return or_(and_(Job.status == Job.QUEUED, Job.run_at <= now),
+                   and_(Job.status == Job.RUNNING, Job.locked_until < now))
+
+    def claim(self):
+        """
+        Claims the most urgent available job, must be called within app context.
+
+        :return: claimed Job or None
+        """
+        now = self.clock()
+        candidates = Job.query.filter(self._claimable(now)).\
+            order_by(Job.priority.desc(), Job.run_at).\
+            with_for_update(skip_locked=True).\
+            limit(10).all()
+        for job in candidates:
+            result = db.session.execute(
+                Job.__table__.update().
+                where(Job.id == job.id).
+                where(self._claimable(now)).
+                values(status=Job.RUNNING, attempts=Job.attempts + 1,
+                       locked_by=self.name, locked_until=now + self._visibility_timeout(job)))
+            if result.rowcount == 1:
+                db.session.commit()
+                db.session.refresh(job)
+                if job.attempts > job.max_attempts:     # its worker died repeatedly
+                    self._finish(job, Job.FAILED, 'Visibility timeout exceeded {} times'.format(job.max_attempts))
+                    continue
+                return job
+        db.session.commit()
+        return None
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.last_error = error
+        job.locked_by = job.locked_until = None
+        job.finished_at = self.clock()
+        db.session.commit()
+
+    def execute(self, job):
+        try:
+            with collect() as stats:
+                tasks[job.name](job.data)
+                db.session.commit()
+            log_stats('job', job.name, stats, job_id=job.id, attempt=job.attempts)
+        except Exception:
+            db.session.rollback()
+            error = traceback.format_exc()
+            logging.exception('Job {} ({}) failed on attempt {}'.format(job.id, job.name, job.attempts))
+            if job.attempts < job.max_attempts:
+                job.status = Job.QUEUED
+                job.last_error = error
+                job.locked_by = job.locked_until = None
+                job.run_at = self.clock() + datetime.timedelta(seconds=self.retry_delay * 2 ** (job.attempts - 1))
+                db.session.commit()
+            else:
+                self._finish(job, Job.FAILED, error)
+        else:
+            self._finish(job, Job.DONE)
+
+    def run_once(self):
+        """
+        Claims and executes one job.
+
+        :return: True if a job was executed
+        """
+        with self.app.app_context():
+            try:
+                job = self.claim()
+                if job is None:
+                    return False
+                self.execute(job)
+                return True
+            finally:
+                db.session.remove()
+
+    def _run_forever(self):
+        while not self._stopped.is_set():
+            try:
+                executed = self.run_once()
+            except Exception:
+                logging.exception('Job worker {} failed to claim a job'.format(self.name))
+                executed = False
+            if not executed:
+                self._stopped.wait(self.poll_interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run_forever, name='job-worker-{}'.format(self.name))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def start_workers(app):
+    base_name = LeaderElection.process_id()
+    return [JobWorker(app, name='{}/{}'.format(base_name, i)).start()
+            for i in range(app.config['JOB_WORKER_THREADS'])]
@@ -0,0 +1,3 @@
+from .registry import Gauge, Counter, Histogram, registry
+from .hooks import init_metrics
+from .views import metrics
@@ -0,0 +1,43 @@
+"""
+Request latency and database pool metrics of the app.
+"""
+import time
+from flask import g, request, current_app
+from .registry import Histogram, Sample, registry
+
+request_duration = Histogram('montracker_request_duration_seconds', 'Latency of HTTP requests by endpoint',
+                             ('endpoint', 'method', 'status'))
+
+POOL_STATES = ('size', 'checkedin', 'checkedout', 'overflow')
+
+
+def init_metrics(app):
+    registry.configure(app.config.get('METRICS_MULTIPROC_DIR'), app.config['METRICS_FLUSH_SEC'])
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        start = getattr(g, 'request_start', None)
+        if start is not None:
+            request_duration.observe(time.perf_counter() - start, endpoint=request.endpoint or 'unknown',
+                                     method=request.method, status=str(response.status_code))
+        return response
+
+
+@registry.add_collector
+def collect_pool():
+    from ..database import db, REPLICA
+    engines = [('primary', db.get_engine(current_app))]
+    if db.replica_enabled(current_app):
+        engines.append((REPLICA, db.get_engine(current_app, bind=REPLICA)))
+    samples = []
+    for name, engine in engines:
+        for state in POOL_STATES:
+            method = getattr(engine.pool, state, None)
+            if callable(method):        # e.g. SQLite pools do not count connections
+                samples.append(Sample('montracker_db_pool_connections', {'database': name, 'state': state},
+                                      method()))
+    return [('montracker_db_pool_connections', 'gauge', 'Connections of database pools by state', samples)]
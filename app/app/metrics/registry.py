@@ -0,0 +1,330 @@
+"""
+Minimal in-process metrics rendered in Prometheus text format.
+
+Metric objects register themselves in the module `registry`. Values computed
+on scrape (e.g. read from the database) are provided by collector functions
+added with `registry.add_collector`.
+
+With `METRICS_MULTIPROC_DIR` set (e.g. under gunicorn), every process writes
+its values to `<dir>/<pid>-<token>.json` (the random token keeps files of exited
+processes apart from processes reusing their pid) at most every
+`METRICS_FLUSH_SEC` after changes, from a background timer and on exit. A scrape
+served by any process merges files of all of them: counters and histograms are
+summed (including values of exited processes, so they never go back), gauges of
+live processes are combined according to their `multiprocess_mode`.
+"""
+import abc
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ['{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+             for k, v in sorted(labels.items())]
+    return '{' + ','.join(pairs) + '}'
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Sample(object):
+
+    def __init__(self, name, labels, value):
+        self.name = name
+        self.labels = labels
+        self.value = value
+
+    def render(self):
+        return '{}{} {}'.format(self.name, _format_labels(self.labels), repr(float(self.value)))
+
+
+class Metric(abc.ABC):
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), register=True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if register:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('{} expects labels {}'.format(self.name, self.labelnames))
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _changed(self):
+        registry.changed()
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    @abc.abstractmethod
+    def merge(self, values, value, pid, live):
+        """Adds `value` of process `pid` to merged `values` of all processes."""
+
+    def samples(self, values=None):
+        values = self.values() if values is None else values
+        return [Sample(self.name, dict(zip(self.labelnames, key)), value) for key, value in sorted(values.items())]
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+    MODES = ('all', 'sum', 'max', 'min')
+
+    def __init__(self, name, documentation, labelnames=(), register=True, multiprocess_mode='all'):
+        """
+        :param multiprocess_mode: how values of processes are combined: `'all'` keeps them apart
+            with `pid` label, `'sum'`, `'max'` and `'min'` aggregate them
+        """
+        if multiprocess_mode not in self.MODES:
+            raise ValueError('Unknown multiprocess mode {}'.format(multiprocess_mode))
+        self.multiprocess_mode = multiprocess_mode
+        Metric.__init__(self, name, documentation, labelnames, register)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+        self._changed()
+
+    def merge(self, values, value, pid, live):
+        if not live:
+            return
+        for key, item in value.items():
+            if self.multiprocess_mode == 'all':
+                values[key + (str(pid),)] = item
+            elif key not in values:
+                values[key] = item
+            else:
+                combine = {'sum': lambda a, b: a + b, 'max': max, 'min': min}[self.multiprocess_mode]
+                values[key] = combine(values[key], item)
+
+    def samples(self, values=None):
+        if values is None or self.multiprocess_mode != 'all':
+            return Metric.samples(self, values)
+        return [Sample(self.name, dict(zip(self.labelnames + ('pid',), key)), value)
+                for key, value in sorted(values.items())]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            key = self._key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+        self._changed()
+
+    def merge(self, values, value, pid, live):
+        for key, item in value.items():
+            values[key] = values.get(key, 0) + item
+
+
+class Histogram(Metric):
+    """
+    Observations counted in cumulative buckets, rendered with `_bucket`, `_sum` and `_count` samples.
+    """
+    type = 'histogram'
+    DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), register=True, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        Metric.__init__(self, name, documentation, labelnames, register)
+
+    def observe(self, value, **labels):
+        with self._lock:
+            key = self._key(labels)
+            # counts of observations per bucket (the last one is +Inf) and their sum
+            counts = self._values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            counts[index] += 1
+            counts[-1] += value
+        self._changed()
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def values(self):
+        with self._lock:
+            return {key: list(counts) for key, counts in self._values.items()}
+
+    def merge(self, values, value, pid, live):
+        for key, counts in value.items():
+            if key in values:
+                values[key] = [a + b for a, b in zip(values[key], counts)]
+            else:
+                values[key] = list(counts)
+
+    def samples(self, values=None):
+        values = self.values() if values is None else values
+        samples = []
+        for key, counts in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                samples.append(Sample(self.name + '_bucket', dict(labels, le=le), cumulative))
+            samples.append(Sample(self.name + '_sum', labels, counts[-1]))
+            samples.append(Sample(self.name + '_count', labels, cumulative))
+        return samples
+
+    def count(self, **labels):
+        return sum(self._values.get(self._key(labels), [0])[:-1])
+
+
+class _Timer(object):
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self.directory = None
+        self.flush_interval = 1.0
+        self._flushed_at = 0.0
+        self._flush_lock = threading.Lock()
+        self._dirty = False
+        self._timer = None
+        self._pid = None
+        self._token = None
+        self._exit_hook = False
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def add_collector(self, collector):
+        """
+        :param collector: callable returning list of (name, type, documentation, samples) tuples
+        """
+        self.collectors.append(collector)
+        return collector
+
+    def configure(self, directory=None, flush_interval=1.0):
+        """Enables multiprocess mode, values are shared through files in `directory`."""
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        if directory and not self._exit_hook:
+            atexit.register(self.flush)
+            self._exit_hook = True
+
+    # multiprocess mode
+    #
+
+    def _file_name(self):
+        if self._pid != os.getpid():      # new process, e.g. forked worker
+            self._pid = os.getpid()
+            self._token = uuid.uuid4().hex[:12]
+            self._timer = None
+        return '{}-{}.json'.format(self._pid, self._token)
+
+    def changed(self):
+        if not self.directory:
+            return
+        self._dirty = True
+        delay = self._flushed_at + self.flush_interval - time.time()
+        if delay <= 0:
+            self.flush()
+            return
+        with self._flush_lock:
+            timer = self._timer if self._pid == os.getpid() else None
+            if timer is None or not timer.is_alive():
+                self._file_name()
+                self._timer = threading.Timer(delay, self._flush_changed)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_changed(self):
+        with self._flush_lock:
+            self._timer = None
+        if self._dirty:
+            self.flush()
+
+    def flush(self):
+        """Writes values of this process to its file, replaced atomically."""
+        if not self.directory:
+            return
+        with self._flush_lock:
+            self._flushed_at = time.time()
+            self._dirty = False
+            data = {metric.name: [[list(key), value] for key, value in metric.values().items()]
+                    for metric in self.metrics}
+            path = os.path.join(self.directory, self._file_name())
+            temporary = path + '.tmp'
+            with open(temporary, 'w') as output:
+                json.dump(data, output)
+            os.replace(temporary, path)
+
+    def _merged_values(self):
+        """
+        :return: dict of merged values of all processes by metric name
+        """
+        self.flush()
+        metrics = {metric.name: metric for metric in self.metrics}
+        merged = {name: {} for name in metrics}
+        for file_name in sorted(os.listdir(self.directory)):
+            if not file_name.endswith('.json'):
+                continue
+            pid = int(file_name[:-len('.json')].split('-')[0])
+            try:
+                with open(os.path.join(self.directory, file_name)) as source:
+                    data = json.load(source)
+            except (OSError, ValueError):
+                continue        # removed or replaced meanwhile
+            live = _process_alive(pid)
+            for name, items in data.items():
+                if name in metrics:
+                    metrics[name].merge(merged[name], {tuple(key): value for key, value in items}, pid, live)
+        return merged
+
+    def collect(self):
+        merged = self._merged_values() if self.directory else {}
+        families = [(m.name, m.type, m.documentation, m.samples(merged.get(m.name) if self.directory else None))
+                    for m in self.metrics]
+        for collector in self.collectors:
+            families.extend(collector())
+        return families
+
+    def render(self):
+        lines = []
+        for name, type_, documentation, samples in self.collect():
+            lines.append('# HELP {} {}'.format(name, documentation))
+            lines.append('# TYPE {} {}'.format(name, type_))
+            lines.extend(sample.render() for sample in samples)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
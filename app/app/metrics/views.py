@@ -0,0 +1,9 @@
+from flask import Blueprint, Response
+from .registry import registry
+
+metrics = Blueprint('metrics', __name__)
+
+
+@metrics.route('/metrics')
+def show_metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,175 @@
+"""
+Cold storage of archived and deleted actions.
+
+Analyses, models, model weights and profiles of actions archived or deleted
+more than `ARCHIVE_AFTER_DAYS` ago are moved to `archived_*` tables with the
+same columns, one action per transaction, so hot tables (and their indexes)
+only hold active operations. The action row itself stays in `actions`, marked
+`cold` with its status frozen in `cold_status_id`, so action lists do not change.
+Opening a cold action (or its analyses, models and profiles), adding analyses to
+it or unarchiving it restores its subtree. Result layers are
+shared by results and stay where they are.
+"""
+import datetime
+import logging
+from flask import current_app
+from sqlalchemy import select, or_
+from ..database import db
+from .models import Action, Analysis, Model, ModelWeight, Profile
+
+# parents first, the order of inserts
+HOT_TABLES = (Analysis.__table__, Model.__table__, Profile.__table__, ModelWeight.__table__)
+# columns looked up on restore
+LOOKUP_COLUMNS = {'analyses': 'action_id', 'models': 'analysis_id', 'profiles': 'analysis_id',
+                  'model_weights': 'model_id'}
+
+
+def _archive_table(table):
+    """Copy of hot table columns without foreign keys, referenced rows may be purged meanwhile."""
+    columns = [db.Column(column.name, column.type.copy(), primary_key=column.primary_key, nullable=column.nullable,
+                         autoincrement=False, index=column.name == LOOKUP_COLUMNS[table.name])
+               for column in table.columns]
+    return db.Table('archived_' + table.name, db.metadata, *columns)
+
+
+ARCHIVE_TABLES = tuple(_archive_table(table) for table in HOT_TABLES)
+
+
+def subtree(tables, action_ids=None, analysis_ids=None):
+    """
+    Conditions selecting rows of analyses of given actions (or given analyses) with their
+    models, profiles and weights in `HOT_TABLES` or `ARCHIVE_TABLES`, parents first.
+    """
+    analyses, models, profiles, weights = tables
+    if action_ids is not None:
+        condition = analyses.c.action_id.in_(action_ids)
+    else:
+        condition = analyses.c.id.in_(analysis_ids)
+    analysis_ids = select([analyses.c.id]).where(condition)
+    model_ids = select([models.c.id]).where(models.c.analysis_id.in_(analysis_ids))
+    return [(analyses, condition),
+            (models, models.c.analysis_id.in_(analysis_ids)),
+            (profiles, profiles.c.analysis_id.in_(analysis_ids)),
+            (weights, weights.c.model_id.in_(model_ids))]
+
+
+def _move(session, action_id, source, target):
+    """
+    Copies action subtree from `source` to `target` tables with INSERT ... SELECT, then deletes
+    it from `source`, children first. Transaction is left to the caller.
+    """
+    copied = subtree(source, action_ids=[action_id])
+    for (table, condition), target_table in zip(copied, target):
+        names = [column.name for column in table.columns]
+        session.execute(target_table.insert().from_select(names, select([table.c[name] for name in names]).
+                                                            where(condition)))
+    for table, condition in reversed(copied):
+        session.execute(table.delete().where(condition))
+
+
+def _mark(session, action, cold, status_id):
+    """Sets cold flag keeping `updated_at`: moving data is not a change of the action, nor resets its purge age."""
+    table = Action.__table__
+    session.execute(table.update().where(table.c.id == action.id).
+                    values(cold=cold, cold_status_id=status_id, updated_at=table.c.updated_at))
+    session.expire(action)
+
+
+def archive_action(session, action):
+    status_id = action.action_status_id
+    _move(session, action.id, HOT_TABLES, ARCHIVE_TABLES)
+    _mark(session, action, True, status_id)
+
+
+def restore_action(session, action):
+    _move(session, action.id, ARCHIVE_TABLES, HOT_TABLES)
+    _mark(session, action, False, None)
+
+
+def archivable(older_than):
+    return Action.query.\
+        filter(Action.cold == False, or_(Action.archived == True, Action.deleted == True),
+               Action.updated_at < older_than).\
+        order_by(Action.updated_at)
+
+
+def archive_actions(batch_size=None, older_than=None):
+    """
+    Moves subtrees of at most `batch_size` actions archived or deleted before `older_than`
+    to archive tables, committing after every action.
+
+    :return: ids of archived actions
+    """
+    config = current_app.config
+    batch_size = batch_size or config['ARCHIVE_BATCH_SIZE']
+    if older_than is None:
+        older_than = datetime.datetime.now() - datetime.timedelta(days=config['ARCHIVE_AFTER_DAYS'])
+    action_ids = [row.id for row in archivable(older_than).with_entities(Action.id).limit(batch_size)]
+
+    archived = []
+    for action_id in action_ids:
+        # locked and checked again, action may be unarchived since selected
+        action = archivable(older_than).filter(Action.id == action_id).with_for_update().first()
+        if action is not None:
+            archive_action(db.session, action)
+            archived.append(action_id)
+        db.session.commit()
+    if archived:
+        logging.info('Moved {} actions to archive tables'.format(len(archived)))
+    return archived
+
+
+def ensure_hot(action):
+    """
+    Restores subtree of a cold action read by a view and commits it; reads of the rest
+    of the request go to the primary, a replica may not have the restored rows yet.
+    The action is locked and checked again, concurrent requests may have restored it meanwhile.
+    An action read from a replica is checked on the primary first, the replica may lag behind it.
+    """
+    if action is None:
+        return action
+    if db.reads_replica():
+        actions = Action.__table__
+        cold = db.session.execute(select([actions.c.cold]).where(actions.c.id == action.id),
+                                  bind=db.get_engine(db.get_app())).scalar()
+        if cold != action.cold:
+            db.use_primary()
+            db.session.refresh(action)
+    if not action.cold:
+        return action
+    db.use_primary()
+    db.session.refresh(action, with_for_update=True)
+    if action.cold:
+        restore_action(db.session, action)
+    db.session.commit()
+    return action
+
+
+def archived_action_id(table, row_id):
+    """
+    Id of the cold action owning row of hot analyses, models or profiles `table` moved to archive tables.
+    """
+    analyses = ARCHIVE_TABLES[0]
+    if table is Analysis.__table__:
+        analysis_id = row_id
+    else:
+        archived = ARCHIVE_TABLES[HOT_TABLES.index(table)]
+        analysis_id = select([archived.c.analysis_id]).where(archived.c.id == row_id).as_scalar()
+    return db.session.execute(select([analyses.c.action_id]).where(analyses.c.id == analysis_id)).scalar()
+
+
+def get_hot(model, row_id):
+    """
+    Analysis, model or profile by id; if it was moved to archive tables, its action is restored first.
+    Rows missing on a replica are looked up on the primary, the replica may lag behind it.
+    """
+    obj = model.query.get(row_id) if row_id is not None else None
+    if obj is None and row_id is not None and db.reads_replica():
+        db.use_primary()
+        obj = model.query.get(row_id)
+    if obj is None and row_id is not None:
+        action_id = archived_action_id(model.__table__, row_id)
+        if action_id is not None:
+            ensure_hot(Action.query.get(action_id))
+            obj = model.query.get(row_id)
+    return obj
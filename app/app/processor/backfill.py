@@ -0,0 +1,50 @@
+"""
+Backfill of values derived from effective points of analyses and of stored
+statuses of actions.
+
+Grid cells and IPP - RP distance and bearing are kept up to date on every
+write (see update_derived), statuses of actions by touch; rows written before
+these columns existed are filled by `python manage.py backfill`. Analyses (hot
+and archived) are walked by id in chunks of `batch_size`, each computed at once
+by NumPy and written by one statement in its own short transaction, actions
+likewise by one statement computing their statuses. `updated_at` is left as it
+is, so delta sync clients do not refetch every row.
+"""
+import logging
+from sqlalchemy import select
+from ..database import db
+from .archive import HOT_TABLES, ARCHIVE_TABLES
+from .models import Action, derived_sources, store_statuses, update_derived
+
+
+def backfill(batch_size=1000):
+    """
+    :return: dict of updated row counts by table name
+    """
+    counts = {}
+    for table in (HOT_TABLES[0], ARCHIVE_TABLES[0]):
+        last_id, counts[table.name] = 0, 0
+        while True:
+            rows = db.session.execute(select(derived_sources(table)).where(table.c.id > last_id).
+                                      order_by(table.c.id).limit(batch_size)).fetchall()
+            if not rows:
+                break
+            update_derived(db.session, table, rows)
+            db.session.commit()
+            last_id = rows[-1][0]
+            counts[table.name] += len(rows)
+        logging.info('Backfilled {} rows of {}'.format(counts[table.name], table.name))
+
+    actions = Action.__table__
+    last_id, counts[actions.name] = 0, 0
+    while True:
+        ids = [row[0] for row in db.session.execute(select([actions.c.id]).where(actions.c.id > last_id).
+                                                    order_by(actions.c.id).limit(batch_size))]
+        if not ids:
+            break
+        store_statuses(db.session, ids)
+        db.session.commit()
+        last_id = ids[-1]
+        counts[actions.name] += len(ids)
+    logging.info('Backfilled {} rows of {}'.format(counts[actions.name], actions.name))
+    return counts
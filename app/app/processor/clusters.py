@@ -0,0 +1,229 @@
+"""
+Clusters of action markers (IPPs) for the map.
+
+The world is split into Web Mercator tiles of a zoom level (the tiles of map
+layers) and every tile into `TILE_GRID` x `TILE_GRID` cells. Actions with IPP
+in the same cell form a cluster: its mean position, count of actions, counts by
+action status and, for single actions, their id. A response holds clusters of
+at most `CLUSTER_MAX_TILES` tiles, so its size does not grow with the number of
+actions.
+
+Clusters are computed by NumPy from stored columns (coordinates and
+`effective_status_id`) by one query per request for the tiles not cached yet and
+cached per (zoom, tile) in the process, for up to `CLUSTER_CACHE_TILES` tiles.
+Every request first reads actions changed since the previous one (by the
+`actions.updated_at` index, bumped for changes of nested rows and statuses too,
+by any process) and drops only cached tiles holding them before or after the
+change. Changes are read `DELTA_SYNC_OVERLAP_SEC` back, so rows of transactions
+committing meanwhile are not missed. Tiles computed while others were dropped
+are returned but not cached, as they may predate the change.
+"""
+import collections
+import datetime
+import math
+import threading
+import numpy as np
+from flask import current_app
+from sqlalchemy import func
+from ..database import db
+from ..processor import geo
+from .models import Action, ModelStatus
+
+TILE_GRID = 8
+MAX_LATITUDE = 85.0511287798    # Web Mercator
+
+_cache = collections.OrderedDict()     # (ids of actions, clusters) by (zoom, x, y)
+_lock = threading.Lock()
+# newest `updated_at` read, values of changed actions by id, count of drops of cached tiles
+_changes = {'read_to': None, 'seen': {}, 'sequence': 0}
+
+
+class TooManyTiles(Exception):
+    pass
+
+
+def _x(longitude, tiles):
+    return (np.asarray(longitude, dtype=float) + 180) / 360 * tiles
+
+
+def _y(latitude, tiles):
+    latitude = np.radians(np.clip(np.asarray(latitude, dtype=float), -MAX_LATITUDE, MAX_LATITUDE))
+    return (1 - np.arcsinh(np.tan(latitude)) / math.pi) / 2 * tiles
+
+
+def _tile_range(low, high, tiles):
+    return range(min(int(low), tiles - 1), min(int(high), tiles - 1) + 1)
+
+
+def tiles_in(zoom, west, south, east, north):
+    """
+    :return: (x, y) of tiles intersecting the box
+    """
+    tiles = 2 ** zoom
+    return [(x, y) for x in _tile_range(_x(west, tiles), _x(east, tiles), tiles)
+            for y in _tile_range(_y(north, tiles), _y(south, tiles), tiles)]
+
+
+def tile_box(zoom, x, y):
+    """
+    :return: (west, south, east, north) of the tile
+    """
+    tiles = 2 ** zoom
+
+    def latitude(row):    # points beyond MAX_LATITUDE belong to tiles of the edges
+        if row in (0, tiles):
+            return 90.0 if row == 0 else -90.0
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2.0 * row / tiles))))
+    return x * 360.0 / tiles - 180, latitude(y + 1), (x + 1) * 360.0 / tiles - 180, latitude(y)
+
+
+def aggregate(zoom, ids, latitudes, longitudes, status_ids):
+    """
+    Clusters actions in cells of tiles of the zoom level.
+
+    :return: dict of cluster lists by (x, y) of tiles
+    """
+    if not len(ids):
+        return {}
+    cells = 2 ** zoom * TILE_GRID
+    column = np.clip(np.floor(_x(longitudes, cells)), 0, cells - 1).astype(np.int64)
+    row = np.clip(np.floor(_y(latitudes, cells)), 0, cells - 1).astype(np.int64)
+    keys, first, inverse, counts = np.unique(row * cells + column, return_index=True, return_inverse=True,
+                                             return_counts=True)
+    inverse = inverse.ravel()
+    centers = (np.bincount(inverse, weights=np.asarray(latitudes, dtype=float)) / counts,
+               np.bincount(inverse, weights=np.asarray(longitudes, dtype=float)) / counts)
+    statuses, status_index = np.unique(np.asarray(status_ids, dtype=np.int64), return_inverse=True)
+    by_status = np.zeros((len(keys), len(statuses)), dtype=np.int64)
+    np.add.at(by_status, (inverse, status_index.ravel()), 1)
+    names = {status.id: status.name for status in ModelStatus.query}
+    ids = np.asarray(ids)
+
+    result = {}
+    for index, key in enumerate(keys.tolist()):
+        cluster = {'latitude': float(centers[0][index]), 'longitude': float(centers[1][index]),
+                   'count': int(counts[index]),
+                   'statuses': {names.get(status_id, str(status_id)): count
+                                for status_id, count in zip(statuses.tolist(), by_status[index].tolist()) if count}}
+        if counts[index] == 1:
+            cluster['action_id'] = int(ids[first[index]])
+        tile = (key % cells // TILE_GRID, key // cells // TILE_GRID)
+        result.setdefault(tile, []).append(cluster)
+    return result
+
+
+def tile_of(zoom, latitude, longitude):
+    """
+    :return: (x, y) of the tile of the zoom level containing the point
+    """
+    tiles = 2 ** zoom
+    return (min(int(_x(longitude, tiles)), tiles - 1), min(int(_y(latitude, tiles)), tiles - 1))
+
+
+def _read_changes():
+    """
+    :return: (id, latitude, longitude) of actions changed since the previous call, None on the first one
+    """
+    read_to = _changes['read_to']
+    if read_to is None:
+        read_to = db.session.query(func.max(Action.updated_at)).scalar() or datetime.datetime.min
+    overlap = datetime.timedelta(seconds=current_app.config['DELTA_SYNC_OVERLAP_SEC'])
+    # besides `updated_at` (of coarse resolution on some databases) any clustered value tells a change apart
+    rows = db.session.query(Action.id, Action.ipp_latitude, Action.ipp_longitude, Action.updated_at,
+                            Action.version, Action.deleted, Action.effective_status_id).\
+        filter(Action.updated_at >= read_to - overlap).all()
+    seen = _changes['seen']
+    changed = [row[:3] for row in rows if seen.get(row[0]) != tuple(row[1:])]
+    for row in rows:
+        seen[row[0]] = tuple(row[1:])
+        read_to = max(read_to, row.updated_at)
+    for action_id, values in list(seen.items()):
+        if values[2] < read_to - overlap:
+            del seen[action_id]
+    first, _changes['read_to'] = _changes['read_to'] is None, read_to
+    return None if first else changed
+
+
+def _drop_changed(changed):
+    """Drops cached tiles holding changed actions, at their former (by ids) or new positions."""
+    ids = {action_id for action_id, _, _ in changed}
+    for key, (tile_ids, _) in list(_cache.items()):
+        if not ids.isdisjoint(tile_ids):
+            del _cache[key]
+    for zoom in {key[0] for key in _cache}:
+        for _, latitude, longitude in changed:
+            if latitude is not None and longitude is not None:
+                _cache.pop((zoom,) + tile_of(zoom, latitude, longitude), None)
+
+
+def _compute(zoom, tiles):
+    """
+    :return: dict of cluster lists by (x, y) of given tiles, also of empty ones
+    """
+    boxes = [tile_box(zoom, x, y) for x, y in tiles]
+    box = (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+    query = Action.filtered(deleted=False).filter(geo.box_condition(
+        [getattr(Action, name) for name in Action.SPATIAL_COLUMNS['ipp']], *box))
+    # actions written before `effective_status_id` existed until `manage.py backfill`
+    status_id = func.coalesce(Action.effective_status_id, Action.action_status_id)
+    rows = query.with_entities(Action.id, Action.ipp_latitude, Action.ipp_longitude, status_id).all()
+    clusters = aggregate(zoom, *zip(*rows)) if rows else {}
+    ids = {}
+    for action_id, latitude, longitude, _ in rows:
+        ids.setdefault(tile_of(zoom, latitude, longitude), set()).add(action_id)
+    return {tile: (frozenset(ids.get(tile, ())), clusters.get(tile, [])) for tile in tiles}
+
+
+def clusters(zoom, bbox):
+    """
+    :param bbox: (west, south, east, north), west > east if it crosses the antimeridian
+    :return: clusters of actions in tiles of the zoom level intersecting the box
+    :raise TooManyTiles: if the box covers more than `CLUSTER_MAX_TILES` tiles
+    """
+    west, south, east, north = bbox
+    halves = [bbox] if west <= east else [(west, south, 180.0, north), (-180.0, south, east, north)]
+    groups = []
+    for half in halves:
+        seen = {tile for group in groups for tile in group}
+        groups.append([tile for tile in tiles_in(zoom, *half) if tile not in seen])
+    tiles = [tile for group in groups for tile in group]
+    if len(tiles) > current_app.config['CLUSTER_MAX_TILES']:
+        raise TooManyTiles()
+
+    found = {}
+    with _lock:
+        changed = _read_changes()
+        if changed is None:
+            _cache.clear()
+        elif changed:
+            _drop_changed(changed)
+        if changed is None or changed:
+            _changes['sequence'] += 1
+        sequence = _changes['sequence']
+        for x, y in tiles:
+            cached = _cache.get((zoom, x, y))
+            if cached is not None:
+                _cache.move_to_end((zoom, x, y))
+                found[(x, y)] = cached[1]
+    for group in groups:    # halves of a box crossing the antimeridian are fetched separately
+        missing = [tile for tile in group if tile not in found]
+        if not missing:
+            continue
+        computed = _compute(zoom, missing)
+        found.update((tile, tile_clusters) for tile, (_, tile_clusters) in computed.items())
+        with _lock:
+            if _changes['sequence'] != sequence:    # dropped meanwhile, the tiles may be stale
+                continue
+            for (x, y), cached in computed.items():
+                _cache[(zoom, x, y)] = cached
+            while len(_cache) > current_app.config['CLUSTER_CACHE_TILES']:
+                _cache.popitem(last=False)
+    return [cluster for tile in tiles for cluster in found[tile]]
+
+
+def invalidate():
+    with _lock:
+        _cache.clear()
+        _changes['read_to'] = None
+        _changes['seen'].clear()
+        _changes['sequence'] += 1
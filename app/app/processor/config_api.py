@@ -1,6 +1,7 @@
 # coding: utf-8
 from flask_restful import Resource, marshal, fields
 from flask import current_app
+from app.database import read_replica
 from app.processor.models import ActionStatus, PersonType, ModelType
 from app.processor.models import ModelStatus
 
@@ -179,7 +180,8 @@ error_labels = {
     "error_validation_failed": "Wysłane dane są niepoprawne.",
     "error_server_not_available": "Nie udało się nawiązać połączenia z serwerem obliczeniowym.",
     "error_analysis_data_incomplete": "Analiza nie posiada wystarczającej ilości danych.",
-    "error_request_resource_unavailable": "Nie można wykonać operacji."
+    "error_request_resource_unavailable": "Nie można wykonać operacji.",
+    "error_unauthorized": "Brak uprawnień do wykonania operacji."
 }
 
 config_fields = {
@@ -230,6 +232,7 @@ translation_labels = [TranslationLabel(tag=key, label=value) for key, value in l
 
 class ConfigApi(Resource):
 
+    @read_replica
     def get(self):
         possible_statuses = ['error', 'draft', 'processing', 'waiting', 'finished']
         model_statuses = ModelStatus.query.filter(ModelStatus.name.in_(possible_statuses))
@@ -1,8 +1,11 @@
 # coding: utf-8
+import functools
 import json
 from urllib import request, error
 from socket import timeout
 from flask import current_app
+from ..metrics import Counter, Histogram
+from ..timing import timed
 
 
 WAITING = 'waiting'
@@ -22,10 +25,30 @@ STATUSES = {
 }
 
 
+request_duration = Histogram('montracker_cs_request_duration_seconds',
+                             'Latency of Calculation Server requests by operation', ('operation',))
+request_errors = Counter('montracker_cs_errors_total', 'Failed Calculation Server requests by operation',
+                         ('operation',))
+
+
 class ServerException(Exception):
     pass
 
 
+def _instrumented(operation):
+    def decorator(function):
+        @functools.wraps(function)
+        def decorated(*args, **kwargs):
+            try:
+                with request_duration.time(operation=operation), timed('cs'):
+                    return function(*args, **kwargs)
+            except (ServerException, ValueError):
+                request_errors.inc(operation=operation)
+                raise
+        return decorated
+    return decorator
+
+
 def _execute(req):
     try:
         return request.urlopen(req, timeout=current_app.config['MONTRACKER_SERVER_TIMEOUT']).read().decode('utf8')
@@ -44,6 +67,9 @@ def _get_or_delete(id, method='GET'):
 
 
 def post(data, url_suffix):
+    callback_url = current_app.config.get('MONTRACKER_CALLBACK_URL')
+    if callback_url:
+        data = dict(data, callback_url=callback_url)
     json_data = json.dumps(data).encode('utf8')
     address = "{address}/{api_version}/{analysis_type}".format(
         address=current_app.config['MONTRACKER_SERVER_ADDR'],
@@ -53,14 +79,17 @@ def post(data, url_suffix):
     return json.loads(_execute(req))
 
 
+@_instrumented('delete')
 def delete(id):
     return _get_or_delete(id, 'DELETE')
 
 
+@_instrumented('get_layers')
 def get_layers(id=''):
     return json.loads(_get_or_delete(id))
 
 
+@_instrumented('compute_simple')
 def compute_simple(ipp_longitude, ipp_latitude, rp_longitude, rp_latitude, profiles, models):
     """
     Sends to Calculation Server request for simple models calculation
@@ -90,6 +119,7 @@ def compute_simple(ipp_longitude, ipp_latitude, rp_longitude, rp_latitude, profi
     return post(data, 'analysis')
 
 
+@_instrumented('compute_complex')
 def compute_complex(model_weights, complex_models):
     """
     Sends to Calculation Server request for complex models calculation.
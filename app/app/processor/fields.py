@@ -66,8 +66,8 @@ class ModelTypeField(fields.Integer):
         'invalid_id': 'Model type id not present in model types options.',
     }
 
-    def _validated(self, value):
-        value = super(ModelTypeField, self)._validated(value)
+    def _deserialize(self, value, attr, data):
+        value = super(ModelTypeField, self)._deserialize(value, attr, data)
         model_type = ModelType.valid().filter(ModelType.id == value).first()
         if model_type is None:
             self.fail('invalid_id')
@@ -80,8 +80,8 @@ class PersonTypeField(fields.Integer):
         'invalid_id': 'Person type id not present in person types options.'
     }
 
-    def _validated(self, value):
-        value = super(PersonTypeField, self)._validated(value)
+    def _deserialize(self, value, attr, data):
+        value = super(PersonTypeField, self)._deserialize(value, attr, data)
         person_type = PersonType.valid().filter(PersonType.id == value).first()
         if person_type is None:
             self.fail('invalid_id')
@@ -101,3 +101,36 @@ class IntegerListField(fields.String):
             raise ValidationError(self.default_error_messages.get('invalid'))
         return result
 
+
+class PointField(fields.String):
+    """`latitude,longitude` deserialized to a tuple of floats."""
+
+    default_error_messages = {
+        'invalid': 'Not a valid latitude,longitude point.'
+    }
+
+    def _deserialize(self, value, attr, data):
+        try:
+            latitude, longitude = [float(i) for i in value.split(',')]
+        except (ValueError, TypeError, AttributeError):
+            raise ValidationError(self.default_error_messages.get('invalid'))
+        if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+            raise ValidationError(self.default_error_messages.get('invalid'))
+        return latitude, longitude
+
+
+class BoundingBoxField(fields.String):
+    """`west,south,east,north` deserialized to a tuple of floats, west > east crosses the antimeridian."""
+
+    default_error_messages = {
+        'invalid': 'Not a valid west,south,east,north bounding box.'
+    }
+
+    def _deserialize(self, value, attr, data):
+        try:
+            west, south, east, north = [float(i) for i in value.split(',')]
+        except (ValueError, TypeError, AttributeError):
+            raise ValidationError(self.default_error_messages.get('invalid'))
+        if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90):
+            raise ValidationError(self.default_error_messages.get('invalid'))
+        return west, south, east, north
@@ -0,0 +1,168 @@
+"""
+Spatial search over IPP and RP coordinates of actions and analyses.
+
+Every point is assigned to a cell of a `CELL_DEG` degree grid, stored in an
+indexed integer column next to its coordinates. Searches near a point (within
+`radius_km`) or inside a bounding box select candidates in SQL: with PostGIS
+installed by `ST_DWithin` (served by its GiST expression indexes), otherwise by
+cell ids and coordinate ranges. Candidates of a radius search are fetched in one
+query with their coordinates, those outside of the radius are dropped by the
+exact haversine distance computed by NumPy for all of them at once.
+"""
+import math
+import numpy as np
+from sqlalchemy import and_, or_, func, text
+from sqlalchemy.exc import SQLAlchemyError
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+CELL_DEG = 0.1
+GRID_COLUMNS = int(round(360 / CELL_DEG))
+MAX_CELLS = 1000     # larger areas are searched by coordinate ranges only
+
+_postgis = {}
+
+
+def cell(latitude, longitude):
+    """Id of the grid cell of a point, None for incomplete points."""
+    if latitude is None or longitude is None:
+        return None
+    return int((latitude + 90) / CELL_DEG) * GRID_COLUMNS + int((longitude + 180) / CELL_DEG)
+
+
+def cells(latitudes, longitudes):
+    """Ids of grid cells of arrays of points, None for incomplete points."""
+    latitudes, longitudes = np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float)
+    ids = np.floor((latitudes + 90) / CELL_DEG) * GRID_COLUMNS + np.floor((longitudes + 180) / CELL_DEG)
+    return [None if np.isnan(i) else int(i) for i in ids.tolist()]
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Distances from a point (or from each of arrays of points) to arrays of points, in km."""
+    lat1, lon1 = np.radians(np.asarray(latitude, dtype=float)), np.radians(np.asarray(longitude, dtype=float))
+    lat2, lon2 = np.radians(np.asarray(latitudes, dtype=float)), np.radians(np.asarray(longitudes, dtype=float))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def bearing_deg(latitudes1, longitudes1, latitudes2, longitudes2):
+    """Initial bearings from first to second points of arrays, in degrees clockwise from north."""
+    lat1, lon1 = np.radians(np.asarray(latitudes1, dtype=float)), np.radians(np.asarray(longitudes1, dtype=float))
+    lat2, lon2 = np.radians(np.asarray(latitudes2, dtype=float)), np.radians(np.asarray(longitudes2, dtype=float))
+    y = np.sin(lon2 - lon1) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def ipp_rp(ipp_latitudes, ipp_longitudes, rp_latitudes, rp_longitudes):
+    """
+    :return: lists of distances (km) and bearings from IPPs to RPs, None for incomplete pairs
+    """
+    distances = haversine_km(ipp_latitudes, ipp_longitudes, rp_latitudes, rp_longitudes)
+    bearings = bearing_deg(ipp_latitudes, ipp_longitudes, rp_latitudes, rp_longitudes)
+    return ([None if np.isnan(value) else value for value in np.atleast_1d(distances).tolist()],
+            [None if np.isnan(value) else value for value in np.atleast_1d(bearings).tolist()])
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    :return: (west, south, east, north) box containing the circle, west > east if it crosses the antimeridian
+    """
+    delta_lat = radius_km / KM_PER_DEGREE
+    south, north = max(latitude - delta_lat, -90.0), min(latitude + delta_lat, 90.0)
+    if south == -90.0 or north == 90.0:
+        return -180.0, south, 180.0, north
+    delta_lon = math.degrees(math.asin(min(math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude)),
+                                           1.0)))
+    if delta_lon >= 180:
+        return -180.0, south, 180.0, north
+    west, east = longitude - delta_lon, longitude + delta_lon
+    return (west + 360 if west < -180 else west), south, (east - 360 if east > 180 else east), north
+
+
+def _longitude_ranges(west, east):
+    return [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+
+
+def cells_in(west, south, east, north):
+    """
+    :return: ids of cells intersecting the box, None if there are more than `MAX_CELLS`
+    """
+    rows = range(int((south + 90) / CELL_DEG), int((north + 90) / CELL_DEG) + 1)
+    columns = [column for low, high in _longitude_ranges(west, east)
+               for column in range(int((low + 180) / CELL_DEG), int((high + 180) / CELL_DEG) + 1)]
+    if len(rows) * len(columns) > MAX_CELLS:
+        return None
+    return [row * GRID_COLUMNS + column for row in rows for column in columns]
+
+
+def has_postgis(session):
+    bind = session.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return False
+    key = str(bind.url)
+    if key not in _postgis:
+        try:
+            _postgis[key] = bool(session.execute(text(
+                "SELECT 1 FROM pg_extension WHERE extname = 'postgis'")).scalar())
+        except SQLAlchemyError:
+            _postgis[key] = False
+    return _postgis[key]
+
+
+def geography(latitude, longitude):
+    return func.geography(func.ST_MakePoint(longitude, latitude))
+
+
+def box_condition(columns, west, south, east, north):
+    """
+    :param columns: latitude, longitude and cell columns of the searched point
+    """
+    latitude, longitude, cell_column = columns
+    condition = and_(latitude >= south, latitude <= north,
+                     or_(*[and_(longitude >= low, longitude <= high) for low, high in _longitude_ranges(west, east)]))
+    cells = cells_in(west, south, east, north)
+    return and_(cell_column.in_(cells), condition) if cells is not None else condition
+
+
+def near_condition(session, columns, latitude, longitude, radius_km):
+    """Candidates near a point: a superset of points within `radius_km`, to be refined by `within_radius`."""
+    if has_postgis(session):
+        return func.ST_DWithin(geography(columns[0], columns[1]), geography(latitude, longitude), radius_km * 1000)
+    return box_condition(columns, *bounding_box(latitude, longitude, radius_km))
+
+
+def within_radius(rows, latitude, longitude, radius_km):
+    """
+    Refines candidates of a radius search.
+
+    :param rows: (item, latitude, longitude) tuples of candidates, e.g. of `with_coordinates` query
+    :return: list of (item, distance in km) of items within `radius_km`, in order of `rows`
+    """
+    if not rows:
+        return []
+    items, latitudes, longitudes = zip(*rows)
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    return [(item, distance) for item, distance, inside in zip(items, distances.tolist(),
+                                                                (distances <= radius_km).tolist()) if inside]
+
+
+def with_coordinates(query, model, point='ipp'):
+    """Adds the searched coordinates to rows of `query`, as `within_radius` expects them."""
+    return query.add_columns(*[getattr(model, name) for name in model.SPATIAL_COLUMNS[point][:2]])
+
+
+def filter_spatial(query, model, near=None, radius_km=None, bbox=None, point='ipp'):
+    """
+    Filters query of actions or analyses by position of their IPP or RP. Items near a point are
+    only selected as candidates, the caller drops those outside of the radius by `within_radius`.
+
+    :param near: (latitude, longitude) of the searched point, `radius_km` around it
+    :param bbox: (west, south, east, north)
+    """
+    columns = [getattr(model, name) for name in model.SPATIAL_COLUMNS[point]]
+    if bbox is not None:
+        query = query.filter(box_condition(columns, *bbox))
+    if near is not None:
+        query = query.filter(near_condition(query.session, columns, near[0], near[1], radius_km))
+    return query
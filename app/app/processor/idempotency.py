@@ -0,0 +1,127 @@
+"""
+Idempotent POST requests.
+
+A POST request sent with `Idempotency-Key: <unique key>` header is executed
+once: its response is stored and returned (with `Idempotent-Replayed: true`
+header) to retries with the same key, path and body, e.g. of double clicks or
+of clients retrying over flaky connections. A retry arriving while the first
+request is still running gets `409`, reusing a key with another body `422`. A
+request running longer than `IDEMPOTENCY_LEASE_SEC` (e.g. of a killed worker)
+loses its claim: a retry takes the key over and runs, the response of the
+former request is not stored then. Claims are told apart by a random token.
+Failed requests (errors raised by the view) are not stored, so they can be
+retried, unless the view committed before failing: its work is done then, so
+the error response is stored and replayed instead. Keys expire after `IDEMPOTENCY_KEY_TTL_SEC` and are removed by the
+purge job.
+"""
+import datetime
+import functools
+import hashlib
+import json
+import uuid
+from flask import request, current_app
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+from ..database import db
+from ..helpers import validation_failed, request_in_progress, idempotency_key_reused
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def expired_before():
+    return datetime.datetime.now() - datetime.timedelta(seconds=current_app.config['IDEMPOTENCY_KEY_TTL_SEC'])
+
+
+def lease_expired_before():
+    return datetime.datetime.now() - datetime.timedelta(seconds=current_app.config['IDEMPOTENCY_LEASE_SEC'])
+
+
+def _claim(key, path, request_hash, token):
+    """
+    :return: stored key of a finished request to replay, or None once the key was claimed for this request
+    """
+    stored = IdempotencyKey.query.filter_by(key=key, path=path).first()
+    if stored is not None and stored.created_at < expired_before():
+        db.session.delete(stored)
+        db.session.flush()
+        stored = None
+    if stored is None:
+        db.session.add(IdempotencyKey(key=key, path=path, request_hash=request_hash,
+                                      claimed_at=datetime.datetime.now(), claim_token=token))
+        try:
+            db.session.commit()
+        except IntegrityError:      # claimed concurrently by the same request
+            db.session.rollback()
+            request_in_progress()
+        return None
+    if stored.status_code is None and stored.claimed_at >= lease_expired_before():
+        request_in_progress()
+    if stored.request_hash != request_hash:
+        idempotency_key_reused()
+    if stored.status_code is None:     # lease of the former request expired, take the key over
+        keys = IdempotencyKey.__table__
+        taken = db.session.execute(keys.update().where(
+            (keys.c.id == stored.id) & keys.c.status_code.is_(None) & (keys.c.claim_token == stored.claim_token)
+        ).values(claimed_at=datetime.datetime.now(), claim_token=token))
+        if taken.rowcount != 1:     # taken over concurrently or finished meanwhile
+            db.session.rollback()
+            request_in_progress()
+        db.session.commit()
+        return None
+    return stored
+
+
+def _error_response(error):
+    """Status code and data of the response to an error raised by a view, as returned by the api."""
+    if isinstance(error, HTTPException):
+        return error.code, getattr(error, 'data', None) or {'message': error.description}
+    return 500, {'message': 'Internal Server Error'}
+
+
+def idempotent(method):
+    """
+    Makes POST method of a resource (returning data and status code) idempotent with `Idempotency-Key` header.
+    """
+    @functools.wraps(method)
+    def decorated(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return method(*args, **kwargs)
+        if len(key) > IdempotencyKey.key.type.length:
+            validation_failed({HEADER: ['Longer than maximum length {}.'.format(IdempotencyKey.key.type.length)]})
+        path = request.path[:IdempotencyKey.path.type.length]
+        token = uuid.uuid4().hex
+        stored = _claim(key, path, hashlib.sha256(request.get_data()).hexdigest(), token)
+        if stored is not None:
+            return json.loads(stored.response), stored.status_code, {REPLAYED_HEADER: 'true'}
+        keys = IdempotencyKey.__table__
+        # the claim only while this request holds it, not after it was taken over
+        claimed = (keys.c.key == key) & (keys.c.path == path) & (keys.c.claim_token == token)
+        committed = []
+        session = db.session()
+
+        def on_commit(session):
+            committed.append(True)
+
+        event.listen(session, 'after_commit', on_commit)
+        try:
+            data, status_code = method(*args, **kwargs)
+        except Exception as error:
+            event.remove(session, 'after_commit', on_commit)
+            db.session.rollback()
+            if committed:   # the work is done, a retry must get the error instead of doing it again
+                status_code, data = _error_response(error)
+                db.session.execute(keys.update().where(claimed).values(status_code=status_code,
+                                                                       response=json.dumps(data)))
+            else:
+                db.session.execute(keys.delete().where(claimed))
+            db.session.commit()
+            raise
+        event.remove(session, 'after_commit', on_commit)
+        db.session.execute(keys.update().where(claimed).values(status_code=status_code, response=json.dumps(data)))
+        db.session.commit()
+        return data, status_code
+    return decorated
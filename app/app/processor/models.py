@@ -1,12 +1,20 @@
+import collections
+import datetime
+import itertools
+import json
 import logging
 from flask import current_app
-from sqlalchemy import String, Integer, Text, Boolean, Float, DateTime, CHAR, func, select, case, true, false
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event, inspect, text, String, Integer, Text, Boolean, Float, DateTime, CHAR, func, select, case, true, false, \
+    bindparam
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
-from sqlalchemy.orm import column_property
-from sqlalchemy.sql.elements import and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql.elements import and_, or_
 from ..helpers import AnalysisDataIncomplete
-from ..processor import cs_utils
-from ..database import db
+from ..processor import cs_utils, geo
+from ..database import db, upsert, clock_timestamp
 
 
 class IdentityMixin(object):
@@ -87,6 +95,20 @@ class ModelStatus(IdentityMixin, db.Model):
     def draft_id(cls):
         return cls.by_name(cls.DRAFT).id
 
+    _ids = {}   # ids by name, statuses are fixed rows (see setup_db)
+
+    @classmethod
+    def id_of(cls, name):
+        """Id of the status as a scalar subquery, for SQL expressions built without querying statuses."""
+        return select([cls.id]).where(cls.name == name).as_scalar()
+
+    @classmethod
+    def cached_id(cls, name):
+        """Id of the status, all ids are read by one query on first use and cached."""
+        if name not in cls._ids:
+            cls._ids.update(db.session.query(cls.name, cls.id))
+        return cls._ids[name]
+
     @classmethod
     def names(cls):
         return [cls.DRAFT, cls.WAITING, cls.PROCESSING, cls.ERROR, cls.FINISHED]
@@ -95,9 +117,25 @@ class ModelStatus(IdentityMixin, db.Model):
     def unfinished_names(cls):
         return [cls.WAITING, cls.PROCESSING]
 
+    @classmethod
+    def final_names(cls):
+        return [cls.ERROR, cls.FINISHED]
+
 
 class Action(IdentityMixin, db.Model):
     __tablename__ = 'actions'
+    __table_args__ = (
+        # list: not deleted, newest first, optionally by archived flag
+        db.Index('ix_actions_live_creation_time', 'creation_time', postgresql_where=text('deleted = false')),
+        db.Index('ix_actions_live_archived', 'archived', 'creation_time', postgresql_where=text('deleted = false')),
+        # spatial search, see geo
+        db.Index('ix_actions_live_ipp_cell', 'ipp_cell', postgresql_where=text('deleted = false')),
+        db.Index('ix_actions_live_rp_cell', 'rp_cell', postgresql_where=text('deleted = false')),
+    )
+
+    # latitude, longitude and grid cell columns of IPP and RP for spatial search
+    SPATIAL_COLUMNS = {'ipp': ('ipp_latitude', 'ipp_longitude', 'ipp_cell'),
+                       'rp': ('rp_latitude', 'rp_longitude', 'rp_cell')}
 
     # columns
     #
@@ -114,6 +152,18 @@ class Action(IdentityMixin, db.Model):
     creation_time = db.Column(DateTime, nullable=False, default=func.now())
     _deleted = db.Column('deleted', Boolean, nullable=False, default=False)
     archived = db.Column(Boolean, nullable=False, default=False)
+    updated_at = db.Column(DateTime, nullable=False, default=clock_timestamp(), onupdate=clock_timestamp(),
+                           index=True)
+    cold = db.Column(Boolean, nullable=False, default=False, server_default=false())   # subtree in archive tables
+    cold_status_id = db.Column(Integer, db.ForeignKey('model_statuses.id'), nullable=True)     # status when archived
+    # `action_status_id` stored for map clusters, kept by touch
+    effective_status_id = db.Column(Integer, db.ForeignKey('model_statuses.id'), nullable=True,
+                                    default=ModelStatus.id_of(ModelStatus.DRAFT))
+    ipp_cell = db.Column(Integer, nullable=True)       # grid cells of IPP and RP, kept by set_cells
+    rp_cell = db.Column(Integer, nullable=True)
+    version = db.Column(Integer, nullable=False, default=1, server_default='1')    # optimistic locking of updates
+
+    __mapper_args__ = {'version_id_col': version}
 
     # relationships
     #
@@ -127,8 +177,10 @@ class Action(IdentityMixin, db.Model):
 
     @classmethod
     def filtered(cls, deleted=False, statuses=None, archived=None, name_search=None,
-                 created_from=None, created_to=None, lost_from=None, lost_to=None):
+                 created_from=None, created_to=None, lost_from=None, lost_to=None, updated_since=None):
         res = cls.query
+        if updated_since is not None:
+            res = res.filter(cls.updated_at >= updated_since)
         if deleted is not None:
             res = res.filter(cls.deleted == True) if deleted else res.filter(cls.deleted == False)
         if statuses:
@@ -147,6 +199,34 @@ class Action(IdentityMixin, db.Model):
             res = res.filter(cls.lost_time <= lost_to)
         return res
 
+    def preload_analyses(self):
+        """
+        Loads analyses with their models and profiles (see `Analysis.preload_models`), dumped by `analysis_list`.
+        """
+        self._preloaded_analyses = Analysis.preload_profiles(Analysis.preload_models(self.analyses))
+        return self
+
+    @classmethod
+    def preload_statuses(cls, actions):
+        """
+        Computes `action_status_id` of all given actions in one query, so that dumping a page of actions
+        does not compute statuses action by action.
+        """
+        actions = list(actions)
+        if not actions:
+            return actions
+        statuses = dict(db.session.query(cls.id, cls.action_status_id).filter(cls.id.in_([a.id for a in actions])))
+        for action in actions:
+            action._preloaded_status_id = statuses.get(action.id)
+        return actions
+
+    def analysis_list(self):
+        """
+        Analyses of the action, as preloaded by `preload_analyses` if it was called.
+        """
+        preloaded = self.__dict__.get('_preloaded_analyses')
+        return list(preloaded) if preloaded is not None else self.analyses.all()
+
     # properties
     #
 
@@ -179,34 +259,24 @@ class Action(IdentityMixin, db.Model):
 
     @hybrid_property
     def action_status_id(self):
-        error_status_id = ModelStatus.by_name(ModelStatus.ERROR).id
-        waiting_status_id = ModelStatus.by_name(ModelStatus.WAITING).id
-        finished_status_id = ModelStatus.by_name(ModelStatus.FINISHED).id
-        draft_status_id = ModelStatus.by_name(ModelStatus.DRAFT).id
-        processing_status_id = ModelStatus.by_name(ModelStatus.PROCESSING).id
-
-        if self.analyses_count == 0:
-            return draft_status_id
-        elif self.analyses.filter_by(analysis_status_id=error_status_id).count():
-            return error_status_id
-        elif self.analyses.filter_by(analysis_status_id=waiting_status_id).count():
-            return waiting_status_id
-        elif self.analyses.filter_by(analysis_status_id=processing_status_id).count():
-            return processing_status_id
-        elif self.analyses.filter_by(analysis_status_id=finished_status_id).count():
-            return finished_status_id
-        elif self.analyses.filter_by(analysis_status_id=draft_status_id).count() == self.analyses_count:
-            return draft_status_id
-        else:
-            return processing_status_id
+        """
+        Status of the cold action as archived, or as preloaded by `preload_statuses`, otherwise computed
+        from analyses by the SQL expression in a single query.
+        """
+        if self.cold:
+            return self.cold_status_id
+        preloaded = self.__dict__.get('_preloaded_status_id')
+        if preloaded is not None:
+            return preloaded
+        return db.session.query(Action.action_status_id).filter(Action.id == self.id).scalar()
 
     @action_status_id.expression
-    def analysis_status_id(cls):
-        error_status_id = ModelStatus.by_name(ModelStatus.ERROR).id
-        waiting_status_id = ModelStatus.by_name(ModelStatus.WAITING).id
-        finished_status_id = ModelStatus.by_name(ModelStatus.FINISHED).id
-        draft_status_id = ModelStatus.by_name(ModelStatus.DRAFT).id
-        processing_status_id = ModelStatus.by_name(ModelStatus.PROCESSING).id
+    def action_status_id(cls):
+        error_status_id = ModelStatus.id_of(ModelStatus.ERROR)
+        waiting_status_id = ModelStatus.id_of(ModelStatus.WAITING)
+        finished_status_id = ModelStatus.id_of(ModelStatus.FINISHED)
+        draft_status_id = ModelStatus.id_of(ModelStatus.DRAFT)
+        processing_status_id = ModelStatus.id_of(ModelStatus.PROCESSING)
 
         analyses_count = cls.analyses_count
         draft_count = cls.analyses_by_status_count(draft_status_id)
@@ -216,6 +286,7 @@ class Action(IdentityMixin, db.Model):
         processing_count = cls.analyses_by_status_count(processing_status_id)
 
         return case([
+            (cls.cold == True, cls.cold_status_id),
             (analyses_count == 0, draft_status_id),
             (error_count > 0, error_status_id),
             (waiting_count > 0, waiting_status_id),
@@ -243,11 +314,32 @@ class Action(IdentityMixin, db.Model):
 
 class Analysis(IdentityMixin, db.Model):
     __tablename__ = 'analyses'
+    __table_args__ = (
+        # list and analyses of action: not deleted, newest first
+        db.Index('ix_analyses_live_creation_time', 'creation_time', postgresql_where=text('deleted = false')),
+        db.Index('ix_analyses_live_action', 'action_id', 'creation_time', postgresql_where=text('deleted = false')),
+        # time window and map queries
+        db.Index('ix_analyses_live_effective_lost_time', 'effective_lost_time',
+                 postgresql_where=text('deleted = false')),
+        db.Index('ix_analyses_live_effective_ipp', 'effective_ipp_latitude', 'effective_ipp_longitude',
+                 postgresql_where=text('deleted = false')),
+        db.Index('ix_analyses_live_effective_ipp_cell', 'effective_ipp_cell', postgresql_where=text('deleted = false')),
+        db.Index('ix_analyses_live_effective_rp_cell', 'effective_rp_cell', postgresql_where=text('deleted = false')),
+        # sorting and filtering by IPP - RP geometry
+        db.Index('ix_analyses_live_ipp_rp_distance', 'ipp_rp_distance_km', postgresql_where=text('deleted = false')),
+        db.Index('ix_analyses_live_ipp_rp_bearing', 'ipp_rp_bearing', postgresql_where=text('deleted = false')),
+    )
+
+    SPATIAL_COLUMNS = {'ipp': ('ipp_latitude', 'ipp_longitude', 'effective_ipp_cell'),
+                       'rp': ('rp_latitude', 'rp_longitude', 'effective_rp_cell')}
+
+    # fields inherited from the action unless set on the analysis
+    INHERITED = ('ipp_latitude', 'ipp_longitude', 'rp_latitude', 'rp_longitude', 'lost_time')
 
     # columns
     #
 
-    action_id = db.Column(Integer, db.ForeignKey('actions.id'), nullable=False)
+    action_id = db.Column(Integer, db.ForeignKey('actions.id'), nullable=False, index=True)
     name = db.Column(String(256), nullable=False)
     description = db.Column(Text, nullable=True)
     _ipp_latitude = db.Column("ipp_latitude", Float, nullable=True)
@@ -258,6 +350,22 @@ class Analysis(IdentityMixin, db.Model):
     _lost_time = db.Column("lost_time", DateTime, nullable=True)
     creation_time = db.Column(DateTime, nullable=False, default=func.now())
     deleted = db.Column(Boolean, nullable=False, default=False)
+    updated_at = db.Column(DateTime, nullable=False, default=clock_timestamp(), onupdate=clock_timestamp(),
+                           index=True)
+    version = db.Column(Integer, nullable=False, default=1, server_default='1')    # optimistic locking of updates
+
+    # own values or values of the action, kept up to date on flush (see sync_effective_values)
+    effective_ipp_latitude = db.Column(Float, nullable=True)
+    effective_ipp_longitude = db.Column(Float, nullable=True)
+    effective_rp_latitude = db.Column(Float, nullable=True)
+    effective_rp_longitude = db.Column(Float, nullable=True)
+    effective_lost_time = db.Column(DateTime, nullable=True)
+    effective_ipp_cell = db.Column(Integer, nullable=True)
+    effective_rp_cell = db.Column(Integer, nullable=True)
+    ipp_rp_distance_km = db.Column(Float, nullable=True)    # from effective IPP to RP
+    ipp_rp_bearing = db.Column(Float, nullable=True)        # of RP from IPP, degrees clockwise from north
+
+    __mapper_args__ = {'version_id_col': version}
 
     action = db.relationship('Action', primaryjoin='Action.id==Analysis.action_id')
 
@@ -272,21 +380,95 @@ class Analysis(IdentityMixin, db.Model):
     # queries
     #
 
-    def simple_models(self):
-        return self.models.join(Model.model_type).filter(ModelType.complex == False)
+    def model_list(self):
+        """
+        Models with their types loaded by one query, or as preloaded by `preload_models`.
+        """
+        preloaded = self.__dict__.get('_preloaded_models')
+        return list(preloaded) if preloaded is not None else self.models.all()
+
+    def profile_list(self):
+        """
+        Profiles loaded by one query, or as preloaded by `preload_profiles`.
+        """
+        preloaded = self.__dict__.get('_preloaded_profiles')
+        return list(preloaded) if preloaded is not None else self.profiles.all()
+
+    def simple_models(self, models=None):
+        return [model for model in (models if models is not None else self.model_list()) if not model.complex]
+
+    def complex_models(self, models=None):
+        return [model for model in (models if models is not None else self.model_list()) if model.complex]
+
+    def draft_models(self, models=None):
+        draft_status_id = ModelStatus.draft_id()
+        return [model for model in (models if models is not None else self.model_list())
+                if model.status_id == draft_status_id]
 
-    def complex_models(self):
-        return self.models.join(Model.model_type).filter(ModelType.complex == True)
+    @classmethod
+    def preload_models(cls, analyses):
+        """
+        Loads models of all given analyses, with their types and result layers, in one query
+        (and weights of simple models in another), so that dumping a page of analyses
+        does not query models analysis by analysis.
+        """
+        analyses = list(analyses)
+        if not analyses:
+            return analyses
+        by_analysis = {analysis.id: [] for analysis in analyses}
+        models = Model.query.options(joinedload(Model.result_layers)).\
+            filter(Model.analysis_id.in_(by_analysis.keys())).order_by(Model.id)
+        weights = {}
+        for model in models:
+            by_analysis[model.analysis_id].append(model)
+            weights[model.id] = []
+        for model_weight in ModelWeight.query.filter(ModelWeight.model_id.in_(weights.keys())).order_by(ModelWeight.id):
+            weights[model_weight.model_id].append(model_weight)
+        for models in by_analysis.values():
+            for model in models:
+                model._preloaded_weights = weights[model.id]
+        for analysis in analyses:
+            analysis._preloaded_models = by_analysis[analysis.id]
+        return analyses
+
+    @classmethod
+    def preload_profiles(cls, analyses):
+        """
+        Loads profiles of all given analyses in one query, dumped by `profile_list`.
+        """
+        analyses = list(analyses)
+        if not analyses:
+            return analyses
+        by_analysis = {analysis.id: [] for analysis in analyses}
+        for profile in Profile.query.filter(Profile.analysis_id.in_(by_analysis.keys())).order_by(Profile.id):
+            by_analysis[profile.analysis_id].append(profile)
+        for analysis in analyses:
+            analysis._preloaded_profiles = by_analysis[analysis.id]
+        return analyses
 
-    def draft_models(self):
-        draft_status = ModelStatus.by_name(ModelStatus.DRAFT)
-        return self.models.filter(Model.status_id == draft_status.id)
+    @classmethod
+    def preload(cls, analyses):
+        """
+        Loads everything dumped with a page of analyses: models, profiles and actions (for the action name
+        and archived flag), four queries in total whatever the size of the page.
+        """
+        analyses = cls.preload_profiles(cls.preload_models(analyses))
+        action_ids = {analysis.action_id for analysis in analyses}
+        actions = {action.id: action for action in Action.query.filter(Action.id.in_(action_ids))} \
+            if action_ids else {}
+        for analysis in analyses:
+            set_committed_value(analysis, 'action', actions.get(analysis.action_id))
+        return analyses
 
     @classmethod
     def filtered(cls, deleted=False, statuses=None, name_search=None,
-                 created_from=None, created_to=None, lost_from=None, lost_to=None):
+                 created_from=None, created_to=None, lost_from=None, lost_to=None, archived=False, updated_since=None,
+                 distance_min=None, distance_max=None, bearing_from=None, bearing_to=None):
         res = cls.query
-        res = res.filter(cls.archived == False)
+        if updated_since is not None:
+            res = res.filter(cls.updated_at >= updated_since)
+        if archived is not None:
+            res = res.filter(cls.archived == True) if archived else res.filter(cls.archived == False)
         if deleted is not None:
             res = res.filter(cls.deleted == True) if deleted else res.filter(cls.deleted == False)
         if statuses:
@@ -301,6 +483,17 @@ class Analysis(IdentityMixin, db.Model):
             res = res.filter(cls.lost_time >= lost_from)
         if lost_to is not None:
             res = res.filter(cls.lost_time <= lost_to)
+        if distance_min is not None:
+            res = res.filter(cls.ipp_rp_distance_km >= distance_min)
+        if distance_max is not None:
+            res = res.filter(cls.ipp_rp_distance_km <= distance_max)
+        if bearing_from is not None and bearing_to is not None and bearing_from > bearing_to:   # across north
+            res = res.filter(or_(cls.ipp_rp_bearing >= bearing_from, cls.ipp_rp_bearing <= bearing_to))
+        else:
+            if bearing_from is not None:
+                res = res.filter(cls.ipp_rp_bearing >= bearing_from)
+            if bearing_to is not None:
+                res = res.filter(cls.ipp_rp_bearing <= bearing_to)
         return res
 
     # properties
@@ -339,7 +532,11 @@ class Analysis(IdentityMixin, db.Model):
 
     @hybrid_property
     def ipp_latitude(self):
-        return self._ipp_latitude or self.action.ipp_latitude
+        return self._inherited('ipp_latitude')
+
+    @ipp_latitude.expression
+    def ipp_latitude(cls):
+        return cls.effective_ipp_latitude
 
     @ipp_latitude.setter
     def ipp_latitude(self, ipp_latitude):
@@ -347,7 +544,11 @@ class Analysis(IdentityMixin, db.Model):
 
     @hybrid_property
     def ipp_longitude(self):
-        return self._ipp_longitude or self.action.ipp_longitude
+        return self._inherited('ipp_longitude')
+
+    @ipp_longitude.expression
+    def ipp_longitude(cls):
+        return cls.effective_ipp_longitude
 
     @ipp_longitude.setter
     def ipp_longitude(self, ipp_longitude):
@@ -355,7 +556,11 @@ class Analysis(IdentityMixin, db.Model):
 
     @hybrid_property
     def rp_latitude(self):
-        return self._rp_latitude or self.action.rp_latitude
+        return self._inherited('rp_latitude')
+
+    @rp_latitude.expression
+    def rp_latitude(cls):
+        return cls.effective_rp_latitude
 
     @rp_latitude.setter
     def rp_latitude(self, rp_latitude):
@@ -363,7 +568,11 @@ class Analysis(IdentityMixin, db.Model):
 
     @hybrid_property
     def rp_longitude(self):
-        return self._rp_longitude or self.action.rp_longitude
+        return self._inherited('rp_longitude')
+
+    @rp_longitude.expression
+    def rp_longitude(cls):
+        return cls.effective_rp_longitude
 
     @rp_longitude.setter
     def rp_longitude(self, rp_longitude):
@@ -371,19 +580,46 @@ class Analysis(IdentityMixin, db.Model):
 
     @hybrid_property
     def lost_time(self):
-        return self._lost_time or self.action.lost_time
+        return self._inherited('lost_time')
 
     @lost_time.expression
     def lost_time(cls):
-        return case([
-            (cls._lost_time != None, cls._lost_time.label("lost_time")),
-            (cls.action_id != None, select([Action.lost_time]).where(Action.id == cls.action_id).label('lost_time'))
-        ], else_ = cls._lost_time.label("lost_time"))
+        return cls.effective_lost_time
 
     @lost_time.setter
     def lost_time(self, lost_time):
         self._lost_time = lost_time
 
+    def _inherited(self, name):
+        """
+        Own value, or value of the action: read from the action if it is loaded already (it may have
+        unflushed changes), otherwise from the effective column, without loading the action.
+        """
+        value = getattr(self, '_' + name)
+        if value is not None:
+            return value
+        session = object_session(self)
+        if session is not None and self.action_id is not None:
+            action = session.identity_map.get(inspect(Action).identity_key_from_primary_key((self.action_id,)))
+            if action is not None and name not in inspect(action).unloaded:
+                return getattr(action, name)
+        return getattr(self, 'effective_' + name)
+
+    def sync_effective(self, session):
+        """Sets effective values to own values, or to values of the action where missing."""
+        action = None
+        for name in self.INHERITED:
+            value = getattr(self, '_' + name)
+            if value is None:
+                action = action or (session.query(Action).get(self.action_id) if self.action_id else None)
+                value = getattr(action, name, None)
+            setattr(self, 'effective_' + name, value)
+        self.effective_ipp_cell = geo.cell(self.effective_ipp_latitude, self.effective_ipp_longitude)
+        self.effective_rp_cell = geo.cell(self.effective_rp_latitude, self.effective_rp_longitude)
+        (self.ipp_rp_distance_km,), (self.ipp_rp_bearing,) = geo.ipp_rp(
+            self.effective_ipp_latitude, self.effective_ipp_longitude,
+            self.effective_rp_latitude, self.effective_rp_longitude)
+
     @hybrid_property
     def action_name(self):
         return self.action.name
@@ -393,34 +629,15 @@ class Analysis(IdentityMixin, db.Model):
 
     @hybrid_property
     def analysis_status_id(self):
-        error_status_id = ModelStatus.by_name(ModelStatus.ERROR).id
-        waiting_status_id = ModelStatus.by_name(ModelStatus.WAITING).id
-        finished_status_id = ModelStatus.by_name(ModelStatus.FINISHED).id
-        draft_status_id = ModelStatus.by_name(ModelStatus.DRAFT).id
-        processing_status_id = ModelStatus.by_name(ModelStatus.PROCESSING).id
-
-        if self.model_count == 0:
-            return draft_status_id
-        elif self.models.filter_by(status_id=error_status_id).count():
-            return error_status_id
-        elif self.models.filter_by(status_id=waiting_status_id).count():
-            return waiting_status_id
-        elif self.models.filter_by(status_id=processing_status_id).count():
-            return processing_status_id
-        elif self.models.filter_by(status_id=finished_status_id).count():
-            return finished_status_id
-        elif self.models.filter_by(status_id=draft_status_id).count() == self.model_count:
-            return draft_status_id
-        else:
-            return processing_status_id
+        return ModelStatus.cached_id(self.status_name())
 
     @analysis_status_id.expression
     def analysis_status_id(cls):
-        error_status_id = ModelStatus.by_name(ModelStatus.ERROR).id
-        waiting_status_id = ModelStatus.by_name(ModelStatus.WAITING).id
-        finished_status_id = ModelStatus.by_name(ModelStatus.FINISHED).id
-        draft_status_id = ModelStatus.by_name(ModelStatus.DRAFT).id
-        processing_status_id = ModelStatus.by_name(ModelStatus.PROCESSING).id
+        error_status_id = ModelStatus.id_of(ModelStatus.ERROR)
+        waiting_status_id = ModelStatus.id_of(ModelStatus.WAITING)
+        finished_status_id = ModelStatus.id_of(ModelStatus.FINISHED)
+        draft_status_id = ModelStatus.id_of(ModelStatus.DRAFT)
+        processing_status_id = ModelStatus.id_of(ModelStatus.PROCESSING)
 
         model_count = cls.model_count
         draft_count = cls.model_by_status_count(draft_status_id)
@@ -441,34 +658,55 @@ class Analysis(IdentityMixin, db.Model):
     # api create/update methods
     #
 
-    def update(self, analysis_data, models, profiles):
-        status = ModelStatus.query.get(self.analysis_status_id)
-        if status.name in ModelStatus.unfinished_names():
+    def status_name(self):
+        """
+        Name of `analysis_status_id` status, computed from counts of models by status: from the models
+        preloaded by `preload_models`, otherwise in a single query.
+        """
+        preloaded = self.__dict__.get('_preloaded_models')
+        if preloaded is not None:
+            counts = collections.Counter(model.model_status.name for model in preloaded)
+        else:
+            counts = dict(db.session.query(ModelStatus.name, func.count(Model.id)).
+                          join(Model, Model.status_id == ModelStatus.id).
+                          filter(Model.analysis_id == self.id).
+                          group_by(ModelStatus.name))
+        model_count = sum(counts.values())
+        if model_count == 0:
+            return ModelStatus.DRAFT
+        for name in (ModelStatus.ERROR, ModelStatus.WAITING, ModelStatus.PROCESSING, ModelStatus.FINISHED):
+            if counts.get(name):
+                return name
+        return ModelStatus.DRAFT if counts.get(ModelStatus.DRAFT, 0) >= model_count else ModelStatus.PROCESSING
+
+    def update(self, analysis_data, models=None, profiles=None):
+        """
+        Partial update: models and profiles are replaced only if given.
+        """
+        if self.status_name() in ModelStatus.unfinished_names():
             raise ValueError('Cannot update unfinished analysis')
         if analysis_data:
             for k, v in analysis_data.items():
                 setattr(self, k, v)
-        self.create_or_update_models(models)
-        self.create_or_update_profiles(profiles)
+        if models is not None:
+            self.create_or_update_models(models)
+        if profiles is not None:
+            self.create_or_update_profiles(profiles)
 
     def create_or_update_profiles(self, profiles):
-        if not self.analysis_status_id == ModelStatus.by_name(ModelStatus.DRAFT).id:
-            RuntimeError("can only update models if analysis is a draft")
+        """
+        Replaces profiles of the analysis: profiles missing in `profiles` are deleted with one statement,
+        the others are inserted or get their weight updated with one upsert.
+        """
         profiles_data = {profile['person_type_id']: profile['weight'] for profile in profiles}
-        existing_profiles = {profile.person_type_id: profile for profile in self.profiles}
-
-        for person_type_id, profile in existing_profiles.items():
-            if person_type_id in profiles_data.keys():
-                profile.weight = profiles_data[person_type_id]
-                del profiles_data[person_type_id]
-            else:
-                db.session.delete(profile)
-            db.session.flush()
-
-        for person_type_id, weight in profiles_data.items():
-            profile = Profile(analysis_id=self.id, person_type_id=person_type_id, weight=weight)
-            db.session.add(profile)
-            db.session.flush()
+        table = Profile.__table__
+        db.session.flush()
+        db.session.execute(table.delete().where(and_(table.c.analysis_id == self.id,
+                                                     ~table.c.person_type_id.in_(profiles_data.keys()))))
+        upsert(db.session, table, [{'analysis_id': self.id, 'person_type_id': person_type_id, 'weight': weight}
+                                   for person_type_id, weight in profiles_data.items()],
+               index_elements=('analysis_id', 'person_type_id'), update_columns=('weight',))
+        touch(db.session, analysis_ids=[self.id])
 
     def create_or_update_models(self, models):
         """
@@ -488,19 +726,22 @@ class Analysis(IdentityMixin, db.Model):
 
         :param models: dictionary of model_type_id and weight integers
         """
-        if not self.analysis_status_id == ModelStatus.by_name(ModelStatus.DRAFT).id:
-            RuntimeError("can only update models if analysis is a draft")
         models_data = {model['model_type_id']: model['weight'] for model in models}
         existing_models = {model.model_type_id: model for model in self.models}
 
+        weights = {}
         for model_type_id, model in existing_models.items():
             if model_type_id in models_data.keys():
                 if models_data[model_type_id] is not None:
-                    model.update_weights(models_data[model_type_id])
+                    assert not model.model_type.complex
+                    weights[model.id] = models_data[model_type_id]
                 del models_data[model_type_id]
             else:
                 self._delete_model(model)
-            db.session.flush()
+                db.session.flush()
+        if weights:
+            ModelWeight.update_weights_of(db.session, weights)
+            touch(db.session, analysis_ids=[self.id])
 
         for model_type_id, weight in models_data.items():
             self.create_model(model_type_id, weight)
@@ -531,10 +772,11 @@ class Analysis(IdentityMixin, db.Model):
                 simple_model.create_weights(weight, model.id)
 
     def create_simple_model_weights(self, model, weight):
-        if self.complex_models().count() == 0:
+        complex_models = self.complex_models()
+        if not complex_models:
             model.create_weights(weight, model.id)
         else:
-            for complex_model in self.complex_models():
+            for complex_model in complex_models:
                 model.create_weights(weight, complex_model.id)
 
     def _delete_model(self, model):
@@ -545,7 +787,7 @@ class Analysis(IdentityMixin, db.Model):
         db.session.delete(model)
 
     def _delete_complex_model_weights(self, model):
-        if self.complex_models().count() == 1:
+        if len(self.complex_models()) == 1:
             for simple_model in model.child_model_weights:
                 simple_model.child_model_id = simple_model.model_id
         else:
@@ -578,10 +820,11 @@ class Analysis(IdentityMixin, db.Model):
         return analysis
 
     def _duplicate_models(self, analysis):
-        for simple_model in self.simple_models():
+        models = self.model_list()
+        for simple_model in self.simple_models(models):
             duplicated_model = simple_model.duplicate(analysis.id)
             analysis.create_simple_model_weights(duplicated_model, simple_model.weight)
-        for complex_model in self.complex_models():
+        for complex_model in self.complex_models(models):
             duplicated_model = complex_model.duplicate(analysis.id)
             analysis.create_complex_model_weights(duplicated_model)
 
@@ -596,7 +839,7 @@ class Analysis(IdentityMixin, db.Model):
 
     def cs_complex_model_weights(self):
         # assuming all complex models from analysis have the same weight sets
-        chosen_model = self.complex_models().first()
+        chosen_model = self.complex_models()[0]
         return chosen_model.cs_model_weights()
 
     def cs_complex_models(self):
@@ -610,33 +853,38 @@ class Analysis(IdentityMixin, db.Model):
             assert self.rp_longitude is not None
             assert self.lost_time is not None
             assert self.profiles.count() > 0
-            assert self.simple_models().count() > 0
+            assert len(self.simple_models()) > 0
         except AssertionError:
             raise AnalysisDataIncomplete("Data for the analysis is incomplete")
 
     def start_computation(self):
+        # concurrent starts wait here and find no draft models left, so models are never submitted twice
+        db.session.refresh(self, with_for_update=True)
         self.assert_ready_for_computation()
-        draft_simple_models = self.draft_models().join(Model.model_type).filter(ModelType.complex == False)
-        draft_complex_models = self.draft_models().join(Model.model_type).filter(ModelType.complex == True)
-        if draft_simple_models.count():
+        draft_models = self.draft_models()
+        if self.simple_models(draft_models):
             self.compute_simple_models()
-        if self.complex_models().count() and draft_complex_models.count():
+        if self.complex_models(draft_models):
             self.compute_complex_models()
+        StatusTransition.log_analyses([self.id])
 
     def compute_simple_models(self):
+        simple_models = self.simple_models()
         result_ids = cs_utils.compute_simple(ipp_longitude=self.ipp_longitude,
                                              ipp_latitude=self.ipp_latitude,
                                              rp_longitude=self.rp_longitude,
                                              rp_latitude=self.rp_latitude,
                                              profiles=self.cs_profiles(),
-                                             models=self.cs_simple_models())
+                                             models=[model.name for model in simple_models])
 
-        for model in self.simple_models():
+        for model in simple_models:
             model.update_result(result_ids[model.name])
 
     def compute_complex_models(self):
-        result_ids = cs_utils.compute_complex(self.cs_complex_model_weights(), self.cs_complex_models())
-        for model in self.complex_models():
+        complex_models = self.complex_models()
+        result_ids = cs_utils.compute_complex(complex_models[0].cs_model_weights(),
+                                              [model.name for model in complex_models])
+        for model in complex_models:
             model.update_result(result_ids[model.name])
 
     # result methods
@@ -645,30 +893,66 @@ class Analysis(IdentityMixin, db.Model):
     def update_result(self):
         for model in self.models:
             model.update_result()
+        StatusTransition.log_analyses([self.id])
 
 
-class Layer(db.Model, IdentityMixin):
-    __tablename__ = 'layers'
+class ResultLayers(db.Model):
+    """
+    Layer ids of one Calculation Server result, stored once and shared by all models
+    with that result id, including duplicates of their analyses.
+    """
+    __tablename__ = 'result_layers'
 
     # columns
-    layers_id = db.Column(String(256), nullable=False)
-    model_id = db.Column(Integer, db.ForeignKey('models.id'), nullable=False)
+    result_id = db.Column(String(64), primary_key=True)
+    _layer_ids = db.Column('layer_ids', Text, nullable=False)     # JSON list
 
-    def duplicate(self):
-        layer = Layer(layers_id=self.layers_id, model_id=self.model_id)
-        db.session.add(layer)
-        db.session.flush()
-        return layer
+    @property
+    def layer_ids(self):
+        return json.loads(self._layer_ids)
+
+    @classmethod
+    def store(cls, session, layers):
+        """
+        Inserts layer ids of results not stored yet with one multi-row insert.
+
+        :param layers: dict of layer id lists by result ids
+        """
+        layers = {result_id.strip(): layer_ids for result_id, layer_ids in layers.items() if result_id}
+        if not layers:
+            return
+        table = cls.__table__
+        for attempt in range(2):
+            existing = {row[0] for row in session.execute(
+                select([table.c.result_id]).where(table.c.result_id.in_(layers.keys())))}
+            rows = [{'result_id': result_id, 'layer_ids': json.dumps(list(layer_ids))}
+                    for result_id, layer_ids in layers.items() if result_id not in existing]
+            if not rows:
+                return
+            try:
+                with session.begin_nested():
+                    session.execute(table.insert().values(rows))
+                return
+            except IntegrityError:
+                if attempt:     # stored concurrently, e.g. by a result callback
+                    raise
 
 
 class Model(IdentityMixin, db.Model):
     __tablename__ = 'models'
+    __table_args__ = (
+        # models of analysis, also counted by status
+        db.Index('ix_models_analysis_status', 'analysis_id', 'status_id'),
+        db.UniqueConstraint('analysis_id', 'model_type_id', name='uq_models_analysis_model_type'),
+    )
 
     # columns
     analysis_id = db.Column(Integer, db.ForeignKey('analyses.id'), nullable=False)
     model_type_id = db.Column(Integer, db.ForeignKey('model_types.id'), nullable=False)
-    status_id = db.Column(Integer, db.ForeignKey('model_statuses.id'), nullable=False)
+    status_id = db.Column(Integer, db.ForeignKey('model_statuses.id'), nullable=False, index=True)   # poller
     _result_id = db.Column('result_id', CHAR(64), nullable=True)
+    updated_at = db.Column(DateTime, nullable=False, default=clock_timestamp(), onupdate=clock_timestamp(),
+                           index=True)
 
     def __init__(self, analysis_id, model_type_id, status_id=None, result_id=None):
         self.analysis_id = analysis_id
@@ -684,8 +968,9 @@ class Model(IdentityMixin, db.Model):
     # relationships
     #
 
-    layers = db.relationship('Layer', backref='model', lazy='dynamic', cascade="all,delete")
-    model_type = db.relationship('ModelType', backref='models')
+    result_layers = db.relationship('ResultLayers', primaryjoin='foreign(Model._result_id) == ResultLayers.result_id',
+                                    viewonly=True, uselist=False)
+    model_type = db.relationship('ModelType', backref='models', lazy='joined')
 
     # child_model_weights should have high count for complex model types, at most 1 for simple
     child_model_weights = db.relationship('ModelWeight', backref='parent_model',
@@ -698,12 +983,13 @@ class Model(IdentityMixin, db.Model):
     # properties
     #
 
-    name = column_property(select([ModelType.name]).
-                           where(ModelType.id == model_type_id).
-                           correlate_except(ModelType))
-    complex = column_property(select([ModelType.complex]).
-                              where(ModelType.id == model_type_id).
-                              correlate_except(ModelType))
+    @property
+    def name(self):
+        return self.model_type.name
+
+    @property
+    def complex(self):
+        return self.model_type.complex
 
     @property
     def result_id(self):
@@ -715,9 +1001,11 @@ class Model(IdentityMixin, db.Model):
     def weight(self):
         if self.complex:
             return None
-        assert self.model_weights.count() > 0
-        model_weight = db.session.query(ModelWeight).filter(ModelWeight.model_id == self.id).first()
-        return model_weight.weight if model_weight is not None else None
+        model_weights = self.__dict__.get('_preloaded_weights')
+        if model_weights is None:
+            model_weights = self.model_weights.all()
+        assert len(model_weights) > 0
+        return model_weights[0].weight
 
     # api create/update methods
     #
@@ -739,14 +1027,13 @@ class Model(IdentityMixin, db.Model):
                       result_id=self.result_id)
         db.session.add(model)
         db.session.flush()
-        for layer in self.layers:
-            layer.duplicate()
         return model
 
     # computation methods
     #
 
     def cs_model_weights(self):
+        # simple models are usually loaded already, so weight.model comes from the identity map
         return {weight.model.name: {'id': weight.model.result_id, 'weight': weight.weight}
                 for weight in self.child_model_weights}
 
@@ -754,27 +1041,44 @@ class Model(IdentityMixin, db.Model):
     #
 
     def layer_urls(self):
-        return [l.layers_id for l in self.layers]
+        return self.result_layers.layer_ids if self.result_layers is not None else []
 
     def update_result(self, result_id=None):
         if self.status_id == ModelStatus.draft_id():
             assert result_id is not None
             self._result_id = result_id
-            self.status_id = ModelStatus.by_name(ModelStatus.WAITING).id
+            previous_status_id, self.status_id = self.status_id, ModelStatus.by_name(ModelStatus.WAITING).id
+            StatusTransition.log_model(self, previous_status_id)
         else:
-            model_result = cs_utils.get_layers(self.result_id)
-            if model_result['status'] in ModelStatus.names():
-                status = ModelStatus.by_name(model_result['status'])
-            else:
-                status = ModelStatus.by_name(ModelStatus.PROCESSING)
-            if status.id != self.status_id:
-                logging.info('{} changing state from {} to {}'.
-                             format(self.id, self.status_id, status.id))
-                self.status_id = status.id
-                if status.name == cs_utils.FINISHED:
-                    for layer_id in model_result['layer_ids']:
-                        layer = Layer(layers_id=layer_id, model_id=self.id)
-                        db.session.add(layer)
+            self.apply_server_result(cs_utils.get_layers(self.result_id))
+
+    def apply_server_result(self, model_result):
+        """
+        Applies result reported by the Calculation Server, either polled or pushed by callback.
+        Idempotent: repeated or out of order results never move finished model back
+        and never duplicate its layers.
+
+        :param model_result: dict with server `status` and `layer_ids` of finished model
+        :return: True if model state has changed
+        """
+        if model_result['status'] in ModelStatus.names():
+            status = ModelStatus.by_name(model_result['status'])
+        else:
+            status = ModelStatus.by_name(ModelStatus.PROCESSING)
+        if status.id == self.status_id or ModelStatus.query.get(self.status_id).name in ModelStatus.final_names():
+            return False
+        logging.info('{} changing state from {} to {}'.
+                     format(self.id, self.status_id, status.id))
+        previous_status_id, self.status_id = self.status_id, status.id
+        StatusTransition.log_model(self, previous_status_id)
+        if status.name == cs_utils.FINISHED:
+            ResultLayers.store(db.session, {self.result_id: model_result.get('layer_ids', [])})
+            db.session.expire(self, ['result_layers'])
+        return True
+
+    @classmethod
+    def by_result_id(cls, result_id):
+        return cls.query.filter(cls._result_id == result_id)
 
     @classmethod
     def unfinished_models(cls):
@@ -783,24 +1087,41 @@ class Model(IdentityMixin, db.Model):
 
     @classmethod
     def update_state_from_server(cls):
-        for model in cls.unfinished_models():
-            model.update_result()
+        """
+        Polls the Calculation Server for all unfinished models and commits changes in one batch.
+        """
+        from .poller import poll_unfinished_models
+        return poll_unfinished_models()
 
 
 class ModelWeight(IdentityMixin, db.Model):
     __tablename__ = 'model_weights'
 
     # columns
-    model_id = db.Column(Integer, db.ForeignKey('models.id'), nullable=False)   # always simple model
-    child_model_id = db.Column(Integer, db.ForeignKey('models.id'), nullable=False)
+    model_id = db.Column(Integer, db.ForeignKey('models.id'), nullable=False, index=True)   # always simple model
+    child_model_id = db.Column(Integer, db.ForeignKey('models.id'), nullable=False, index=True)
     weight = db.Column(Integer, nullable=False)
 
+    @classmethod
+    def update_weights_of(cls, session, weights):
+        """
+        Sets weights of simple models with a single UPDATE.
+
+        :param weights: dict of weights by simple model ids
+        """
+        table = cls.__table__
+        session.execute(table.update().where(table.c.model_id.in_(weights.keys())).
+                        values(weight=case(weights, value=table.c.model_id)))
+
 
 class Profile(IdentityMixin, db.Model):
     __tablename__ = 'profiles'
+    __table_args__ = (
+        db.UniqueConstraint('analysis_id', 'person_type_id', name='uq_profiles_analysis_person_type'),
+    )
 
     # columns
-    analysis_id = db.Column(Integer, db.ForeignKey('analyses.id'), nullable=False)
+    analysis_id = db.Column(Integer, db.ForeignKey('analyses.id'), nullable=False, index=True)
     person_type_id = db.Column(Integer, db.ForeignKey('person_types.id'), nullable=False)
     weight = db.Column(Integer, nullable=False)
 
@@ -822,3 +1143,239 @@ class Profile(IdentityMixin, db.Model):
         db.session.add(profile)
         db.session.flush()
         return profile
+
+
+class StatusTransition(db.Model):
+    """
+    Append-only log of model and analysis status changes, source of the notification feed.
+    Its id is a monotonically increasing sequence number clients can resume from.
+    """
+    __tablename__ = 'status_transitions'
+    __table_args__ = (
+        db.Index('ix_status_transitions_analysis', 'kind', 'analysis_id', 'id'),
+    )
+
+    MODEL = 'model'
+    ANALYSIS = 'analysis'
+
+    # columns
+    id = db.Column(Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(String(16), nullable=False)
+    action_id = db.Column(Integer, nullable=False)
+    analysis_id = db.Column(Integer, nullable=False)
+    model_id = db.Column(Integer, nullable=True)
+    previous_status_id = db.Column(Integer, nullable=True)
+    status_id = db.Column(Integer, nullable=False)
+    time = db.Column(DateTime, nullable=False, default=func.now())
+
+    @classmethod
+    def since(cls, sequence, limit):
+        return cls.query.filter(cls.id > sequence).order_by(cls.id).limit(limit)
+
+    @staticmethod
+    def settled(transitions, sequence, gap_wait_sec):
+        """
+        Leading transitions (ordered by id) not preceded by a gap in ids. Ids are taken on insert, so a
+        transaction committing late fills a gap below ids already visible; a gap is skipped once the
+        transition after it is older than `gap_wait_sec` (ids of rolled back transactions stay missing).
+        """
+        settled_before = None
+        result = []
+        for transition in transitions:
+            if transition.id != sequence + 1:
+                if settled_before is None:     # clock of the database, which sets `time`
+                    settled_before = db.session.query(func.now()).scalar() - datetime.timedelta(seconds=gap_wait_sec)
+                if transition.time > settled_before:
+                    break
+            result.append(transition)
+            sequence = transition.id
+        return result
+
+    @classmethod
+    def log_model(cls, model, previous_status_id):
+        db.session.add(cls(kind=cls.MODEL, action_id=model.analysis.action_id, analysis_id=model.analysis_id,
+                           model_id=model.id, previous_status_id=previous_status_id, status_id=model.status_id))
+
+    @classmethod
+    def log_analyses(cls, analysis_ids):
+        """
+        Logs status change of given analyses, comparing their current status
+        with the last logged one. Safe to call repeatedly.
+        """
+        analysis_ids = set(analysis_ids)
+        if not analysis_ids:
+            return
+        db.session.flush()
+        current = db.session.query(Analysis.id, Analysis.action_id, Analysis.analysis_status_id).\
+            filter(Analysis.id.in_(analysis_ids)).all()
+        latest_ids = db.session.query(func.max(cls.id)).\
+            filter(cls.kind == cls.ANALYSIS, cls.analysis_id.in_(analysis_ids)).\
+            group_by(cls.analysis_id)
+        previous = {t.analysis_id: t.status_id for t in cls.query.filter(cls.id.in_(latest_ids.subquery()))}
+        draft_id = ModelStatus.draft_id()
+        for analysis_id, action_id, status_id in current:
+            previous_status_id = previous.get(analysis_id, draft_id)
+            if status_id != previous_status_id:
+                db.session.add(cls(kind=cls.ANALYSIS, action_id=action_id, analysis_id=analysis_id,
+                                   previous_status_id=previous_status_id, status_id=status_id))
+
+
+
+class IdempotencyKey(db.Model):
+    """
+    Response of a POST request sent with `Idempotency-Key` header, replayed to retries of the request.
+    A key without `status_code` belongs to a request still in progress, claimed at `claimed_at`
+    with `claim_token`.
+    """
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('key', 'path', name='uq_idempotency_keys_key_path'),
+    )
+
+    # columns
+    id = db.Column(Integer, primary_key=True, autoincrement=True)
+    key = db.Column(String(255), nullable=False)
+    path = db.Column(String(255), nullable=False)
+    request_hash = db.Column(CHAR(64), nullable=False)     # sha256 of request body
+    status_code = db.Column(Integer, nullable=True)
+    response = db.Column(Text, nullable=True)              # JSON
+    created_at = db.Column(DateTime, nullable=False, default=func.now(), index=True)
+    claimed_at = db.Column(DateTime, nullable=False, default=func.now())
+    claim_token = db.Column(CHAR(32), nullable=True)        # random, of the request holding the claim
+
+
+_touch_statements = {}      # built once, compiled once per dialect into `_touch_compiled`
+_touch_compiled = {}
+
+
+def _touch_actions_statement():
+    """Update of actions touched directly or by their analyses or models, see touch."""
+    if 'actions' not in _touch_statements:
+        actions, analyses, models = Action.__table__, Analysis.__table__, Model.__table__
+        analyses_filter = analyses.c.id.in_(bindparam('analysis_ids', expanding=True)) | analyses.c.id.in_(
+            select([models.c.analysis_id]).where(models.c.id.in_(bindparam('model_ids', expanding=True))))
+        actions_filter = actions.c.id.in_(bindparam('action_ids', expanding=True)) | actions.c.id.in_(
+            select([analyses.c.action_id]).where(analyses_filter))
+        _touch_statements['actions'] = actions.update().where(actions_filter).values(
+            updated_at=clock_timestamp(), effective_status_id=Action.action_status_id)
+    return _touch_statements['actions']
+
+
+def touch(session, analysis_ids=(), model_ids=(), action_ids=()):
+    """
+    Bumps `updated_at` of analyses (given directly or by their models) and of their
+    actions, so that delta sync clients refetch parents of changed rows, and stores the
+    current `action_status_id` of the actions in `effective_status_id`.
+    """
+    analysis_ids, model_ids, action_ids = set(analysis_ids), set(model_ids), set(action_ids)
+    if not (analysis_ids or model_ids or action_ids):
+        return
+    analyses = Analysis.__table__
+    if analysis_ids or model_ids:
+        analyses_filter = analyses.c.id.in_(analysis_ids) if analysis_ids else false()
+        if model_ids:
+            analyses_filter = analyses_filter | analyses.c.id.in_(
+                select([Model.__table__.c.analysis_id]).where(Model.__table__.c.id.in_(model_ids)))
+        session.execute(analyses.update().where(analyses_filter).values(updated_at=clock_timestamp()))
+    # the status expression is large, compiling it on every write would cost more than running it
+    statement = _touch_actions_statement()
+    session.connection(clause=statement).execution_options(compiled_cache=_touch_compiled).execute(
+        statement, analysis_ids=list(analysis_ids), model_ids=list(model_ids), action_ids=list(action_ids))
+
+
+def store_statuses(session, action_ids):
+    """Stores current `action_status_id` of actions in `effective_status_id`, `updated_at` is left as it is."""
+    actions = Action.__table__
+    session.execute(actions.update().where(actions.c.id.in_(action_ids)).
+                    values(effective_status_id=Action.action_status_id, updated_at=actions.c.updated_at))
+
+
+@event.listens_for(Action, 'before_insert')
+@event.listens_for(Action, 'before_update')
+def set_cells(mapper, connection, action):
+    action.ipp_cell = geo.cell(action.ipp_latitude, action.ipp_longitude)
+    action.rp_cell = geo.cell(action.rp_latitude, action.rp_longitude)
+
+
+def derived_sources(table):
+    """Columns of analyses (or archived analyses) table the derived values are computed from, id first."""
+    c = table.c
+    return [c.id, c.effective_ipp_latitude, c.effective_ipp_longitude, c.effective_rp_latitude,
+            c.effective_rp_longitude]
+
+
+def update_derived(session, table, rows):
+    """
+    Sets grid cells and IPP - RP distance and bearing of analyses, computed for all rows at once.
+
+    :param rows: values of `derived_sources` columns
+    """
+    if not rows:
+        return
+    ids, ipp_latitudes, ipp_longitudes, rp_latitudes, rp_longitudes = zip(*rows)
+    distances, bearings = geo.ipp_rp(ipp_latitudes, ipp_longitudes, rp_latitudes, rp_longitudes)
+    # derived values change with effective ones, which bump `updated_at` themselves
+    session.execute(table.update().where(table.c.id == bindparam('b_id')).
+                    values(effective_ipp_cell=bindparam('b_ipp_cell'), effective_rp_cell=bindparam('b_rp_cell'),
+                           ipp_rp_distance_km=bindparam('b_distance'), ipp_rp_bearing=bindparam('b_bearing'),
+                           updated_at=table.c.updated_at),
+                    [{'b_id': values[0], 'b_ipp_cell': values[1], 'b_rp_cell': values[2], 'b_distance': values[3],
+                      'b_bearing': values[4]}
+                     for values in zip(ids, geo.cells(ipp_latitudes, ipp_longitudes),
+                                       geo.cells(rp_latitudes, rp_longitudes), distances, bearings)])
+
+
+@event.listens_for(SignallingSession, 'before_flush')
+def sync_effective_values(session, flush_context, instances):
+    """
+    Keeps effective coordinates and lost time of analyses (and values derived from them, see
+    update_derived) in sync with their own values and, where these are missing, with values of their actions.
+    """
+    own = ['_' + name for name in Analysis.INHERITED] + ['action_id']
+    analyses = Analysis.__table__
+    for obj in list(itertools.chain(session.new, session.dirty)):
+        if isinstance(obj, Analysis):
+            state = inspect(obj)
+            if obj in session.new or any(state.attrs[name].history.has_changes() for name in own):
+                obj.sync_effective(session)
+        elif isinstance(obj, Action) and obj not in session.new:
+            state = inspect(obj)
+            changed = [name for name in Analysis.INHERITED if state.attrs[name].history.has_changes()]
+            for name in changed:
+                session.execute(analyses.update().
+                                where(and_(analyses.c.action_id == obj.id, analyses.c[name] == None)).
+                                values({'effective_' + name: getattr(obj, name), 'updated_at': clock_timestamp()}))
+            if changed:
+                update_derived(session, analyses, session.execute(
+                    select(derived_sources(analyses)).where(analyses.c.action_id == obj.id)).fetchall())
+                for analysis in list(session.identity_map.values()):
+                    if isinstance(analysis, Analysis) and analysis.action_id == obj.id:
+                        session.expire(analysis, ['effective_' + name for name in changed] +
+                                       ['effective_ipp_cell', 'effective_rp_cell', 'ipp_rp_distance_km',
+                                        'ipp_rp_bearing', 'updated_at'])
+
+
+@event.listens_for(SignallingSession, 'after_flush')
+def touch_changed_parents(session, flush_context):
+    """
+    Propagates changes of nested rows (models, weights, profiles, analyses) to `updated_at` of their parents.
+    Archiving an action also bumps its analyses, which disappear from the analyses list.
+    """
+    analysis_ids, model_ids, action_ids, archived_action_ids = set(), set(), set(), set()
+    for obj in itertools.chain(session.new, session.deleted, (obj for obj in session.dirty
+                                                              if session.is_modified(obj))):
+        if isinstance(obj, (Model, Profile)):
+            analysis_ids.add(obj.analysis_id)
+        elif isinstance(obj, ModelWeight):
+            model_ids.update((obj.model_id, obj.child_model_id))
+        elif isinstance(obj, Analysis):
+            action_ids.add(obj.action_id)
+        elif isinstance(obj, Action) and inspect(obj).attrs.archived.history.has_changes():
+            archived_action_ids.add(obj.id)
+    if archived_action_ids:
+        analyses = Analysis.__table__
+        session.execute(analyses.update().where(analyses.c.action_id.in_(archived_action_ids)).
+                        values(updated_at=clock_timestamp()))
+    analysis_ids.discard(None)
+    action_ids.discard(None)
+    touch(session, analysis_ids, model_ids - {None}, action_ids)
@@ -0,0 +1,191 @@
+"""
+Polling of unfinished models with write-behind batching.
+
+Results of one poller tick are collected in memory and written with one
+`UPDATE models ... FROM (VALUES ...)` (on PostgreSQL, other databases get one
+UPDATE per changed model), one multi-row result layers insert and one `updated_at`
+bump of the affected analyses and actions, instead of updating
+ORM objects model by model. Only plain rows are loaded, so memory used
+by a tick does not grow with the number of models in the session.
+"""
+import logging
+import time
+from sqlalchemy import text, bindparam, func
+from ..database import db, clock_timestamp
+from ..metrics import Histogram, registry
+from ..metrics.registry import Sample
+from . import cs_utils
+from .models import Model, ModelStatus, ResultLayers, Analysis, StatusTransition, touch
+
+poll_duration = Histogram('montracker_poll_duration_seconds', 'Duration of poller ticks',
+                          buckets=(.1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120))
+detection_lag = Histogram('montracker_detection_lag_seconds',
+                          'Time from a model finishing on the Calculation Server to its status change here',
+                          ('source',), buckets=(.1, .5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+
+
+def observe_detection_lag(model_result, source, now=None):
+    """
+    Records detection lag of final result, if the server reported when it finished (`finished_time`).
+    """
+    finished_time = model_result.get('finished_time')
+    if finished_time is not None:
+        detection_lag.observe(max(0.0, (now or time.time()) - float(finished_time)), source=source)
+
+
+class ResultBatch(object):
+    """
+    Model state transitions collected during one poller tick.
+    """
+
+    def __init__(self):
+        self.transitions = {}       # model_id -> (previous status_id, new status_id)
+        self.layers = {}            # model_id -> (result_id, list of layer ids)
+        self.parents = {}           # model_id -> (analysis_id, action_id)
+        self.finished_times = {}    # model_id -> server time of reaching final status
+
+    def __len__(self):
+        return len(self.transitions)
+
+    def add(self, model_id, previous_status_id, status_id, layer_ids=None, analysis_id=None, action_id=None,
+            result_id=None, finished_time=None):
+        self.transitions[model_id] = (previous_status_id, status_id)
+        self.parents[model_id] = (analysis_id, action_id)
+        if finished_time is not None:
+            self.finished_times[model_id] = finished_time
+        if layer_ids is not None and result_id:
+            self.layers[model_id] = (result_id, list(layer_ids))
+
+    def _update_statuses(self, session):
+        """
+        Updates status of models still in their previous status, so transitions
+        applied meanwhile (e.g. by result callback) are never overwritten.
+
+        :return: ids of updated models
+        """
+        rows = [(model_id, previous, status) for model_id, (previous, status) in self.transitions.items()]
+        if session.bind.dialect.name == 'postgresql':
+            values = ', '.join('(:id_{0}, :previous_{0}, :status_{0})'.format(i) for i in range(len(rows)))
+            params = {}
+            for i, (model_id, previous, status) in enumerate(rows):
+                params.update({'id_%d' % i: model_id, 'previous_%d' % i: previous, 'status_%d' % i: status})
+            result = session.execute(text(
+                'UPDATE models SET status_id = v.status_id, updated_at = clock_timestamp() '
+                'FROM (VALUES {}) AS v(id, previous_status_id, status_id) '
+                'WHERE models.id = v.id AND models.status_id = v.previous_status_id '
+                'RETURNING models.id'.format(values)), params)
+            return {row[0] for row in result}
+
+        table = Model.__table__
+        statement = table.update().\
+            where(table.c.id == bindparam('model_id')).\
+            where(table.c.status_id == bindparam('previous_status_id')).\
+            values(status_id=bindparam('new_status_id'), updated_at=clock_timestamp())
+        updated = set()
+        for model_id, previous, status in rows:
+            result = session.execute(statement, {'model_id': model_id, 'previous_status_id': previous,
+                                                 'new_status_id': status})
+            if result.rowcount:
+                updated.add(model_id)
+        return updated
+
+    def apply(self, session):
+        """
+        Writes collected transitions; transaction is left to the caller.
+
+        :return: ids of updated models
+        """
+        if not self.transitions:
+            return set()
+        updated = self._update_statuses(session)
+        ResultLayers.store(session, dict(layers for model_id, layers in self.layers.items() if model_id in updated))
+        transitions = [{'kind': StatusTransition.MODEL, 'model_id': model_id,
+                        'analysis_id': self.parents[model_id][0], 'action_id': self.parents[model_id][1],
+                        'previous_status_id': self.transitions[model_id][0],
+                        'status_id': self.transitions[model_id][1]}
+                       for model_id in updated]
+        if transitions:
+            session.execute(StatusTransition.__table__.insert().values(transitions))
+        touch(session, self.analysis_ids(updated))
+        now = time.time()
+        for model_id in updated:
+            if model_id in self.finished_times:
+                observe_detection_lag({'finished_time': self.finished_times[model_id]}, 'poll', now)
+        return updated
+
+    def analysis_ids(self, model_ids):
+        return {self.parents[model_id][0] for model_id in model_ids}
+
+
+def status_name(server_status):
+    return server_status if server_status in ModelStatus.names() else ModelStatus.PROCESSING
+
+
+def unfinished_models_query(statuses):
+    """
+    Plain rows of models the poller asks the server about, served by `ix_models_status_id`.
+    """
+    unfinished_ids = [statuses[name] for name in ModelStatus.unfinished_names()]
+    return db.session.query(Model.id, Model._result_id, Model.status_id, Model.analysis_id, Analysis.action_id).\
+        join(Analysis, Analysis.id == Model.analysis_id).\
+        filter(Model.status_id.in_(unfinished_ids))
+
+
+def collect_results(statuses):
+    """
+    Asks the Calculation Server about every unfinished model. Results are requested
+    once per result id, as duplicated analyses share results of their models.
+
+    :param statuses: dict of ModelStatus ids by names
+    :return: ResultBatch with changed models
+    """
+    rows = unfinished_models_query(statuses).all()
+
+    results, batch = {}, ResultBatch()
+    for model_id, result_id, status_id, analysis_id, action_id in rows:
+        if not result_id:
+            continue
+        result_id = result_id.strip()
+        if result_id not in results:
+            try:
+                results[result_id] = cs_utils.get_layers(result_id)
+            except cs_utils.ServerException as e:
+                logging.warning('Polling result {} failed: {}'.format(result_id, e))
+                results[result_id] = None
+        model_result = results[result_id]
+        if model_result is None:
+            continue
+        new_status_id = statuses[status_name(model_result['status'])]
+        if new_status_id != status_id:
+            layer_ids = model_result.get('layer_ids', []) if new_status_id == statuses[ModelStatus.FINISHED] else None
+            batch.add(model_id, status_id, new_status_id, layer_ids, analysis_id, action_id, result_id,
+                      model_result.get('finished_time'))
+    return batch
+
+
+def poll_unfinished_models():
+    """
+    Single poller tick: collects results of all unfinished models and commits them at once.
+
+    :return: ids of updated models
+    """
+    with poll_duration.time():
+        statuses = {status.name: status.id for status in ModelStatus.query}
+        batch = collect_results(statuses)
+        updated = batch.apply(db.session)
+        StatusTransition.log_analyses(batch.analysis_ids(updated))
+        db.session.commit()
+    if updated:
+        logging.info('Poller updated state of {} models'.format(len(updated)))
+    return updated
+
+
+@registry.add_collector
+def collect_unfinished_models():
+    counts = db.session.query(ModelStatus.name, func.count(Model.id)).\
+        join(Model, Model.status_id == ModelStatus.id).\
+        filter(ModelStatus.name.in_(ModelStatus.unfinished_names())).\
+        group_by(ModelStatus.name)
+    samples = [Sample('montracker_unfinished_models', {'status': name}, count) for name, count in counts]
+    return [('montracker_unfinished_models', 'gauge', 'Models waiting for the Calculation Server by status',
+             samples)]
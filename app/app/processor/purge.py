@@ -0,0 +1,123 @@
+"""
+Purge of soft-deleted data and orphaned rows.
+
+Actions and analyses deleted more than `PURGE_RETENTION_DAYS` ago are removed
+with their models, weights and profiles (from hot and archive tables), as are
+model weights pointing to missing models, result layers no model refers to and
+idempotency keys older than `IDEMPOTENCY_KEY_TTL_SEC`.
+Rows are removed in batches of `PURGE_BATCH_SIZE` roots, each batch in its own
+short transaction followed by a `PURGE_PAUSE_SEC` pause, so the purge never
+holds locks on hot tables for long. Candidates are paged by id, which lets a
+dry run walk all of them, counting rows instead of deleting them (analyses of
+deleted actions are then counted twice, with analyses and with actions).
+"""
+import datetime
+import logging
+import time
+from flask import current_app
+from sqlalchemy import select, func, and_, or_, exists
+from ..database import db
+from ..metrics import Counter
+from .archive import subtree, HOT_TABLES, ARCHIVE_TABLES
+from .idempotency import expired_before
+from .models import Action, Analysis, Model, ModelWeight, ResultLayers, IdempotencyKey
+
+purged_rows = Counter('montracker_purged_rows_total', 'Rows removed by the purge job', ('table',))
+
+
+def _deleted(table):
+    return lambda cutoff: and_(table.c.deleted == True, table.c.updated_at < cutoff)
+
+
+def _orphaned_weights(cutoff):
+    weights, models = ModelWeight.__table__, Model.__table__
+    return or_(~exists().where(models.c.id == weights.c.model_id),
+               ~exists().where(models.c.id == weights.c.child_model_id))
+
+
+def _unused_layers(cutoff):
+    layers = ResultLayers.__table__
+    return and_(*[~exists().where(models.c.result_id == layers.c.result_id)
+                  for models in (Model.__table__, ARCHIVE_TABLES[1])])
+
+
+def _expired_keys(cutoff):
+    return IdempotencyKey.__table__.c.created_at < expired_before()
+
+
+# root table, condition of purged roots, rows removed with given root ids (parents first)
+STEPS = (
+    (Analysis.__table__, _deleted(Analysis.__table__),
+     lambda ids: subtree(HOT_TABLES, analysis_ids=ids)),
+    (ARCHIVE_TABLES[0], _deleted(ARCHIVE_TABLES[0]),
+     lambda ids: subtree(ARCHIVE_TABLES, analysis_ids=ids)),
+    (Action.__table__, _deleted(Action.__table__),
+     lambda ids: [(Action.__table__, Action.__table__.c.id.in_(ids))] +
+     subtree(HOT_TABLES, action_ids=ids) + subtree(ARCHIVE_TABLES, action_ids=ids)),
+    (ModelWeight.__table__, _orphaned_weights,
+     lambda ids: [(ModelWeight.__table__, ModelWeight.__table__.c.id.in_(ids))]),
+    (ResultLayers.__table__, _unused_layers,
+     lambda ids: [(ResultLayers.__table__, ResultLayers.__table__.c.result_id.in_(ids))]),
+    (IdempotencyKey.__table__, _expired_keys,
+     lambda ids: [(IdempotencyKey.__table__, IdempotencyKey.__table__.c.id.in_(ids))]),
+)
+
+
+def _purge_batch(session, statements, dry_run):
+    """
+    Deletes (or counts) rows selected by `statements`, children first.
+
+    :return: dict of row counts by table names
+    """
+    counts = {}
+    for table, condition in reversed(statements):
+        if dry_run:
+            count = session.execute(select([func.count()]).select_from(table).where(condition)).scalar()
+        else:
+            count = session.execute(table.delete().where(condition)).rowcount
+        counts[table.name] = counts.get(table.name, 0) + count
+    return counts
+
+
+def purge(dry_run=False, retention_days=None, batch_size=None, max_batches=None, pause=None):
+    """
+    Runs all purge steps, at most `max_batches` batches in total.
+
+    :return: dict of purged (or, in dry run, purgeable) row counts by table names
+    """
+    config = current_app.config
+    retention_days = config['PURGE_RETENTION_DAYS'] if retention_days is None else retention_days
+    batch_size = batch_size or config['PURGE_BATCH_SIZE']
+    max_batches = max_batches or config['PURGE_MAX_BATCHES']
+    pause = config['PURGE_PAUSE_SEC'] if pause is None else pause
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=retention_days)
+
+    reclaimed, batches = {}, 0
+    for table, condition, statements in STEPS:
+        key = table.primary_key.columns.values()[0]
+        last_id = None
+        while batches < max_batches:
+            query = select([key]).where(condition(cutoff)).order_by(key).limit(batch_size)
+            if last_id is not None:
+                query = query.where(key > last_id)
+            ids = [row[0] for row in db.session.execute(query)]
+            if not ids:
+                break
+            counts = _purge_batch(db.session, statements(ids), dry_run)
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+                for table_name, count in counts.items():
+                    purged_rows.inc(count, table=table_name)
+            for table_name, count in counts.items():
+                reclaimed[table_name] = reclaimed.get(table_name, 0) + count
+            last_id, batches = ids[-1], batches + 1
+            if pause:
+                time.sleep(pause)
+    reclaimed = {table_name: count for table_name, count in reclaimed.items() if count}
+    if reclaimed:
+        logging.info('{} {}'.format('Purge would remove' if dry_run else 'Purged',
+                                    ', '.join('{} {}'.format(count, table_name)
+                                              for table_name, count in sorted(reclaimed.items()))))
+    return reclaimed
@@ -1,6 +1,23 @@
-from marshmallow import Schema, fields, validate
+import marshmallow
+from marshmallow import fields, validate
+from app.processor import cs_utils
 from app.processor.fields import TimestampField, LayerURLField, IntegerListField, LatitudeField, LongitudeField, \
-    ModelTypeField, PersonTypeField
+    ModelTypeField, PersonTypeField, PointField, BoundingBoxField
+from app.timing import timed
+
+
+class Schema(marshmallow.Schema):
+    """
+    Base of API schemas, `load` and `dump` are timed as validation and serialization of Server-Timing.
+    """
+
+    def load(self, *args, **kwargs):
+        with timed('validation'):
+            return super().load(*args, **kwargs)
+
+    def dump(self, *args, **kwargs):
+        with timed('serialization'):
+            return super().dump(*args, **kwargs)
 
 
 class ModelBaseSchema(Schema):
@@ -17,6 +34,7 @@ class ModelSchema(ModelBaseSchema):
 
     # dump only state fields
     id = fields.Integer(allow_none=False, dump_only=True)
+    updated_at = TimestampField(dump_only=True)
     model_status_id = fields.Integer(allow_none=False, dump_only=True)
     layers = fields.List(LayerURLField, dump_only=True, attribute='layer_urls')
 
@@ -64,11 +82,18 @@ class AnalysisBaseSchema(Schema):
     # dump only state fields
     id = fields.Integer(dump_only=True)
     creation_time = TimestampField(dump_only=True)
+    updated_at = TimestampField(dump_only=True)
+    version = fields.Integer(dump_only=True)
     analysis_status_id = fields.Integer(dump_only=True)
+    distance_km = fields.Float(dump_only=True)      # from `near` point of spatial search
+    ipp_rp_distance_km = fields.Float(dump_only=True)
+    ipp_rp_bearing = fields.Float(dump_only=True)
 
     # post/get nested fields – used on all request but used only for nested objects creation
-    models = fields.List(fields.Nested(ModelNestedSchema))
-    profiles = fields.List(fields.Nested(ProfileNestedSchema))
+    models = fields.List(fields.Nested(ModelNestedSchema), load_only=True)
+    model_list = fields.List(fields.Nested(ModelNestedSchema), dump_only=True, dump_to='models')
+    profiles = fields.List(fields.Nested(ProfileNestedSchema), load_only=True)
+    profile_list = fields.List(fields.Nested(ProfileNestedSchema), dump_only=True, dump_to='profiles')
 
 
 class AnalysisSchema(AnalysisBaseSchema):
@@ -105,6 +130,8 @@ class ActionBaseSchema(Schema):
     # dump only state fields
     id = fields.Integer(dump_only=True)
     creation_time = TimestampField(dump_only=True)
+    updated_at = TimestampField(dump_only=True)
+    version = fields.Integer(dump_only=True)
 
     # load only action fields
     deleted = fields.Boolean(allow_none=True, load_only=True)
@@ -113,7 +140,8 @@ class ActionBaseSchema(Schema):
     # user_id = fields.Integer(allow_none=True, dump_only=True)
 
     # post/get nested fields – used on all request but used only for nested objects creation
-    analyses = fields.List(fields.Nested(AnalysisNestedSchema))
+    analyses = fields.List(fields.Nested(AnalysisNestedSchema), load_only=True)
+    analysis_list = fields.List(fields.Nested(AnalysisNestedSchema), dump_only=True, dump_to='analyses')
 
 
 class ActionSchema(ActionBaseSchema):
@@ -134,7 +162,9 @@ class ActionListSchema(Schema):
     action_status_id = fields.Integer(dump_only=True)
     id = fields.Integer(dump_only=True)
     creation_time = TimestampField(dump_only=True)
+    updated_at = TimestampField(dump_only=True)
     archived = fields.Boolean(allow_none=True, dump_only=True)
+    distance_km = fields.Float(dump_only=True)      # from `near` point of spatial search
     # analyses = fields.List(fields.Nested(AnalysisActionListSchema), dump_only=True)
 
 
@@ -145,6 +175,11 @@ class BaseQuerySchema(Schema):
     created_to = TimestampField()
     lost_from = TimestampField()
     lost_to = TimestampField()
+    updated_since = TimestampField()    # delta sync: changed items and tombstones of removed ones
+    near = PointField()                 # spatial search, see geo
+    radius_km = fields.Float(validate=validate.Range(min=0, max=20000))
+    bbox = BoundingBoxField()
+    point = fields.String(validate=validate.OneOf(['ipp', 'rp']))
 
 
 class ActionQuerySchema(BaseQuerySchema):
@@ -156,10 +191,51 @@ class ActionQuerySchema(BaseQuerySchema):
 class AnalysisQuerySchema(BaseQuerySchema):
     status = IntegerListField()
     query = fields.String()
+    ipp_rp_distance_min = fields.Float(validate=validate.Range(min=0))
+    ipp_rp_distance_max = fields.Float(validate=validate.Range(min=0))
+    ipp_rp_bearing_from = fields.Float(validate=validate.Range(min=0, max=360))    # from > to: range across north
+    ipp_rp_bearing_to = fields.Float(validate=validate.Range(min=0, max=360))
+    sort = fields.String(validate=validate.OneOf(['creation_time', '-creation_time', 'ipp_rp_distance_km',
+                                                  '-ipp_rp_distance_km', 'ipp_rp_bearing', '-ipp_rp_bearing']))
+
+
+class ClusterQuerySchema(Schema):
+    bbox = BoundingBoxField(required=True)
+    zoom = fields.Integer(required=True, validate=validate.Range(min=0, max=22))
+
 
+class ClusterSchema(Schema):
+    latitude = fields.Float(dump_only=True)
+    longitude = fields.Float(dump_only=True)
+    count = fields.Integer(dump_only=True)
+    statuses = fields.Dict(dump_only=True)      # action counts by status name
+    action_id = fields.Integer(dump_only=True)  # of single action clusters only
 
 
 
 
 
 
+
+
+
+class ResultCallbackSchema(Schema):
+    status = fields.String(required=True, validate=validate.OneOf(list(cs_utils.STATUSES.values())))
+    layer_ids = fields.List(fields.String())
+    finished_time = fields.Float()      # unix time of reaching final status on the server, optional
+
+
+class NotificationSchema(Schema):
+    id = fields.Integer(dump_only=True)
+    kind = fields.String(dump_only=True)
+    action_id = fields.Integer(dump_only=True)
+    analysis_id = fields.Integer(dump_only=True)
+    model_id = fields.Integer(dump_only=True)
+    previous_status_id = fields.Integer(dump_only=True)
+    status_id = fields.Integer(dump_only=True)
+    time = TimestampField(dump_only=True)
+
+
+class NotificationQuerySchema(Schema):
+    since = fields.Integer(validate=validate.Range(min=0))
+    limit = fields.Integer(validate=validate.Range(min=1, max=1000))
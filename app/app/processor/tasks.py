@@ -0,0 +1,24 @@
+"""
+Background jobs of the processor, executed by `jobs.queue` workers.
+"""
+from ..jobs.queue import task
+from .archive import archive_actions
+from .models import Model
+from .purge import purge
+
+
+@task('check_server')
+def check_server(payload):
+    # every tick commits its batch and runs in a fresh session, see JobWorker.run_once
+    Model.update_state_from_server()
+
+
+@task('archive_actions')
+def archive_old_actions(payload):
+    # one batch per job, every action in its own transaction
+    archive_actions(payload.get('batch_size'))
+
+
+@task('purge')
+def purge_deleted(payload):
+    purge(dry_run=payload.get('dry_run', False))
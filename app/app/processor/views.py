@@ -1,17 +1,30 @@
-from flask import Blueprint, request
+import datetime
+import hmac
+import json
+import time
+from flask import Blueprint, request, current_app, Response, stream_with_context
 from flask_restful import Api, Resource
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from ..helpers import resource_does_not_exist, validation_failed, request_resource_unavailable, server_not_available, \
-    AnalysisDataIncomplete, analysis_data_incomplete
+    AnalysisDataIncomplete, analysis_data_incomplete, unauthorized, conflict
 from ..processor.config_api import ConfigApi
+from ..processor import cs_utils, geo, clusters
 from ..processor.cs_utils import ServerException
 from ..processor.schemas import ActionSchema, AnalysisSchema, ModelSchema, ActionQuerySchema, ActionListSchema, \
-    ProfileSchema, AnalysisQuerySchema, AnalysisExecutionSchema, ActionBaseSchema, ModelBaseSchema, ProfileBaseSchema
-from ..database import db
-from .models import Action, Analysis, ModelStatus, Model, ActionStatus, Profile, ModelWeight
+    ProfileSchema, AnalysisQuerySchema, AnalysisExecutionSchema, ActionBaseSchema, ModelBaseSchema, ProfileBaseSchema, \
+    ResultCallbackSchema, NotificationSchema, NotificationQuerySchema, ClusterQuerySchema, ClusterSchema
+from ..database import db, read_replica
+from .archive import ensure_hot, get_hot
+from .idempotency import idempotent
+from .models import Action, Analysis, ModelStatus, Model, ActionStatus, Profile, ModelWeight, StatusTransition
+from .poller import observe_detection_lag
+from ..timing import init_server_timing
 
 processor = Blueprint('processor', __name__, url_prefix='/app/api/v1')
 api = Api(processor, catch_all_404s=True)
 api.add_resource(ConfigApi, '/config', endpoint='config')
+init_server_timing(processor)
 
 
 @processor.after_request
@@ -22,9 +35,102 @@ def after_request(response):
     return response
 
 
+def delta_sync_since(updated_since):
+    """
+    Lower bound of `updated_at` of items returned to delta sync clients: rows committed by a transaction
+    running meanwhile can be stamped (a bit) earlier than rows the client already has.
+    """
+    if updated_since is None:
+        return None
+    return datetime.datetime.strptime(updated_since, '%Y-%m-%d %H:%M:%S') - \
+        datetime.timedelta(seconds=current_app.config['DELTA_SYNC_OVERLAP_SEC'])
+
+
+def spatial_radius_km(data):
+    radius_km = data.get('radius_km')
+    return current_app.config['GEO_DEFAULT_RADIUS_KM'] if radius_km is None else radius_km
+
+
+def filter_spatial(query, model, data):
+    """
+    Applies `near`, `radius_km`, `bbox` and `point` query parameters, see geo. Results of queries
+    with `near` are to be fetched by `fetch_spatial`.
+    """
+    return geo.filter_spatial(query, model, near=data.get('near'), radius_km=spatial_radius_km(data),
+                              bbox=data.get('bbox'), point=data.get('point', 'ipp'))
+
+
+def fetch_spatial(query, model, data, limit=None):
+    """
+    Runs query filtered by `filter_spatial`: with `near`, drops candidates outside of the radius and
+    sets `distance_km` of the others. With `limit`, candidates are fetched in batches of `limit`
+    until as many items are found.
+    """
+    near = data.get('near')
+    if near is None:
+        return query.limit(limit).all() if limit else query.all()
+    query = geo.with_coordinates(query, model, data.get('point', 'ipp'))
+    radius_km = spatial_radius_km(data)
+    if not limit:
+        found = geo.within_radius(query.all(), near[0], near[1], radius_km)
+    else:
+        found, offset = [], 0
+        while len(found) < limit:
+            rows = query.limit(limit).offset(offset).all()
+            found.extend(geo.within_radius(rows, near[0], near[1], radius_km))
+            if len(rows) < limit:
+                break
+            offset += limit
+        found = found[:limit]
+    for item, distance in found:
+        item.distance_km = distance
+    return [item for item, _ in found]
+
+
+def load_partial(schema, input_data):
+    """
+    Validates only fields given in `input_data` (PATCH), aborts with 422 on errors.
+
+    :return: tuple of loaded data and `version` of the resource the client has seen (None if not given)
+    """
+    version = input_data.pop('version', None)
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        validation_failed({'version': ['Not a valid integer.']})
+    data, errors = schema.load(input_data, partial=True)
+    if errors:
+        validation_failed(errors)
+    return data, version
+
+
+def commit_versioned(instance, version=None):
+    """
+    Commits changes of `instance` as a single UPDATE guarded by its version column, aborts with 409
+    if the client has seen an older `version` or another request changed the row meanwhile.
+    """
+    if version is not None and version != instance.version:
+        db.session.rollback()
+        conflict()
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        conflict()
+
+
+def dump_with_tombstones(items, schema, removed):
+    """
+    Dumps items of delta sync response, removed items are replaced with `{'id': <id>, 'deleted': true}`.
+    """
+    kept = [item for item in items if not removed(item)]
+    data, _ = schema.dump(kept)
+    data = iter(data)
+    return [{'id': item.id, 'deleted': True} if removed(item) else next(data) for item in items]
+
+
 @api.resource('/actions', endpoint='actions')
 class ActionListApi(Resource):
 
+    @read_replica
     def get(self):
         schema = ActionQuerySchema()
         data, errors = schema.load(request.args)
@@ -36,10 +142,14 @@ class ActionListApi(Resource):
         name_query = data.get('name')
         created_from, created_to = data.get('created_from'), data.get('created_to')
         lost_from, lost_to = data.get('lost_from'), data.get('lost_to')
-        action_query = Action.filtered(statuses=statuses, archived=archived,
+        updated_since = data.get('updated_since')
+        action_query = Action.filtered(deleted=None if updated_since else False,
+                                       statuses=statuses, archived=archived,
                                        name_search=name_query,
                                        created_from=created_from, created_to=created_to,
-                                       lost_from=lost_from, lost_to=lost_to)
+                                       lost_from=lost_from, lost_to=lost_to,
+                                       updated_since=delta_sync_since(updated_since))
+        action_query = filter_spatial(action_query, Action, data)
         limit = None
 
         # pagination
@@ -49,15 +159,17 @@ class ActionListApi(Resource):
             limit = per_page
 
         # general: limits and default order
-        if limit:
-            actions = action_query.limit(per_page).all()
-        else:
-            actions = action_query.order_by(Action.creation_time.desc()).all()
+        action_query = action_query.order_by(Action.creation_time.desc())
+        actions = fetch_spatial(action_query, Action, data, limit)
 
+        Action.preload_statuses(actions)
         schema = ActionListSchema(many=True)
+        if updated_since:
+            return dump_with_tombstones(actions, schema, lambda action: action.deleted), 200
         data, _ = schema.dump(actions)
         return data, 200
 
+    @idempotent
     def post(self):
         """
         Returns created action item with its shortened analysis data items.
@@ -78,9 +190,31 @@ class ActionListApi(Resource):
         return data, 201
 
 
+@api.resource('/actions/clusters', endpoint='action_clusters')
+class ActionClusterApi(Resource):
+
+    @read_replica
+    def get(self):
+        """
+        Returns clusters of actions by IPP in map tiles of `zoom` intersecting `bbox`, see clusters.
+        """
+        schema = ClusterQuerySchema()
+        data, errors = schema.load(request.args)
+        if errors:
+            validation_failed(errors)
+        try:
+            items = clusters.clusters(data['zoom'], data['bbox'])
+        except clusters.TooManyTiles:
+            validation_failed({'bbox': ['Covers more than {} tiles of zoom {}.'.format(
+                current_app.config['CLUSTER_MAX_TILES'], data['zoom'])]})
+        data, _ = ClusterSchema(many=True).dump(items)
+        return data, 200
+
+
 @api.resource('/actions/<int:action_id>')
 class ActionApi(Resource):
 
+    @read_replica
     def get(self, action_id):
         """
         Returns complete action item: with all nested analyses,
@@ -89,26 +223,25 @@ class ActionApi(Resource):
         action = Action.query.get(action_id)
         if action is None or action.deleted:
             resource_does_not_exist()
+        action = ensure_hot(action).preload_analyses()
         schema = ActionSchema()
         data, _ = schema.dump(action)
         return data, 200
 
     def patch(self, action_id):
-        action = Action.query.get(action_id)
+        """
+        Updates given fields of action, returns its own fields (without computed status and nested analyses).
+        """
+        action = ensure_hot(Action.query.get(action_id))     # e.g. unarchived, archive job picks it up again later
         if action is None:
             resource_does_not_exist()
-        schema = ActionSchema()
-        data, _ = schema.dump(action)
-        for key, value in request.get_json().items():
-            data[key] = value
-        data.pop('analyses', None)
-        action_data, errors = ActionSchema().load(data)
-        if errors:
-            validation_failed(errors)
+        request_data = request.get_json()
+        request_data.pop('analyses', None)
+        action_data, version = load_partial(ActionSchema(), request_data)
         for k, v in action_data.items():
             setattr(action, k, v)
-        db.session.commit()
-        schema = ActionSchema()
+        commit_versioned(action, version)
+        schema = ActionSchema(exclude=('analysis_list', 'action_status_id'))
         action_data, _ = schema.dump(action)
         return action_data, 200
 
@@ -124,6 +257,7 @@ class ActionApi(Resource):
 @api.resource('/analyses', endpoint='analyses')
 class AnalysisListApi(Resource):
 
+    @read_replica
     def get(self):
         schema = AnalysisQuerySchema()
         data, errors = schema.load(request.args)
@@ -134,31 +268,50 @@ class AnalysisListApi(Resource):
         name_query = data.get('query')
         created_from, created_to = data.get('created_from'), data.get('created_to')
         lost_from, lost_to = data.get('lost_from'), data.get('lost_to')
+        updated_since = data.get('updated_since')
         analysis_query = Analysis.filtered(
+            deleted=None if updated_since else False,
+            archived=None if updated_since else False,
             statuses=statuses,
             name_search=name_query,
             created_from=created_from,
             created_to=created_to,
             lost_from=lost_from,
-            lost_to=lost_to)
+            lost_to=lost_to,
+            updated_since=delta_sync_since(updated_since),
+            distance_min=data.get('ipp_rp_distance_min'),
+            distance_max=data.get('ipp_rp_distance_max'),
+            bearing_from=data.get('ipp_rp_bearing_from'),
+            bearing_to=data.get('ipp_rp_bearing_to'))
+        analysis_query = filter_spatial(analysis_query, Analysis, data)
         limit = None
 
-        # pagination
+        # pagination, by creation time only
+        sort = data.get('sort', '-creation_time')
         per_page, page_ts = data.get('per_page'), data.get('page_ts')
+        if page_ts and sort != '-creation_time':
+            validation_failed({'sort': ['Paging with page_ts supports only the default order.']})
         if per_page and page_ts:
             analysis_query = analysis_query.filter(Analysis.creation_time <= page_ts)
             limit = per_page
 
-        # general: limits and default order
-        if limit:
-            analyses = analysis_query.limit(per_page).all()
-        else:
-            analyses = analysis_query.order_by(Analysis.creation_time.desc()).all()
+        # general: limits and order, newest first by default and among equal values
+        if sort.lstrip('-') != 'creation_time':
+            column = getattr(Analysis, sort.lstrip('-'))
+            analysis_query = analysis_query.order_by(column == None, column.desc() if sort[0] == '-' else column)
+        elif sort == 'creation_time':
+            analysis_query = analysis_query.order_by(Analysis.creation_time)
+        analysis_query = analysis_query.order_by(Analysis.creation_time.desc())
+        analyses = fetch_spatial(analysis_query, Analysis, data, limit)
 
+        Analysis.preload(analyses)
         schema = AnalysisSchema(many=True)
+        if updated_since:
+            return dump_with_tombstones(analyses, schema, lambda analysis: analysis.deleted or analysis.archived), 200
         data, _ = schema.dump(analyses)
         return data, 200
 
+    @idempotent
     def post(self):
         """
         Creates and returns created analysis by full representation
@@ -172,11 +325,12 @@ class AnalysisListApi(Resource):
         models_data = data.pop('models', None)
         profiles_data = data.pop('profiles', None)
         if analysis_id is None:
+            ensure_hot(Action.query.get(data['action_id']))     # analyses of cold actions are restored with it
             analysis = Analysis(**data)
             db.session.add(analysis)
             db.session.flush()
         else:   # duplicate analysis
-            analysis = Analysis.query.get(int(analysis_id))
+            analysis = get_hot(Analysis, int(analysis_id))
             if analysis is None:
                 resource_does_not_exist()
             analysis = analysis.duplicate(data)
@@ -192,18 +346,20 @@ class AnalysisListApi(Resource):
 @api.resource('/analyses/<int:analysis_id>')
 class AnalysisApi(Resource):
 
+    @read_replica
     def get(self, analysis_id):
-        analysis = Analysis.query.get(analysis_id)
+        analysis = get_hot(Analysis, analysis_id)
         if analysis is None or analysis.deleted:
             resource_does_not_exist()
         schema = AnalysisSchema(strict=True)
         data, _ = schema.dump(analysis)
         return data, 200
 
+    @idempotent
     def post(self, analysis_id):
 
         # find requested resource
-        analysis = Analysis.query.get(analysis_id)
+        analysis = get_hot(Analysis, analysis_id)
         if analysis is None or analysis.deleted:
             resource_does_not_exist()
 
@@ -233,36 +389,31 @@ class AnalysisApi(Resource):
     def patch(self, analysis_id):
 
         # retrieve analysis
-        analysis = Analysis.query.get(analysis_id)
+        analysis = get_hot(Analysis, analysis_id)
         if analysis is None:
             resource_does_not_exist()
 
-        # load analysis
-        analysis_schema = AnalysisSchema(dump_only=('models', 'profiles'))
-        analysis_data, _ = analysis_schema.dump(analysis)
-
         # read request data
         request_analysis = request.get_json()
-        models = request_analysis.pop('models', [])
-        profiles = request_analysis.pop('profiles', [])
+        models = request_analysis.pop('models', None)
+        profiles = request_analysis.pop('profiles', None)
 
-        # accumulate data
-        analysis_data.update(request_analysis.items())
-
-        # validate analysis data
-        data, errors = analysis_schema.load(analysis_data)
-        if errors:
-            validation_failed(errors)
+        # validate given analysis fields
+        data, version = load_partial(AnalysisSchema(), request_analysis)
 
         # validate nested objects
-        model_schema = ModelBaseSchema(many=True)
-        profile_schema = ProfileBaseSchema(many=True)
-        models, models_errors = model_schema.load(models)
-        profiles, profiles_errors = profile_schema.load(profiles)
+        if models is not None:
+            models, models_errors = ModelBaseSchema(many=True).load(models)
+            if models_errors:
+                validation_failed({'models': models_errors})
+        if profiles is not None:
+            profiles, profiles_errors = ProfileBaseSchema(many=True).load(profiles)
+            if profiles_errors:
+                validation_failed({'profiles': profiles_errors})
 
         # update analysis
         analysis.update(data, models, profiles)
-        db.session.commit()
+        commit_versioned(analysis, version)
 
         # return analysis
         analysis_schema = AnalysisSchema()
@@ -270,7 +421,7 @@ class AnalysisApi(Resource):
         return analysis_data, 200
 
     def delete(self, analysis_id):
-        analysis = Analysis.query.get(analysis_id)
+        analysis = get_hot(Analysis, analysis_id)
         if analysis is None or analysis.deleted:
             resource_does_not_exist()
         analysis.deleted = True
@@ -281,23 +432,26 @@ class AnalysisApi(Resource):
 @api.resource('/models', endpoint='models')
 class ModelListApi(Resource):
 
+    @idempotent
     def post(self):
         schema = ModelSchema()
         data, errors = schema.load(request.get_json())
         if errors:
             validation_failed(errors)
-        analysis = Analysis.query.get(data.get("analysis_id"))
+        analysis = get_hot(Analysis, data.get("analysis_id"))
         if analysis is None or analysis.deleted:
             raise Exception("Related analysis doesn't exist.")
-        if analysis.analysis_status_id != ModelStatus.draft_id():
+        if analysis.status_name() != ModelStatus.DRAFT:
             raise Exception("Analysis must be a draft to add models.")
-        if Model.query.filter_by(analysis_id=data['analysis_id'], model_type_id=data['model_type_id']).first():
-            raise Exception("Can't add multiple models of the same type to one analysis.")
         model_status_id = ModelStatus.draft_id()
         weight = data.pop('weight')
         model = Model(status_id=model_status_id, **data)
         db.session.add(model)
-        db.session.flush()
+        try:
+            db.session.flush()
+        except IntegrityError:      # unique per analysis
+            db.session.rollback()
+            raise Exception("Can't add multiple models of the same type to one analysis.")
         model_weight = ModelWeight(weight=weight, child_model_id=model.id, model_id=model.id)
         db.session.add(model_weight)
         db.session.commit()
@@ -309,7 +463,7 @@ class ModelListApi(Resource):
 class ModelApi(Resource):
 
     def delete(self, model_id):
-        model = Model.query.get(model_id)
+        model = get_hot(Model, model_id)
         if model is None or model.analysis.deleted:
             resource_does_not_exist()
         if model.analysis.analysis_status_id != ModelStatus.draft_id():
@@ -322,20 +476,24 @@ class ModelApi(Resource):
 @api.resource('/profiles', endpoint='profiles')
 class ProfileListApi(Resource):
 
+    @idempotent
     def post(self):
         schema = ProfileSchema()
         data, errors = schema.load(request.get_json())
         if errors:
             validation_failed(errors)
-        analysis = Analysis.query.get(data.get("analysis_id"))
+        analysis = get_hot(Analysis, data.get("analysis_id"))
         if analysis is None or analysis.deleted:
             raise Exception("Related analysis doesn't exist.")
-        if analysis.analysis_status_id != ModelStatus.draft_id():
+        if analysis.status_name() != ModelStatus.DRAFT:
             raise Exception("Analysis must be a draft to add profiles.")
-        if Profile.query.filter_by(analysis_id=data['analysis_id'], person_type_id=data['person_type_id']).first():
-            raise Exception("Can't add multiple profiles of the same type to one analysis.")
         profile = Profile(**data)
         db.session.add(profile)
+        try:
+            db.session.flush()
+        except IntegrityError:      # unique per analysis
+            db.session.rollback()
+            raise Exception("Can't add multiple profiles of the same type to one analysis.")
         db.session.commit()
         data, _ = schema.dump(profile)
         return data, 201
@@ -345,7 +503,7 @@ class ProfileListApi(Resource):
 class ProfileApi(Resource):
 
     def delete(self, profile_id):
-        profile = Profile.query.get(profile_id)
+        profile = get_hot(Profile, profile_id)
         if profile is None or profile.analysis.deleted:
             resource_does_not_exist()
         if profile.analysis.analysis_status_id != ModelStatus.draft_id():
@@ -355,8 +513,98 @@ class ProfileApi(Resource):
         return None, 204
 
 
+@api.resource('/results/<string:result_id>', endpoint='results')
+class ResultCallbackApi(Resource):
+
+    @staticmethod
+    def _authorize():
+        token = current_app.config.get('MONTRACKER_CALLBACK_TOKEN')
+        header = request.headers.get('Authorization', '')
+        if not token or not hmac.compare_digest(header.encode('utf8'), 'Token {}'.format(token).encode('utf8')):
+            unauthorized()
+
+    def post(self, result_id):
+        """
+        Callback for the Calculation Server pushing status transitions of computed result.
+        Repeated callbacks are harmless, see `Model.apply_server_result`.
+        """
+        self._authorize()
+        data, errors = ResultCallbackSchema().load(request.get_json())
+        if errors:
+            validation_failed(errors)
+        models = Model.by_result_id(result_id).all()
+        if not models:
+            resource_does_not_exist()
+        updated = [model.id for model in models if model.apply_server_result(data)]
+        StatusTransition.log_analyses({model.analysis_id for model in models if model.id in updated})
+        db.session.commit()
+        if updated and data['status'] in (cs_utils.FINISHED, cs_utils.ERROR):
+            observe_detection_lag(data, 'callback')
+        return {'updated': updated}, 200
+
+
+def _notifications_query_data():
+    data, errors = NotificationQuerySchema().load(request.args)
+    if errors:
+        validation_failed(errors)
+    return data.get('since'), data.get('limit') or current_app.config['NOTIFICATIONS_PAGE_SIZE']
+
+
 @api.resource('/notifications', endpoint='notifications')
 class NotificationsApi(Resource):
 
+    @read_replica
+    def get(self):
+        """
+        Returns status transitions with sequence number (`id`) greater than `since`, up to the first
+        gap of uncommitted ones (see `StatusTransition.settled`). Without `since` returns the latest transitions.
+        """
+        since, limit = _notifications_query_data()
+        if since is None:
+            transitions = StatusTransition.query.order_by(StatusTransition.id.desc()).limit(limit).all()[::-1]
+        else:
+            transitions = StatusTransition.settled(StatusTransition.since(since, limit).all(), since,
+                                                   current_app.config['NOTIFICATIONS_GAP_WAIT_SEC'])
+        data, _ = NotificationSchema(many=True).dump(transitions)
+        return data, 200
+
+
+@api.resource('/notifications/stream', endpoint='notifications_stream')
+class NotificationsStreamApi(Resource):
+
     def get(self):
-        return [], 200
+        """
+        Server-Sent Events stream of status transitions. Resumes after `Last-Event-ID`
+        header (or `since` argument) and closes after `NOTIFICATIONS_STREAM_TIMEOUT_SEC`,
+        EventSource clients then reconnect automatically. It occupies a sync worker while open,
+        so the timeout is kept short. Transitions are sent in order of ids, see `StatusTransition.settled`.
+        """
+        since, limit = _notifications_query_data()
+        last_event_id = request.headers.get('Last-Event-ID')
+        if last_event_id and last_event_id.isdigit():
+            since = int(last_event_id)
+        if since is None:
+            since = db.session.query(db.func.coalesce(db.func.max(StatusTransition.id), 0)).scalar()
+        poll_interval = current_app.config['NOTIFICATIONS_STREAM_POLL_SEC']
+        deadline = time.time() + current_app.config['NOTIFICATIONS_STREAM_TIMEOUT_SEC']
+        gap_wait = current_app.config['NOTIFICATIONS_GAP_WAIT_SEC']
+        schema = NotificationSchema()
+
+        def events(sequence):
+            yield 'retry: {}\n\n'.format(int(poll_interval * 1000))
+            while True:
+                transitions = StatusTransition.settled(StatusTransition.since(sequence, limit).all(), sequence,
+                                                       gap_wait)
+                db.session.close()      # do not keep connection while waiting
+                for transition in transitions:
+                    data, _ = schema.dump(transition)
+                    sequence = transition.id
+                    yield 'id: {}\nevent: transition\ndata: {}\n\n'.format(sequence, json.dumps(data))
+                if time.time() >= deadline:
+                    return
+                if not transitions:
+                    yield ': keep-alive\n\n'
+                    time.sleep(poll_interval)
+
+        return Response(stream_with_context(events(since)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
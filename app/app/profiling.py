@@ -0,0 +1,246 @@
+"""
+Opt-in profiling of single requests.
+
+With `PROFILING_ENABLED` and `PROFILING_TOKEN` set, a request carrying
+`X-Profile: <PROFILING_TOKEN>` is profiled and its profile is written to
+`PROFILING_DIR` (`instance/profiles` by default); the file name is returned in
+the `X-Profile-Id` response header. `PROFILING_MODE` selects the profiler:
+
+* `'cprofile'` – deterministic `cProfile`, saved as `.pstats`,
+* `'sample'` – stack of the request thread sampled every `PROFILING_SAMPLE_INTERVAL_SEC`,
+  saved as collapsed stacks (`.folded`, the input of flamegraph.pl and speedscope).
+
+Oldest profiles are removed when the directory grows over `PROFILING_MAX_MB`.
+Profiles are listed and rendered with `python manage.py profiles`.
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+import zlib
+from xml.sax.saxutils import escape
+from flask import g, request
+
+HEADER = 'X-Profile'
+EXTENSIONS = ('.pstats', '.folded')
+
+# only one request is profiled at a time, others run as usual
+_lock = threading.Lock()
+
+
+class StackSampler(object):
+    """
+    Samples the call stack of one thread from a background thread.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler')
+        self._thread.daemon = True
+
+    @staticmethod
+    def frame_name(frame):
+        return '{}:{}'.format(frame.f_globals.get('__name__', '?'), frame.f_code.co_name)
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        names = []
+        while frame is not None:
+            names.append(self.frame_name(frame))
+            frame = frame.f_back
+        if names:
+            stack = ';'.join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w') as output:
+            for stack, count in sorted(self.stacks.items()):
+                output.write('{} {}\n'.format(stack, count))
+
+
+class CProfiler(object):
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+
+def profile_dir(app):
+    return app.config.get('PROFILING_DIR') or os.path.join(app.instance_path, 'profiles')
+
+
+def list_profiles(directory):
+    """
+    :return: list of (name, size in bytes, modification time) of profiles, newest first
+    """
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if name.endswith(EXTENSIONS):
+            stat = os.stat(os.path.join(directory, name))
+            profiles.append((name, stat.st_size, stat.st_mtime))
+    return sorted(profiles, key=lambda profile: profile[2], reverse=True)
+
+
+def rotate(directory, max_bytes):
+    """Removes oldest profiles until all of them fit in `max_bytes`."""
+    total = 0
+    for name, size, _ in list_profiles(directory):
+        total += size
+        if total > max_bytes:
+            os.remove(os.path.join(directory, name))
+
+
+def _authorized(app):
+    token = app.config.get('PROFILING_TOKEN')
+    header = request.headers.get(HEADER)
+    return bool(token and header) and hmac.compare_digest(header.encode('utf8'), token.encode('utf8'))
+
+
+def init_profiling(app):
+    if not app.config['PROFILING_ENABLED']:
+        return
+
+    @app.before_request
+    def start_profiler():
+        if not _authorized(app) or not _lock.acquire(False):
+            return
+        if app.config['PROFILING_MODE'] == 'sample':
+            profiler = StackSampler(threading.get_ident(), app.config['PROFILING_SAMPLE_INTERVAL_SEC'])
+        else:
+            profiler = CProfiler()
+        g.profiler, g.profile_start = profiler, time.time()
+        profiler.start()
+
+    @app.after_request
+    def save_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        try:
+            profiler.stop()
+            directory = profile_dir(app)
+            os.makedirs(directory, exist_ok=True)
+            name = '{}-{}-{}-{}ms-{}{}'.format(
+                time.strftime('%Y%m%d-%H%M%S', time.localtime(g.profile_start)), request.method,
+                request.endpoint or 'unknown', int((time.time() - g.profile_start) * 1000), uuid.uuid4().hex[:8],
+                '.folded' if isinstance(profiler, StackSampler) else '.pstats')
+            profiler.write(os.path.join(directory, name))
+            rotate(directory, app.config['PROFILING_MAX_MB'] * 1024 * 1024)
+            response.headers['X-Profile-Id'] = name
+        finally:
+            _lock.release()
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exception=None):
+        profiler = g.pop('profiler', None)     # request failed before after_request
+        if profiler is not None:
+            profiler.stop()
+            _lock.release()
+
+
+# rendering
+#
+
+def render_pstats(path, limit=30, sort='cumulative'):
+    output = io.StringIO()
+    pstats.Stats(path, stream=output).strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+def read_folded(path):
+    stacks = []
+    with open(path) as folded:
+        for line in folded:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                stacks.append((stack.split(';'), int(count)))
+    return stacks
+
+
+def render_folded(path, limit=30):
+    """Text summary of collapsed stacks: functions by inclusive and by own (leaf) samples."""
+    stacks = read_folded(path)
+    total = sum(count for _, count in stacks) or 1
+    inclusive, own = {}, {}
+    for frames, count in stacks:
+        for name in set(frames):
+            inclusive[name] = inclusive.get(name, 0) + count
+        own[frames[-1]] = own.get(frames[-1], 0) + count
+    lines = ['{} samples'.format(total)]
+    for title, counts in (('inclusive', inclusive), ('own', own)):
+        lines.append('')
+        lines.append('{:>7} {:>6}  function ({})'.format('samples', '%', title))
+        for name, count in sorted(counts.items(), key=lambda item: -item[1])[:limit]:
+            lines.append('{:>7} {:>5.1f}%  {}'.format(count, 100.0 * count / total, name))
+    return '\n'.join(lines) + '\n'
+
+
+def flamegraph_svg(stacks, width=1200, frame_height=16):
+    """
+    Renders collapsed stacks as a flame graph: root at the bottom, frame widths proportional to samples.
+    """
+    root = {'children': {}, 'count': 0}
+    for frames, count in stacks:
+        node = root
+        node['count'] += count
+        for name in frames:
+            node = node['children'].setdefault(name, {'children': {}, 'count': 0})
+            node['count'] += count
+
+    def depth(node):
+        return 1 + max([depth(child) for child in node['children'].values()] or [0])
+
+    height = (depth(root) - 1) * frame_height
+    total = float(root['count'] or 1)
+    rects = []
+
+    def draw(node, x, level):
+        for name, child in sorted(node['children'].items()):
+            child_width = width * child['count'] / total
+            y = height - (level + 1) * frame_height
+            label = escape(name)
+            title = '{} ({} samples, {:.1f}%)'.format(label, child['count'], 100 * child['count'] / total)
+            hue = 20 + zlib.crc32(name.split(':')[0].encode('utf8')) % 40
+            rects.append('<g><title>{}</title><rect x="{:.2f}" y="{}" width="{:.2f}" height="{}" '
+                         'fill="hsl({}, 90%, 60%)" stroke="white"/>'.format(title, x, y, child_width,
+                                                                           frame_height - 1, hue))
+            if child_width > 40:
+                rects.append('<text x="{:.2f}" y="{}" font-size="11" font-family="monospace">{}</text>'.format(
+                    x + 3, y + frame_height - 4, label[:int(child_width / 7)]))
+            rects.append('</g>')
+            draw(child, x, level + 1)
+            x += child_width
+
+    draw(root, 0.0, 0)
+    return ('<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}">\n{}\n</svg>\n'.format(
+        width, height, '\n'.join(rects)))
@@ -1,18 +1,15 @@
-from app.processor.models import Model
+import atexit
+import datetime
+from app.jobs import election, enqueue, start_workers
+from app.processor import tasks     # registers processor jobs
 from pytz import utc
 
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
-from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
+from apscheduler.executors.pool import ThreadPoolExecutor
 
 
-jobstores = {
-    'default': SQLAlchemyJobStore(url='sqlite:///jobs.sqlite')
-}
-
 executors = {
     'default': ThreadPoolExecutor(1),
-    'processpool': ProcessPoolExecutor(1)
 }
 
 job_defaults = {
@@ -21,4 +18,59 @@ job_defaults = {
 }
 
 
-scheduler = BackgroundScheduler(jobstores=jobstores, executors=executors, job_defaults=job_defaults, timezone=utc)
+# local timers only: they renew scheduler lease and let the leader enqueue
+# periodic jobs, which are executed by `jobs.queue` workers of all processes
+scheduler = BackgroundScheduler(executors=executors, job_defaults=job_defaults, timezone=utc)
+workers = []
+
+
+def poll_interval(config):
+    """
+    With result callbacks enabled polling is only a fallback for missed callbacks.
+    """
+    if config['MONTRACKER_CALLBACK_URL'] and config['MONTRACKER_CALLBACK_TOKEN']:
+        return config['SCH_FALLBACK_INTERVAL_SEC']
+    return config['SCH_INTERVAL_SEC']
+
+
+def configure_scheduler(app):
+    """
+    Registers background jobs of given app. Every process renews its scheduler lease,
+    but periodic jobs are enqueued only by the elected leader, so multiple workers
+    (e.g. under gunicorn) never poll and update the same models concurrently.
+    """
+    election.configure(app.config)
+
+    def renew_leadership():
+        with app.app_context():
+            election.acquire()
+
+    def periodic(name, priority=0, visibility_timeout=None):
+        def enqueue_job():
+            if not election.is_leader:
+                return
+            with app.app_context():
+                enqueue(name, priority=priority, unique=True, visibility_timeout=visibility_timeout)
+        return enqueue_job
+
+    def release_leadership():
+        with app.app_context():
+            election.release()
+
+    scheduler.add_job(renew_leadership, 'interval', seconds=app.config['SCH_LEADER_RENEW_SEC'],
+                      id='renew_leadership', replace_existing=True,
+                      next_run_time=datetime.datetime.now(utc))
+    # a poll of a dead worker is claimed again within two intervals, not blocking next polls for long
+    interval = poll_interval(app.config)
+    scheduler.add_job(periodic('check_server', priority=10, visibility_timeout=2 * interval), 'interval',
+                      seconds=interval, id='check_server', replace_existing=True)
+    scheduler.add_job(periodic('archive_actions'), 'interval', seconds=app.config['ARCHIVE_INTERVAL_SEC'],
+                      id='archive_actions', replace_existing=True)
+    scheduler.add_job(periodic('purge'), 'interval', seconds=app.config['PURGE_INTERVAL_SEC'],
+                      id='purge', replace_existing=True)
+    atexit.register(release_leadership)
+
+
+def start_scheduler(app):
+    scheduler.start()
+    workers.extend(start_workers(app))
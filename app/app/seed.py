@@ -0,0 +1,153 @@
+"""
+Synthetic dataset generator for benchmarks and manual performance testing.
+
+Creates actions with complete analyses (7 simple and 2 complex models with
+weights, chosen profiles and layers of finished results) using multi-row
+inserts, committed every `chunk` actions. The same `random_seed` and sizes
+always give the same data, so benchmark results of different commits compare.
+"""
+import datetime
+import json
+import random
+from sqlalchemy import select, func, text
+from .processor import geo
+from .processor.models import Action, Analysis, Model, ModelWeight, Profile, ResultLayers, ModelType, \
+    ModelStatus, PersonType, store_statuses
+
+BASE_LATITUDE, BASE_LONGITUDE = 49.23, 19.98     # Tatra mountains
+LAYERS_PER_RESULT = 3
+
+
+class DatasetSeeder(object):
+
+    def __init__(self, session, analyses=5, profiles=2, random_seed=0, now=None):
+        """
+        :param analyses: analyses per action
+        :param profiles: profiles per analysis
+        """
+        self.session = session
+        self.analyses = analyses
+        self.profiles = profiles
+        self.random = random.Random(random_seed)
+        self.now = now or datetime.datetime(2017, 1, 1)
+        self.statuses = {status.name: status.id for status in ModelStatus.query}
+        self.simple_types = [t.id for t in ModelType.query.filter_by(complex=False).order_by(ModelType.id)]
+        self.complex_types = [t.id for t in ModelType.query.filter_by(complex=True).order_by(ModelType.id)]
+        self.person_types = [t.id for t in PersonType.query.order_by(PersonType.id)]
+        if profiles > len(self.person_types):
+            raise ValueError('At most {} profiles per analysis are possible'.format(len(self.person_types)))
+        self.next_ids = {table.name: (session.execute(select([func.max(table.c.id)])).scalar() or 0) + 1
+                         for table in (Action.__table__, Analysis.__table__, Model.__table__,
+                                       ModelWeight.__table__, Profile.__table__)}
+
+    def _id(self, table):
+        row_id = self.next_ids[table.name]
+        self.next_ids[table.name] += 1
+        return row_id
+
+    def _point(self, spread=0.2):
+        return (round(BASE_LATITUDE + self.random.uniform(-spread, spread), 6),
+                round(BASE_LONGITUDE + self.random.uniform(-spread, spread), 6))
+
+    def _analysis_statuses(self, count):
+        """Model statuses of one analysis: mostly finished, some drafts, rare errors and computations."""
+        draw = self.random.random()
+        finished = self.statuses[ModelStatus.FINISHED]
+        if draw < 0.8:
+            return [finished] * count
+        if draw < 0.9:
+            return [self.statuses[ModelStatus.DRAFT]] * count
+        if draw < 0.95:
+            return [self.statuses[ModelStatus.ERROR]] + [finished] * (count - 1)
+        return [self.statuses[ModelStatus.PROCESSING]] * count
+
+    def rows(self, actions):
+        """
+        :return: dict of row lists by table name, in insert order
+        """
+        rows = {name: [] for name in ('actions', 'analyses', 'models', 'model_weights', 'profiles',
+                                      'result_layers')}
+        for _ in range(actions):
+            created = self.now - datetime.timedelta(minutes=self.random.randint(0, 365 * 24 * 60))
+            action_id = self._id(Action.__table__)
+            ipp, rp = self._point(), self._point()
+            lost_time = created - datetime.timedelta(hours=self.random.randint(1, 48))
+            rows['actions'].append({
+                'id': action_id, 'name': 'Action {}'.format(action_id), 'description': None,
+                'ipp_latitude': ipp[0], 'ipp_longitude': ipp[1], 'rp_latitude': rp[0], 'rp_longitude': rp[1],
+                'ipp_cell': geo.cell(*ipp), 'rp_cell': geo.cell(*rp), 'lost_time': lost_time,
+                'creation_time': created, 'updated_at': created,
+                'deleted': self.random.random() < 0.02, 'archived': self.random.random() < 0.3})
+            distances, bearings = geo.ipp_rp(ipp[0], ipp[1], rp[0], rp[1])
+            for index in range(self.analyses):
+                self._add_analysis(rows, action_id, created + datetime.timedelta(minutes=index), ipp, rp, lost_time,
+                                   (distances[0], bearings[0]))
+        return rows
+
+    def _add_analysis(self, rows, action_id, created, ipp, rp, lost_time, geometry):
+        analysis_id = self._id(Analysis.__table__)
+        rows['analyses'].append({
+            'id': analysis_id, 'action_id': action_id, 'name': 'Analysis {}'.format(analysis_id),
+            'description': None, 'ipp_latitude': ipp[0], 'ipp_longitude': ipp[1],
+            'rp_latitude': rp[0], 'rp_longitude': rp[1], 'lost_time': None, 'active': True,
+            'deleted': False, 'creation_time': created, 'updated_at': created,
+            'effective_ipp_latitude': ipp[0], 'effective_ipp_longitude': ipp[1],
+            'effective_rp_latitude': rp[0], 'effective_rp_longitude': rp[1], 'effective_lost_time': lost_time,
+            'effective_ipp_cell': geo.cell(*ipp), 'effective_rp_cell': geo.cell(*rp),
+            'ipp_rp_distance_km': geometry[0], 'ipp_rp_bearing': geometry[1]})
+
+        model_types = self.simple_types + self.complex_types
+        statuses = self._analysis_statuses(len(model_types))
+        model_ids = []
+        for model_type_id, status_id in zip(model_types, statuses):
+            model_id = self._id(Model.__table__)
+            model_ids.append(model_id)
+            result_id = None
+            if status_id != self.statuses[ModelStatus.DRAFT]:
+                result_id = 'seed-{}'.format(model_id)
+                if status_id == self.statuses[ModelStatus.FINISHED]:
+                    rows['result_layers'].append({'result_id': result_id, 'layer_ids': json.dumps(
+                        [str(model_id * LAYERS_PER_RESULT + i) for i in range(LAYERS_PER_RESULT)])})
+            rows['models'].append({'id': model_id, 'analysis_id': analysis_id, 'model_type_id': model_type_id,
+                                   'status_id': status_id, 'result_id': result_id, 'updated_at': created})
+
+        simple_ids, complex_ids = model_ids[:len(self.simple_types)], model_ids[len(self.simple_types):]
+        for simple_id in simple_ids:
+            weight = self.random.randint(1, 10)
+            for complex_id in complex_ids:
+                rows['model_weights'].append({'id': self._id(ModelWeight.__table__), 'model_id': simple_id,
+                                              'child_model_id': complex_id, 'weight': weight})
+        for person_type_id in self.random.sample(self.person_types, self.profiles):
+            rows['profiles'].append({'id': self._id(Profile.__table__), 'analysis_id': analysis_id,
+                                     'person_type_id': person_type_id, 'weight': self.random.randint(1, 10)})
+
+    def insert(self, actions, chunk=500):
+        """
+        Inserts `actions` new actions with their subtrees.
+
+        :return: dict of inserted row counts by table name
+        """
+        counts = {}
+        tables = {table.name: table for table in (Action.__table__, Analysis.__table__, Model.__table__,
+                                                  ModelWeight.__table__, Profile.__table__,
+                                                  ResultLayers.__table__)}
+        while actions > 0:
+            rows = self.rows(min(chunk, actions))
+            for name, table_rows in rows.items():
+                if table_rows:
+                    self.session.execute(tables[name].insert(), table_rows)
+                counts[name] = counts.get(name, 0) + len(table_rows)
+            store_statuses(self.session, [row['id'] for row in rows['actions']])
+            self.session.commit()
+            actions -= chunk
+        self._sync_sequences()
+        return counts
+
+    def _sync_sequences(self):
+        """Rows were inserted with explicit ids, PostgreSQL sequences have to follow them."""
+        if self.session.bind.dialect.name != 'postgresql':
+            return
+        for name in self.next_ids:
+            self.session.execute(text(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), (SELECT max(id) FROM {0}))".format(name)))
+        self.session.commit()
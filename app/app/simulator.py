@@ -0,0 +1,326 @@
+# coding: utf-8
+"""
+Local stand-in for the Calculation Server.
+
+Implements the endpoints used by `processor.cs_utils` (`/analysis`, `/complex_analysis`
+and `/analysis/<id>`) with configurable latency, computation durations, error rates
+and layer counts, so the poller and `Analysis.start_computation` can be exercised
+end-to-end without the real server. If request contains `callback_url`, status
+transitions are also pushed to `<callback_url>/<result_id>`.
+"""
+import json
+import random
+import threading
+import time
+from urllib import request as urllib_request, error as urllib_error
+from flask import Flask, request, Response
+from werkzeug.serving import make_server
+from .processor import cs_utils
+
+
+STAGES = (cs_utils.WAITING, cs_utils.COMPUTING, cs_utils.LOADING, cs_utils.CONVERTING)
+
+
+class Distribution(object):
+    """
+    Random duration in seconds described by a tuple: `(kind, *params)`.
+
+    Supported kinds: `('constant', value)`, `('uniform', low, high)`, `('normal', mu, sigma)`,
+    `('lognormal', mu, sigma)` and `('exponential', mean)`. Plain numbers are treated as constants.
+    """
+
+    KINDS = {
+        'constant': lambda rnd, value: value,
+        'uniform': lambda rnd, low, high: rnd.uniform(low, high),
+        'normal': lambda rnd, mu, sigma: rnd.normalvariate(mu, sigma),
+        'lognormal': lambda rnd, mu, sigma: rnd.lognormvariate(mu, sigma),
+        'exponential': lambda rnd, mean: rnd.expovariate(1.0 / mean) if mean else 0.0,
+    }
+
+    def __init__(self, spec):
+        if isinstance(spec, (int, float)):
+            spec = ('constant', spec)
+        kind, params = spec[0], tuple(spec[1:])
+        if kind not in self.KINDS:
+            raise ValueError('Unknown distribution: {}'.format(kind))
+        self.kind = kind
+        self.params = params
+
+    def sample(self, rnd):
+        return max(0.0, float(self.KINDS[self.kind](rnd, *self.params)))
+
+
+class SimulatorSettings(object):
+    """
+    Simulator behaviour. Each value can be overridden with keyword arguments or
+    taken from app config keys prefixed with `SIMULATOR_` (see `from_config`).
+    """
+
+    DEFAULTS = {
+        'latency': ('constant', 0.0),           # response delay of every request
+        'stage_durations': {                    # time spent in each server status
+            cs_utils.WAITING: ('uniform', 0.5, 2.0),
+            cs_utils.COMPUTING: ('uniform', 2.0, 6.0),
+            cs_utils.LOADING: ('uniform', 0.5, 2.0),
+            cs_utils.CONVERTING: ('uniform', 1.0, 3.0),
+        },
+        'error_rate': 0.0,                      # probability that a computation ends with error
+        'http_error_rate': 0.0,                 # probability that a request is answered with HTTP 500
+        'layers': (1, 4),                       # inclusive range of layer ids of finished model
+        'callback_token': None,                 # sent with pushed results as `Authorization: Token <token>`
+        'seed': None,
+    }
+
+    def __init__(self, **kwargs):
+        unknown = set(kwargs) - set(self.DEFAULTS)
+        if unknown:
+            raise TypeError('Unknown simulator settings: {}'.format(', '.join(sorted(unknown))))
+        values = dict(self.DEFAULTS, **kwargs)
+        self.latency = Distribution(values['latency'])
+        durations = dict(self.DEFAULTS['stage_durations'], **values['stage_durations'])
+        self.stage_durations = {stage: Distribution(spec) for stage, spec in durations.items()}
+        self.error_rate = values['error_rate']
+        self.http_error_rate = values['http_error_rate']
+        self.layers = values['layers']
+        self.callback_token = values['callback_token']
+        self.seed = values['seed']
+
+    @classmethod
+    def from_config(cls, config, **overrides):
+        values = {key: config['SIMULATOR_' + key.upper()]
+                  for key in cls.DEFAULTS if 'SIMULATOR_' + key.upper() in config}
+        values.update(overrides)
+        return cls(**values)
+
+
+class SimulatedComputation(object):
+
+    def __init__(self, result_id, model_name, submitted_at, schedule, final_status, layer_ids, callback_url=None):
+        self.result_id = result_id
+        self.model_name = model_name
+        self.submitted_at = submitted_at
+        self.schedule = schedule            # list of (status, seconds after submission)
+        self.final_status = final_status
+        self.layer_ids = layer_ids
+        self.callback_url = callback_url
+        self.notified_status = None
+
+    @property
+    def finished_at(self):
+        return self.submitted_at + self.schedule[-1][1]
+
+    def status_at(self, now):
+        elapsed = now - self.submitted_at
+        status = cs_utils.WAITING
+        for stage, start in self.schedule:
+            if elapsed >= start:
+                status = stage
+        return status
+
+    def result_at(self, now):
+        status = self.status_at(now)
+        result = {'status': status}
+        if status == cs_utils.FINISHED:
+            result['layer_ids'] = list(self.layer_ids)
+            result['finished_time'] = self.finished_at
+        elif status == cs_utils.ERROR:
+            result['finished_time'] = self.finished_at
+        return result
+
+
+class CalculationServerSimulator(object):
+    """
+    In-memory state of simulated computations. Thread safe, time source is injectable
+    so that tests can drive status progression without sleeping.
+    """
+
+    def __init__(self, settings=None, clock=time.time):
+        self.settings = settings or SimulatorSettings()
+        self.clock = clock
+        self.random = random.Random(self.settings.seed)
+        self.computations = {}
+        self.requests_count = 0
+        self._lock = threading.Lock()
+
+    def _new_result_id(self):
+        result_id = str(self.random.getrandbits(62))
+        while result_id in self.computations:
+            result_id = str(self.random.getrandbits(62))
+        return result_id
+
+    def _schedule(self):
+        schedule, offset = [], 0.0
+        failing = self.random.random() < self.settings.error_rate
+        for stage in STAGES:
+            schedule.append((stage, offset))
+            offset += self.settings.stage_durations[stage].sample(self.random)
+            if failing and stage == cs_utils.COMPUTING:
+                break
+        final_status = cs_utils.ERROR if failing else cs_utils.FINISHED
+        schedule.append((final_status, offset))
+        return schedule, final_status
+
+    def _layer_ids(self):
+        low, high = self.settings.layers
+        return [str(self.random.getrandbits(31)) for _ in range(self.random.randint(low, high))]
+
+    def submit(self, model_names, callback_url=None):
+        result_ids = {}
+        with self._lock:
+            now = self.clock()
+            for name in model_names:
+                result_id = self._new_result_id()
+                schedule, final_status = self._schedule()
+                self.computations[result_id] = SimulatedComputation(result_id, name, now, schedule,
+                                                                    final_status, self._layer_ids(), callback_url)
+                result_ids[name] = result_id
+        return result_ids
+
+    def due_callbacks(self):
+        """
+        Returns (url, payload) pairs for computations whose status changed since last callback.
+        """
+        callbacks = []
+        with self._lock:
+            now = self.clock()
+            for computation in self.computations.values():
+                if not computation.callback_url:
+                    continue
+                result = computation.result_at(now)
+                if result['status'] != computation.notified_status:
+                    computation.notified_status = result['status']
+                    url = '{}/{}'.format(computation.callback_url.rstrip('/'), computation.result_id)
+                    callbacks.append((url, result))
+        return callbacks
+
+    def notify(self):
+        for url, payload in self.due_callbacks():
+            headers = {'content-type': 'application/json'}
+            if self.settings.callback_token:
+                headers['Authorization'] = 'Token {}'.format(self.settings.callback_token)
+            req = urllib_request.Request(url, data=json.dumps(payload).encode('utf8'), headers=headers)
+            try:
+                urllib_request.urlopen(req, timeout=5).read()
+            except (urllib_error.URLError, OSError):
+                pass    # missed callbacks are recovered by the app's fallback poller
+
+    def result(self, result_id):
+        with self._lock:
+            computation = self.computations.get(result_id)
+            return computation.result_at(self.clock()) if computation is not None else None
+
+    def delete(self, result_id):
+        with self._lock:
+            return self.computations.pop(result_id, None) is not None
+
+    def pause(self):
+        """Simulates request latency and random server failures; returns False if request should fail."""
+        with self._lock:
+            self.requests_count += 1
+            delay = self.settings.latency.sample(self.random)
+            fail = self.random.random() < self.settings.http_error_rate
+        if delay:
+            time.sleep(delay)
+        return not fail
+
+
+def _json_response(data, status=200):
+    return Response(json.dumps(data), status=status, mimetype='application/json')
+
+
+def create_simulator(simulator=None, prefix='', api_version='v1'):
+    """
+    Creates Flask application serving simulated Calculation Server API under
+    `<prefix>/<api_version>`, matching `MONTRACKER_SERVER_ADDR` and `MONTRACKER_SERVER_API_VERSION`.
+    """
+    simulator = simulator or CalculationServerSimulator()
+    app = Flask(__name__)
+    app.simulator = simulator
+    base = '{}/{}'.format(prefix.rstrip('/'), api_version)
+
+    @app.before_request
+    def simulate_latency():
+        if not simulator.pause():
+            return _json_response({'message': 'Simulated server failure'}, 500)
+
+    @app.route(base + '/analysis', methods=['POST'])
+    def analysis():
+        data = request.get_json(force=True, silent=True) or {}
+        models = data.get('models')
+        if not models or not data.get('profiles') or 'ipp' not in data or 'rp' not in data:
+            return _json_response({'message': 'Incomplete analysis data'}, 400)
+        return _json_response(simulator.submit(models, data.get('callback_url')))
+
+    @app.route(base + '/complex_analysis', methods=['POST'])
+    def complex_analysis():
+        data = request.get_json(force=True, silent=True) or {}
+        model_weights, models = data.get('model_weights') or {}, data.get('complex_analyses')
+        if not models:
+            return _json_response({'message': 'No complex analyses requested'}, 400)
+        for weight in model_weights.values():
+            if weight.get('id') not in simulator.computations:
+                return _json_response({'message': 'Unknown simple model result {}'.format(weight.get('id'))}, 400)
+        return _json_response(simulator.submit(models, data.get('callback_url')))
+
+    @app.route(base + '/analysis/<result_id>', methods=['GET', 'DELETE'])
+    def analysis_result(result_id):
+        if request.method == 'DELETE':
+            found = simulator.delete(result_id)
+            return _json_response({}, 200 if found else 404)
+        result = simulator.result(result_id)
+        if result is None:
+            return _json_response({'message': 'Unknown result id'}, 404)
+        return _json_response(result)
+
+    return app
+
+
+class SimulatorServer(object):
+    """
+    Runs simulator application in a background thread, e.g. inside a test or benchmark::
+
+        with SimulatorServer(CalculationServerSimulator(settings)) as server:
+            app.config['MONTRACKER_SERVER_ADDR'] = server.url
+    """
+
+    def __init__(self, simulator=None, host='127.0.0.1', port=0, prefix='', api_version='v1', callback_interval=0.2):
+        self.app = create_simulator(simulator, prefix=prefix, api_version=api_version)
+        self.simulator = self.app.simulator
+        self.prefix = prefix.rstrip('/')
+        self._server = make_server(host, port, self.app, threaded=True)
+        self._thread = None
+        self._notifier = None
+        self._stopped = threading.Event()
+        self.callback_interval = callback_interval
+
+    @property
+    def url(self):
+        return 'http://{}:{}{}'.format(self._server.server_address[0], self._server.server_port, self.prefix)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        if self.callback_interval:
+            self._notifier = threading.Thread(target=self._notify_forever)
+            self._notifier.daemon = True
+            self._notifier.start()
+        return self
+
+    def _notify_forever(self):
+        while not self._stopped.wait(self.callback_interval):
+            self.simulator.notify()
+
+    def stop(self):
+        self._stopped.set()
+        if self._notifier is not None:
+            self._notifier.join()
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
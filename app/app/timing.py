@@ -0,0 +1,78 @@
+"""
+Server-Timing breakdown of API responses.
+
+Time of a request is split into phases: `db` (SQL statements), `validation`
+(schema `load`), `serialization` (schema `dump`), `cs` (Calculation Server
+calls) and `total`. Phases do not overlap: statements run within a phase (e.g.
+lazy loads during serialization) count in `db` only and a phase nested in
+another one only in the inner phase, so `db` and the phases add up to at most
+`total`. The breakdown is returned in the `Server-Timing` header
+(shown by browser devtools) and logged by gunicorn as part of the access log
+line (`%({server-timing}o)s` in `gunicorn.sh`). Enabled by `SERVER_TIMING`.
+"""
+import time
+from contextlib import contextmanager
+from flask import g, current_app, has_app_context
+from . import instrumentation
+
+HEADER = 'Server-Timing'
+PHASES = ('validation', 'serialization', 'cs')
+
+
+class Timings(object):
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.active = set()
+        self.sql_stats = instrumentation.push()
+
+    def header(self):
+        metrics = ['db;desc="{} queries";dur={:.2f}'.format(self.sql_stats.count, self.sql_stats.duration_ms)]
+        metrics.extend('{};dur={:.2f}'.format(phase, self.durations[phase] * 1000) for phase in PHASES)
+        metrics.append('total;dur={:.2f}'.format((time.perf_counter() - self.start) * 1000))
+        return ', '.join(metrics)
+
+
+@contextmanager
+def timed(phase):
+    """
+    Adds duration of the block to `phase` of the current request, without time of SQL statements
+    and of other phases nested in it. Nested blocks of the same phase (e.g. dump of a nested schema)
+    are counted once, outside of requests the block just runs.
+    """
+    timings = g.get('timings') if has_app_context() else None
+    if timings is None or phase in timings.active:
+        yield
+        return
+    timings.active.add(phase)
+    start = time.perf_counter()
+    excluded = timings.sql_stats.duration + sum(timings.durations.values())
+    try:
+        yield
+    finally:
+        excluded = timings.sql_stats.duration + sum(timings.durations.values()) - excluded
+        timings.durations[phase] += max(time.perf_counter() - start - excluded, 0.0)
+        timings.active.discard(phase)
+
+
+def init_server_timing(blueprint):
+
+    @blueprint.before_request
+    def start_timings():
+        if current_app.config['SERVER_TIMING']:
+            g.timings = Timings()
+
+    @blueprint.after_request
+    def add_timing_header(response):
+        timings = g.get('timings')
+        if timings is not None:
+            response.headers[HEADER] = timings.header()
+            response.headers['Timing-Allow-Origin'] = '*'
+        return response
+
+    @blueprint.teardown_request
+    def stop_timings(exception=None):
+        timings = g.pop('timings', None)
+        if timings is not None:
+            instrumentation.pop(timings.sql_stats)
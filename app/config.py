@@ -16,10 +16,58 @@ class Config(object):
     USE_STATIC_FOLDER = False
     ACTIVATE_SCHEDULER = True
     SCH_INTERVAL_SEC = 10
+    SCH_FALLBACK_INTERVAL_SEC = 120     # poller interval used when Calculation Server pushes results
+    SCH_LEADER_TTL_SEC = 15             # poller leadership expires if not renewed, e.g. when its process dies
+    SCH_LEADER_RENEW_SEC = 5
+    JOB_WORKER_THREADS = 2              # job queue workers per process
+    JOB_VISIBILITY_TIMEOUT_SEC = 120    # claimed job is retried by other worker if not finished in this time
+    JOB_MAX_ATTEMPTS = 3
+    JOB_RETRY_DELAY_SEC = 5             # doubled on every failed attempt
+    JOB_POLL_INTERVAL_SEC = 1
+    MONTRACKER_CALLBACK_URL = None      # e.g. 'http://127.0.0.1:8084/app/api/v1/results'
+    MONTRACKER_CALLBACK_TOKEN = None    # shared secret required from the Calculation Server callbacks
+    SQLALCHEMY_READ_REPLICA_URI = None  # optional replica serving reads of GET endpoints
+    READ_YOUR_WRITES_SEC = 5            # client reads from primary this long after its own write
+    DELTA_SYNC_OVERLAP_SEC = 60         # `updated_since` reads back this much, for rows of transactions running meanwhile
+    REPLICA_MAX_LAG_SEC = 2             # replica lagging more than this is not used
+    REPLICA_LAG_CHECK_SEC = 5
+    ARCHIVE_AFTER_DAYS = 30             # archived and deleted actions are moved to archive tables after this time
+    ARCHIVE_BATCH_SIZE = 50             # actions moved by one archive job
+    ARCHIVE_INTERVAL_SEC = 3600
+    PURGE_RETENTION_DAYS = 90           # deleted actions and analyses are removed for good after this time
+    PURGE_BATCH_SIZE = 100              # purged items (with their subtrees) per transaction
+    PURGE_PAUSE_SEC = 0.5               # pause after every purge transaction
+    PURGE_MAX_BATCHES = 100             # per purge job, keep it well within JOB_VISIBILITY_TIMEOUT_SEC
+    PURGE_INTERVAL_SEC = 6 * 3600
+    IDEMPOTENCY_KEY_TTL_SEC = 24 * 3600  # responses of POST requests with Idempotency-Key are replayed this long
+    IDEMPOTENCY_LEASE_SEC = 300         # a retry takes over the key of a request still running after this long
+    GEO_DEFAULT_RADIUS_KM = 10          # radius of `near` searches without `radius_km`
+    CLUSTER_MAX_TILES = 64              # per /actions/clusters request, bounds its response size
+    CLUSTER_CACHE_TILES = 10000         # clustered tiles cached per process
+    METRICS_MULTIPROC_DIR = None        # directory shared by app processes (e.g. gunicorn workers) for /metrics
+    METRICS_FLUSH_SEC = 1               # how often a process shares its metric values in multiprocess mode
+    SQL_INSTRUMENTATION = False         # X-DB-Query-Count / X-DB-Time-Ms headers and `montracker.sql` log lines
+    SERVER_TIMING = False               # Server-Timing header of API responses (db, validation, serialization, cs)
+    PROFILING_ENABLED = False           # profile requests sent with `X-Profile: <PROFILING_TOKEN>` header
+    PROFILING_TOKEN = None
+    PROFILING_MODE = 'cprofile'         # or 'sample' for collapsed stacks (flame graphs)
+    PROFILING_SAMPLE_INTERVAL_SEC = 0.005
+    PROFILING_DIR = None                # defaults to instance/profiles
+    PROFILING_MAX_MB = 50               # oldest profiles are removed over this size
+    NOTIFICATIONS_PAGE_SIZE = 100
+    NOTIFICATIONS_STREAM_POLL_SEC = 1       # how often open event streams check for new status transitions
+    NOTIFICATIONS_STREAM_TIMEOUT_SEC = 5    # streams are closed after this time, clients reconnect
+    NOTIFICATIONS_GAP_WAIT_SEC = 5          # transitions after a gap in ids wait this long for it to be committed
+    BENCHMARK_DATABASE_URI = None       # scratch database recreated by `manage.py benchmark`
+    SIMULATOR_ADDR = '127.0.0.1'    # local Calculation Server stand-in (`manage.py simulator`)
+    SIMULATOR_PORT = 8700
+    SIMULATOR_PREFIX = '/server'
 
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    SQL_INSTRUMENTATION = True
+    SERVER_TIMING = True
 
 
 class ProductionConfig(Config):
@@ -29,4 +77,6 @@ class ProductionConfig(Config):
 class TestConfig(Config):
     DEBUG = False
     TESTING = True
+    SQL_INSTRUMENTATION = True
+    SERVER_TIMING = True
 
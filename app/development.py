@@ -1,21 +1,15 @@
 import logging
 
 from app import create_app
-from app.scheduler import scheduler
-from app.processor.models import Model
+from app.scheduler import configure_scheduler, start_scheduler
 
 
 app = create_app('config.DevelopmentConfig', config_pyfile='development.py')
 logging.basicConfig(level=logging.INFO)
 
-
-def check_server():
-    with app.app_context():
-        Model.update_state_from_server()
-
-job = scheduler.add_job(check_server, 'interval', seconds=app.config['SCH_INTERVAL_SEC'])
+configure_scheduler(app)
 
 if app.config['ACTIVATE_SCHEDULER']:
-    scheduler.start()
+    start_scheduler(app)
 
 app.run(host=app.config['SERVER_ADDR'], port=app.config['SERVER_PORT'], threaded=True)
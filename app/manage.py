@@ -2,7 +2,7 @@ from app.auth.models import User
 from app.processor.models import ModelStatus, PersonType, ModelType, ActionStatus
 from app.database import db
 from flask import url_for
-from flask_script import Manager, Command
+from flask_script import Manager, Command, Option
 from flask_migrate import Migrate, MigrateCommand
 from app import create_app
 from app.database import db
@@ -49,9 +49,203 @@ class SetupDatabase(Command):
         with app.app_context():
             setup_db(db.session)
 
+
+class RunSimulator(Command):
+    """
+    Runs local Calculation Server stand-in, e.g. for end-to-end performance testing.
+    Defaults are read from SIMULATOR_* config keys.
+    """
+
+    help = description = 'Runs simulated Calculation Server'
+
+    option_list = (
+        Option('--host', dest='host', default=None),
+        Option('--port', dest='port', type=int, default=None),
+        Option('--prefix', dest='prefix', default=None),
+        Option('--error-rate', dest='error_rate', type=float, default=None),
+        Option('--seed', dest='seed', type=int, default=None),
+    )
+
+    def run(self, host, port, prefix, error_rate, seed):
+        from app.simulator import CalculationServerSimulator, SimulatorSettings, create_simulator
+        overrides = {key: value for key, value in (('error_rate', error_rate), ('seed', seed)) if value is not None}
+        settings = SimulatorSettings.from_config(app.config, **overrides)
+        simulator = create_simulator(CalculationServerSimulator(settings),
+                                     prefix=prefix if prefix is not None else app.config['SIMULATOR_PREFIX'],
+                                     api_version=app.config['MONTRACKER_SERVER_API_VERSION'])
+        simulator.run(host=host or app.config['SIMULATOR_ADDR'],
+                      port=port or app.config['SIMULATOR_PORT'],
+                      threaded=True)
+
+
+class Purge(Command):
+    """
+    Runs the purge job once, e.g. to check its effect with --dry-run before enabling the scheduler.
+    """
+
+    help = description = 'Removes deleted actions and analyses older than PURGE_RETENTION_DAYS and orphaned rows'
+
+    option_list = (
+        Option('--dry-run', dest='dry_run', action='store_true', default=False),
+        Option('--retention-days', dest='retention_days', type=int, default=None),
+    )
+
+    def run(self, dry_run, retention_days):
+        from app.processor.purge import purge
+        with app.app_context():
+            reclaimed = purge(dry_run=dry_run, retention_days=retention_days)
+        for table, count in sorted(reclaimed.items()):
+            print('{}: {}'.format(table, count))
+
+
+class Backfill(Command):
+    """
+    Fills grid cells and IPP - RP distance and bearing of analyses and stored statuses of actions
+    written before these columns existed.
+    """
+
+    help = description = 'Computes values derived from coordinates of existing analyses and statuses of actions in chunks'
+
+    option_list = (
+        Option('--batch-size', dest='batch_size', type=int, default=1000),
+    )
+
+    def run(self, batch_size):
+        from app.processor.backfill import backfill
+        with app.app_context():
+            counts = backfill(batch_size=batch_size)
+        for table, count in sorted(counts.items()):
+            print('{}: {}'.format(table, count))
+
+
+class Seed(Command):
+    """
+    Only for using in development environment: adds synthetic actions to the configured database.
+    """
+
+    help = description = 'Adds N actions with M analyses (9 models, K profiles each) of synthetic data'
+
+    option_list = (
+        Option('--actions', dest='actions', type=int, default=1000),
+        Option('--analyses', dest='analyses', type=int, default=5),
+        Option('--profiles', dest='profiles', type=int, default=2),
+        Option('--seed', dest='seed', type=int, default=0),
+    )
+
+    def run(self, actions, analyses, profiles, seed):
+        from app.seed import DatasetSeeder
+        with app.app_context():
+            counts = DatasetSeeder(db.session, analyses, profiles, seed).insert(actions)
+        for table, count in counts.items():
+            print('{}: {}'.format(table, count))
+
+
+class Benchmark(Command):
+    """
+    Benchmarks API endpoints on synthetic datasets in BENCHMARK_DATABASE_URI, which is recreated for every size.
+    """
+
+    help = description = 'Measures latency, statements and memory of API endpoints for several dataset sizes'
+
+    option_list = (
+        Option('--sizes', dest='sizes', default='100,1000'),
+        Option('--requests', dest='requests', type=int, default=30),
+        Option('--output', dest='output', default='benchmarks'),
+        Option('--compare', dest='compare', default=None),
+    )
+
+    def run(self, sizes, requests, output, compare):
+        import json
+        from app.benchmark import run_benchmark, save_report, compare as compare_reports
+        if not app.config.get('BENCHMARK_DATABASE_URI'):
+            raise SystemExit('BENCHMARK_DATABASE_URI is not set, benchmark recreates its database')
+        benchmark_app = create_app('config.DevelopmentConfig', config_pyfile='development.py')
+        benchmark_app.config.update(SQLALCHEMY_DATABASE_URI=app.config['BENCHMARK_DATABASE_URI'],
+                                    SQLALCHEMY_READ_REPLICA_URI=None, SQLALCHEMY_BINDS=None,
+                                    DEBUG=False, SQLALCHEMY_ECHO=False)
+        report = run_benchmark(benchmark_app, [int(size) for size in sizes.split(',')], requests)
+        print('Saved to {}'.format(save_report(report, output)))
+        for result in report['results']:
+            print('{actions:>8} {endpoint:<26} p50 {p50_ms} ms, p95 {p95_ms} ms, {queries} queries, '
+                  '{peak_kib:.0f} KiB, {errors} errors'.format(**result))
+        if compare:
+            with open(compare) as previous:
+                print('\n'.join(compare_reports(json.load(previous), report)))
+
+
+class ListProfiles(Command):
+    """
+    Lists request profiles captured with `X-Profile` header, newest first.
+    """
+
+    help = description = 'Lists captured request profiles'
+
+    def run(self):
+        import datetime
+        from app.profiling import list_profiles, profile_dir
+        for name, size, mtime in list_profiles(profile_dir(app)):
+            print('{}  {:>8.1f} KiB  {}'.format(datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                                               size / 1024.0, name))
+
+
+class ShowProfile(Command):
+    """
+    Prints most expensive functions of a captured profile.
+    """
+
+    help = description = 'Renders captured request profile as text'
+
+    option_list = (
+        Option('name'),
+        Option('--limit', dest='limit', type=int, default=30),
+        Option('--sort', dest='sort', default='cumulative'),
+    )
+
+    def run(self, name, limit, sort):
+        import os
+        from app.profiling import profile_dir, render_pstats, render_folded
+        path = os.path.join(profile_dir(app), os.path.basename(name))
+        print(render_folded(path, limit) if path.endswith('.folded') else render_pstats(path, limit, sort))
+
+
+class ProfileFlamegraph(Command):
+    """
+    Renders sampled profile (collapsed stacks) as a flame graph.
+    """
+
+    help = description = 'Renders sampled request profile as SVG flame graph'
+
+    option_list = (
+        Option('name'),
+        Option('--output', dest='output', default=None),
+    )
+
+    def run(self, name, output):
+        import os
+        from app.profiling import profile_dir, read_folded, flamegraph_svg
+        path = os.path.join(profile_dir(app), os.path.basename(name))
+        if not path.endswith('.folded'):
+            raise SystemExit('Flame graphs are rendered from sampled profiles (PROFILING_MODE = \'sample\')')
+        output = output or os.path.basename(path)[:-len('.folded')] + '.svg'
+        with open(output, 'w') as svg:
+            svg.write(flamegraph_svg(read_folded(path)))
+        print('Saved to {}'.format(output))
+
+
+profiles = Manager(usage='Lists and renders request profiles')
+profiles.add_command('list', ListProfiles)
+profiles.add_command('show', ShowProfile)
+profiles.add_command('flamegraph', ProfileFlamegraph)
+
 manager.add_command('db', MigrateCommand)
 manager.add_command('routes', Routes)
 manager.add_command('setupdb', SetupDatabase)
+manager.add_command('simulator', RunSimulator)
+manager.add_command('purge', Purge)
+manager.add_command('seed', Seed)
+manager.add_command('backfill', Backfill)
+manager.add_command('benchmark', Benchmark)
+manager.add_command('profiles', profiles)
 
 
 if __name__ == '__main__':
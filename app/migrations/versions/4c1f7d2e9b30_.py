@@ -0,0 +1,28 @@
+"""empty message
+
+Revision ID: 4c1f7d2e9b30
+Revises: 550e330895c2
+Create Date: 2026-10-19 10:12:31.402113
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4c1f7d2e9b30'
+down_revision = '550e330895c2'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('scheduler_leases',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('holder', sa.String(length=256), nullable=False),
+    sa.Column('acquired_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('scheduler_leases')
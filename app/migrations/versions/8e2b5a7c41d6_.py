@@ -0,0 +1,39 @@
+"""empty message
+
+Revision ID: 8e2b5a7c41d6
+Revises: 4c1f7d2e9b30
+Create Date: 2026-10-19 11:40:02.918377
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8e2b5a7c41d6'
+down_revision = '4c1f7d2e9b30'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=128), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=True),
+    sa.Column('priority', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_by', sa.String(length=256), nullable=True),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_jobs_claim', 'jobs', ['status', 'priority', 'run_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_jobs_claim', table_name='jobs')
+    op.drop_table('jobs')
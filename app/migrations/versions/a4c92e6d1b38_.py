@@ -0,0 +1,80 @@
+"""empty message
+
+Revision ID: a4c92e6d1b38
+Revises: f3b71a9c5e20
+Create Date: 2026-10-19 17:24:09.512847
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a4c92e6d1b38'
+down_revision = 'f3b71a9c5e20'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('actions', sa.Column('cold', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.add_column('actions', sa.Column('cold_status_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('actions_cold_status_id_fkey', 'actions', 'model_statuses', ['cold_status_id'], ['id'])
+
+    op.create_table('archived_analyses',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('action_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=256), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('ipp_latitude', sa.Float(), nullable=True),
+    sa.Column('ipp_longitude', sa.Float(), nullable=True),
+    sa.Column('rp_latitude', sa.Float(), nullable=True),
+    sa.Column('rp_longitude', sa.Float(), nullable=True),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.Column('lost_time', sa.DateTime(), nullable=True),
+    sa.Column('creation_time', sa.DateTime(), nullable=False),
+    sa.Column('deleted', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_archived_analyses_action_id'), 'archived_analyses', ['action_id'], unique=False)
+    op.create_table('archived_models',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('analysis_id', sa.Integer(), nullable=False),
+    sa.Column('model_type_id', sa.Integer(), nullable=False),
+    sa.Column('status_id', sa.Integer(), nullable=False),
+    sa.Column('result_id', sa.CHAR(length=64), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_archived_models_analysis_id'), 'archived_models', ['analysis_id'], unique=False)
+    op.create_table('archived_profiles',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('analysis_id', sa.Integer(), nullable=False),
+    sa.Column('person_type_id', sa.Integer(), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_archived_profiles_analysis_id'), 'archived_profiles', ['analysis_id'], unique=False)
+    op.create_table('archived_model_weights',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('model_id', sa.Integer(), nullable=False),
+    sa.Column('child_model_id', sa.Integer(), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_archived_model_weights_model_id'), 'archived_model_weights', ['model_id'],
+                    unique=False)
+
+
+def downgrade():
+    # cold actions lose their analyses, restore them first (open or unarchive every cold action)
+    op.drop_index(op.f('ix_archived_model_weights_model_id'), table_name='archived_model_weights')
+    op.drop_table('archived_model_weights')
+    op.drop_index(op.f('ix_archived_profiles_analysis_id'), table_name='archived_profiles')
+    op.drop_table('archived_profiles')
+    op.drop_index(op.f('ix_archived_models_analysis_id'), table_name='archived_models')
+    op.drop_table('archived_models')
+    op.drop_index(op.f('ix_archived_analyses_action_id'), table_name='archived_analyses')
+    op.drop_table('archived_analyses')
+    op.drop_constraint('actions_cold_status_id_fkey', 'actions', type_='foreignkey')
+    op.drop_column('actions', 'cold_status_id')
+    op.drop_column('actions', 'cold')
@@ -0,0 +1,36 @@
+"""empty message
+
+Revision ID: a9d4e7b2c531
+Revises: f6a3c9e1d247
+Create Date: 2026-10-19 23:55:41.617302
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a9d4e7b2c531'
+down_revision = 'f6a3c9e1d247'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# filled by `python manage.py backfill`
+COLUMNS = ('ipp_rp_distance_km', 'ipp_rp_bearing')
+
+
+def upgrade():
+    for table in ('analyses', 'archived_analyses'):
+        for name in COLUMNS:
+            op.add_column(table, sa.Column(name, sa.Float(), nullable=True))
+    op.create_index('ix_analyses_live_ipp_rp_distance', 'analyses', ['ipp_rp_distance_km'], unique=False,
+                    postgresql_where=sa.text('deleted = false'))
+    op.create_index('ix_analyses_live_ipp_rp_bearing', 'analyses', ['ipp_rp_bearing'], unique=False,
+                    postgresql_where=sa.text('deleted = false'))
+
+
+def downgrade():
+    op.drop_index('ix_analyses_live_ipp_rp_bearing', table_name='analyses')
+    op.drop_index('ix_analyses_live_ipp_rp_distance', table_name='analyses')
+    for table in ('archived_analyses', 'analyses'):
+        for name in reversed(COLUMNS):
+            op.drop_column(table, name)
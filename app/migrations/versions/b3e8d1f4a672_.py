@@ -0,0 +1,23 @@
+"""empty message
+
+Revision ID: b3e8d1f4a672
+Revises: a9d4e7b2c531
+Create Date: 2026-10-20 10:12:37.458210
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8d1f4a672'
+down_revision = 'a9d4e7b2c531'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('idempotency_keys', sa.Column('claimed_at', sa.DateTime(), nullable=False,
+                                                server_default=sa.func.now()))
+
+
+def downgrade():
+    op.drop_column('idempotency_keys', 'claimed_at')
@@ -0,0 +1,34 @@
+"""empty message
+
+Revision ID: b7d3e1f05a92
+Revises: 8e2b5a7c41d6
+Create Date: 2026-10-19 13:05:44.271903
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e1f05a92'
+down_revision = '8e2b5a7c41d6'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('status_transitions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('action_id', sa.Integer(), nullable=False),
+    sa.Column('analysis_id', sa.Integer(), nullable=False),
+    sa.Column('model_id', sa.Integer(), nullable=True),
+    sa.Column('previous_status_id', sa.Integer(), nullable=True),
+    sa.Column('status_id', sa.Integer(), nullable=False),
+    sa.Column('time', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_status_transitions_analysis', 'status_transitions', ['kind', 'analysis_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_status_transitions_analysis', table_name='status_transitions')
+    op.drop_table('status_transitions')
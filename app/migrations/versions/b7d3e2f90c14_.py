@@ -0,0 +1,26 @@
+"""empty message
+
+Revision ID: b7d3e2f90c14
+Revises: a4c92e6d1b38
+Create Date: 2026-10-19 19:02:41.338207
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e2f90c14'
+down_revision = 'a4c92e6d1b38'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('actions', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('analyses', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('archived_analyses', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('archived_analyses', 'version')
+    op.drop_column('analyses', 'version')
+    op.drop_column('actions', 'version')
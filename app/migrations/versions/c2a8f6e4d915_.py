@@ -0,0 +1,34 @@
+"""empty message
+
+Revision ID: c2a8f6e4d915
+Revises: b7d3e2f90c14
+Create Date: 2026-10-19 19:48:12.604391
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c2a8f6e4d915'
+down_revision = 'b7d3e2f90c14'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('idempotency_keys',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('path', sa.String(length=255), nullable=False),
+    sa.Column('request_hash', sa.CHAR(length=64), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=True),
+    sa.Column('response', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('key', 'path', name='uq_idempotency_keys_key_path')
+    )
+    op.create_index(op.f('ix_idempotency_keys_created_at'), 'idempotency_keys', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_idempotency_keys_created_at'), table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,32 @@
+"""empty message
+
+Revision ID: c7f2a9d4e318
+Revises: b3e8d1f4a672
+Create Date: 2026-10-20 10:48:05.913624
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c7f2a9d4e318'
+down_revision = 'b3e8d1f4a672'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+DUPLICATE_MODELS = 'SELECT id FROM archived_models WHERE id NOT IN ' \
+                   '(SELECT min(id) FROM archived_models GROUP BY analysis_id, model_type_id)'
+
+
+def upgrade():
+    # subtrees archived before d5f1c7a3b820 may hold duplicates, which would break restores into the hot
+    # tables with unique constraints: keep the oldest of them, as d5f1c7a3b820 did for the hot tables
+    op.execute('DELETE FROM archived_profiles WHERE id NOT IN '
+               '(SELECT min(id) FROM archived_profiles GROUP BY analysis_id, person_type_id)')
+    op.execute('DELETE FROM archived_model_weights WHERE model_id IN ({0}) OR child_model_id IN ({0})'.
+               format(DUPLICATE_MODELS))
+    op.execute('DELETE FROM archived_models WHERE id IN ({})'.format(DUPLICATE_MODELS))
+
+
+def downgrade():
+    pass
@@ -0,0 +1,27 @@
+"""empty message
+
+Revision ID: d2a94c6e7f18
+Revises: b7d3e1f05a92
+Create Date: 2026-10-19 14:22:13.508716
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd2a94c6e7f18'
+down_revision = 'b7d3e1f05a92'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    for table in ('actions', 'analyses', 'models'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()))
+        op.alter_column(table, 'updated_at', server_default=None)
+        op.create_index(op.f('ix_{}_updated_at'.format(table)), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('actions', 'analyses', 'models'):
+        op.drop_index(op.f('ix_{}_updated_at'.format(table)), table_name=table)
+        op.drop_column(table, 'updated_at')
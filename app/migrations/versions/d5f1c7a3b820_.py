@@ -0,0 +1,33 @@
+"""empty message
+
+Revision ID: d5f1c7a3b820
+Revises: c2a8f6e4d915
+Create Date: 2026-10-19 20:31:55.170243
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd5f1c7a3b820'
+down_revision = 'c2a8f6e4d915'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+DUPLICATE_MODELS = 'SELECT id FROM models WHERE id NOT IN ' \
+                   '(SELECT min(id) FROM models GROUP BY analysis_id, model_type_id)'
+
+
+def upgrade():
+    # keep the oldest of duplicates created before the constraints
+    op.execute('DELETE FROM profiles WHERE id NOT IN '
+               '(SELECT min(id) FROM profiles GROUP BY analysis_id, person_type_id)')
+    op.execute('DELETE FROM model_weights WHERE model_id IN ({0}) OR child_model_id IN ({0})'.format(DUPLICATE_MODELS))
+    op.execute('DELETE FROM models WHERE id IN ({})'.format(DUPLICATE_MODELS))
+    op.create_unique_constraint('uq_models_analysis_model_type', 'models', ['analysis_id', 'model_type_id'])
+    op.create_unique_constraint('uq_profiles_analysis_person_type', 'profiles', ['analysis_id', 'person_type_id'])
+
+
+def downgrade():
+    op.drop_constraint('uq_profiles_analysis_person_type', 'profiles', type_='unique')
+    op.drop_constraint('uq_models_analysis_model_type', 'models', type_='unique')
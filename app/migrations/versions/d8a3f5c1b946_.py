@@ -0,0 +1,26 @@
+"""empty message
+
+Revision ID: d8a3f5c1b946
+Revises: c7f2a9d4e318
+Create Date: 2026-10-20 11:36:52.204718
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd8a3f5c1b946'
+down_revision = 'c7f2a9d4e318'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # filled by `python manage.py backfill`
+    op.add_column('actions', sa.Column('effective_status_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('actions_effective_status_id_fkey', 'actions', 'model_statuses',
+                          ['effective_status_id'], ['id'])
+
+
+def downgrade():
+    op.drop_constraint('actions_effective_status_id_fkey', 'actions', type_='foreignkey')
+    op.drop_column('actions', 'effective_status_id')
@@ -0,0 +1,22 @@
+"""empty message
+
+Revision ID: e4b7c2a9f153
+Revises: d8a3f5c1b946
+Create Date: 2026-10-20 14:05:18.337942
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7c2a9f153'
+down_revision = 'd8a3f5c1b946'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('jobs', sa.Column('visibility_timeout_sec', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('jobs', 'visibility_timeout_sec')
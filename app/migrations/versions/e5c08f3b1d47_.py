@@ -0,0 +1,52 @@
+"""empty message
+
+Revision ID: e5c08f3b1d47
+Revises: d2a94c6e7f18
+Create Date: 2026-10-19 15:10:36.884120
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e5c08f3b1d47'
+down_revision = 'd2a94c6e7f18'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+LIVE = sa.text('deleted = false')
+
+
+def upgrade():
+    # foreign keys
+    op.create_index(op.f('ix_analyses_action_id'), 'analyses', ['action_id'], unique=False)
+    op.create_index('ix_models_analysis_status', 'models', ['analysis_id', 'status_id'], unique=False)
+    op.create_index(op.f('ix_models_status_id'), 'models', ['status_id'], unique=False)
+    op.create_index(op.f('ix_model_weights_model_id'), 'model_weights', ['model_id'], unique=False)
+    op.create_index(op.f('ix_model_weights_child_model_id'), 'model_weights', ['child_model_id'], unique=False)
+    op.create_index(op.f('ix_layers_model_id'), 'layers', ['model_id'], unique=False)
+    op.create_index(op.f('ix_profiles_analysis_id'), 'profiles', ['analysis_id'], unique=False)
+
+    # list filters of not deleted items
+    op.create_index('ix_actions_live_creation_time', 'actions', ['creation_time'], unique=False,
+                    postgresql_where=LIVE)
+    op.create_index('ix_actions_live_archived', 'actions', ['archived', 'creation_time'], unique=False,
+                    postgresql_where=LIVE)
+    op.create_index('ix_analyses_live_creation_time', 'analyses', ['creation_time'], unique=False,
+                    postgresql_where=LIVE)
+    op.create_index('ix_analyses_live_action', 'analyses', ['action_id', 'creation_time'], unique=False,
+                    postgresql_where=LIVE)
+
+
+def downgrade():
+    op.drop_index('ix_analyses_live_action', table_name='analyses')
+    op.drop_index('ix_analyses_live_creation_time', table_name='analyses')
+    op.drop_index('ix_actions_live_archived', table_name='actions')
+    op.drop_index('ix_actions_live_creation_time', table_name='actions')
+    op.drop_index(op.f('ix_profiles_analysis_id'), table_name='profiles')
+    op.drop_index(op.f('ix_layers_model_id'), table_name='layers')
+    op.drop_index(op.f('ix_model_weights_child_model_id'), table_name='model_weights')
+    op.drop_index(op.f('ix_model_weights_model_id'), table_name='model_weights')
+    op.drop_index(op.f('ix_models_status_id'), table_name='models')
+    op.drop_index('ix_models_analysis_status', table_name='models')
+    op.drop_index(op.f('ix_analyses_action_id'), table_name='analyses')
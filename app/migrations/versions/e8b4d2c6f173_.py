@@ -0,0 +1,39 @@
+"""empty message
+
+Revision ID: e8b4d2c6f173
+Revises: d5f1c7a3b820
+Create Date: 2026-10-19 21:12:37.845920
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e8b4d2c6f173'
+down_revision = 'd5f1c7a3b820'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+INHERITED = (('ipp_latitude', sa.Float()), ('ipp_longitude', sa.Float()), ('rp_latitude', sa.Float()),
+             ('rp_longitude', sa.Float()), ('lost_time', sa.DateTime()))
+
+
+def upgrade():
+    for table in ('analyses', 'archived_analyses'):
+        for name, type_ in INHERITED:
+            op.add_column(table, sa.Column('effective_' + name, type_, nullable=True))
+        op.execute('UPDATE {table} SET {values}'.format(table=table, values=', '.join(
+            'effective_{0} = COALESCE({0}, (SELECT actions.{0} FROM actions WHERE actions.id = {1}.action_id))'.format(
+                name, table) for name, _ in INHERITED)))
+    op.create_index('ix_analyses_live_effective_lost_time', 'analyses', ['effective_lost_time'], unique=False,
+                    postgresql_where=sa.text('deleted = false'))
+    op.create_index('ix_analyses_live_effective_ipp', 'analyses', ['effective_ipp_latitude', 'effective_ipp_longitude'],
+                    unique=False, postgresql_where=sa.text('deleted = false'))
+
+
+def downgrade():
+    op.drop_index('ix_analyses_live_effective_ipp', table_name='analyses')
+    op.drop_index('ix_analyses_live_effective_lost_time', table_name='analyses')
+    for table in ('archived_analyses', 'analyses'):
+        for name, _ in reversed(INHERITED):
+            op.drop_column(table, 'effective_' + name)
@@ -0,0 +1,69 @@
+"""empty message
+
+Revision ID: f3b71a9c5e20
+Revises: e5c08f3b1d47
+Create Date: 2026-10-19 16:02:51.337049
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f3b71a9c5e20'
+down_revision = 'e5c08f3b1d47'
+
+import json
+from alembic import op
+import sqlalchemy as sa
+
+
+layers = sa.table('layers',
+                  sa.column('id', sa.Integer), sa.column('layers_id', sa.String), sa.column('model_id', sa.Integer))
+models = sa.table('models', sa.column('id', sa.Integer), sa.column('result_id', sa.CHAR))
+result_layers = sa.table('result_layers', sa.column('result_id', sa.String), sa.column('layer_ids', sa.Text))
+
+
+def upgrade():
+    op.create_table('result_layers',
+    sa.Column('result_id', sa.String(length=64), nullable=False),
+    sa.Column('layer_ids', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('result_id')
+    )
+
+    # layer ids of a result, without copies made by analysis duplication
+    connection = op.get_bind()
+    rows = connection.execute(sa.select([models.c.result_id, layers.c.layers_id]).
+                              select_from(layers.join(models, models.c.id == layers.c.model_id)).
+                              where(models.c.result_id != None).
+                              order_by(layers.c.id))
+    by_result = {}
+    for result_id, layer_id in rows:
+        layer_ids = by_result.setdefault(result_id.strip(), [])
+        if layer_id not in layer_ids:
+            layer_ids.append(layer_id)
+    if by_result:
+        op.bulk_insert(result_layers, [{'result_id': result_id, 'layer_ids': json.dumps(layer_ids)}
+                                       for result_id, layer_ids in by_result.items()])
+
+    op.drop_index(op.f('ix_layers_model_id'), table_name='layers')
+    op.drop_table('layers')
+
+
+def downgrade():
+    op.create_table('layers',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('layers_id', sa.String(length=256), nullable=False),
+    sa.Column('model_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['model_id'], ['models.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_layers_model_id'), 'layers', ['model_id'], unique=False)
+
+    connection = op.get_bind()
+    stored = dict(connection.execute(sa.select([result_layers.c.result_id, result_layers.c.layer_ids])))
+    rows = []
+    for model_id, result_id in connection.execute(sa.select([models.c.id, models.c.result_id]).
+                                                  where(models.c.result_id != None)):
+        for layer_id in json.loads(stored.get(result_id.strip(), '[]')):
+            rows.append({'model_id': model_id, 'layers_id': layer_id})
+    if rows:
+        op.bulk_insert(layers, rows)
+    op.drop_table('result_layers')
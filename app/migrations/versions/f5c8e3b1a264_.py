@@ -0,0 +1,22 @@
+"""empty message
+
+Revision ID: f5c8e3b1a264
+Revises: e4b7c2a9f153
+Create Date: 2026-10-21 09:26:44.170583
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f5c8e3b1a264'
+down_revision = 'e4b7c2a9f153'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('idempotency_keys', sa.Column('claim_token', sa.CHAR(length=32), nullable=True))
+
+
+def downgrade():
+    op.drop_column('idempotency_keys', 'claim_token')
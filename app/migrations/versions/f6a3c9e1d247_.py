@@ -0,0 +1,53 @@
+"""empty message
+
+Revision ID: f6a3c9e1d247
+Revises: e8b4d2c6f173
+Create Date: 2026-10-19 22:40:18.204117
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f6a3c9e1d247'
+down_revision = 'e8b4d2c6f173'
+
+from alembic import op
+import sqlalchemy as sa
+
+# grid of app.processor.geo: 0.1 degree cells, 3600 columns
+CELL = 'CAST(FLOOR(({0} + 90) / 0.1) AS INTEGER) * 3600 + CAST(FLOOR(({1} + 180) / 0.1) AS INTEGER)'
+
+POINTS = {'actions': (('ipp_cell', 'ipp_latitude', 'ipp_longitude'), ('rp_cell', 'rp_latitude', 'rp_longitude'))}
+POINTS['analyses'] = POINTS['archived_analyses'] = tuple(
+    ('effective_' + cell, 'effective_' + latitude, 'effective_' + longitude)
+    for cell, latitude, longitude in POINTS['actions'])
+
+
+def upgrade():
+    for table, points in POINTS.items():
+        for cell, latitude, longitude in points:
+            op.add_column(table, sa.Column(cell, sa.Integer(), nullable=True))
+        op.execute('UPDATE {table} SET {values}'.format(table=table, values=', '.join(
+            '{0} = {1}'.format(cell, CELL.format(latitude, longitude)) for cell, latitude, longitude in points)))
+    for table, prefix in (('actions', ''), ('analyses', 'effective_')):
+        for point in ('ipp', 'rp'):
+            op.create_index('ix_{}_live_{}{}_cell'.format(table, prefix, point), table, [prefix + point + '_cell'],
+                            unique=False, postgresql_where=sa.text('deleted = false'))
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql' and \
+            bind.execute(sa.text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")).scalar():
+        for table, prefix in (('actions', ''), ('analyses', 'effective_')):
+            for point in ('ipp', 'rp'):
+                op.execute('CREATE INDEX ix_{0}_live_{1}{2}_geography ON {0} USING GIST '
+                           '(geography(ST_MakePoint({1}{2}_longitude, {1}{2}_latitude))) '
+                           'WHERE deleted = false'.format(table, prefix, point))
+
+
+def downgrade():
+    for table, prefix in (('analyses', 'effective_'), ('actions', '')):
+        for point in ('rp', 'ipp'):
+            op.execute('DROP INDEX IF EXISTS ix_{}_live_{}{}_geography'.format(table, prefix, point))
+            op.drop_index('ix_{}_live_{}{}_cell'.format(table, prefix, point), table_name=table)
+    for table, points in POINTS.items():
+        for cell, _, _ in reversed(points):
+            op.drop_column(table, cell)
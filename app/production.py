@@ -1,23 +1,15 @@
 from app import create_app
-from app.scheduler import scheduler
-from app.processor.models import Model
+from app.scheduler import configure_scheduler, start_scheduler
 from waitress import serve
 import logging
 
 
 application = create_app('config.ProductionConfig', config_pyfile='production.py')
 
-
-def check_server():
-    with application.app_context():
-        Model.update_state_from_server()
-
-job = scheduler.add_job(check_server, 'interval', seconds=application.config['SCH_INTERVAL_SEC'])
+configure_scheduler(application)
 
 if application.config['ACTIVATE_SCHEDULER']:
-    scheduler.start()
+    start_scheduler(application)
 
 logger = logging.basicConfig(level=logging.INFO)
 serve(application, host=application.config['SERVER_ADDR'], port=application.config['SERVER_PORT'])
-
-
@@ -105,7 +105,7 @@ class ActionTest(ApiV1Test):
         action = self.fixture('simple_action')
         action_response, action_data = self.request('json_post', '/actions', action)
         self.assertEqual(action_response.status_code, 201)
-        response_keys = ['id', 'name', 'archived', 'creation_time', 'action_status_id',
+        response_keys = ['id', 'name', 'archived', 'creation_time', 'updated_at', 'action_status_id',
                          'lost_time', 'analyses', 'description',
                          'rp_latitude', 'rp_longitude', 'ipp_latitude', 'ipp_longitude']
         self.assertListEqual(sorted(response_keys), sorted(action_data.keys()))
@@ -600,6 +600,7 @@ class AnalysisModelsProfilesTest(ApiV1Test):
         for _list in [models, duplicated_models]:
             for _dict in _list:
                 del _dict['id']
+                del _dict['updated_at']
 
         for _list in [profiles, duplicated_profiles]:
             for _dict in _list:
@@ -607,6 +608,8 @@ class AnalysisModelsProfilesTest(ApiV1Test):
 
         del analysis_data['creation_time']
         del analysis_duplicated_data['creation_time']
+        del analysis_data['updated_at']
+        del analysis_duplicated_data['updated_at']
 
         for m, dm in zip(sorted(models, key=lambda k: k['model_type_id']),
                          sorted(duplicated_models, key=lambda k: k['model_type_id'])):
@@ -0,0 +1,105 @@
+import datetime
+import json
+import unittest
+
+from sqlalchemy import select, func
+from app.database import db, setup_db
+from app.processor.archive import archive_actions, ARCHIVE_TABLES, HOT_TABLES
+from app.processor.models import Action, Model, ModelStatus
+from test.fixtures import add_simple_action, add_complete_analysis
+from testing import app
+
+SERVER_PATH = '/app/api/v1'
+
+
+class ArchiveTest(unittest.TestCase):
+
+    past = datetime.datetime(2000, 1, 1)
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            self.archived_id = self.add_action(archived=True)
+            self.active_id = self.add_action(archived=False)
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def add_action(self, archived):
+        action = add_simple_action(db.session)
+        add_complete_analysis(db.session, action.id)
+        action.archived = archived
+        db.session.commit()
+        db.session.execute(Action.__table__.update().where(Action.id == action.id).values(updated_at=self.past))
+        db.session.commit()
+        return action.id
+
+    @staticmethod
+    def counts(tables):
+        return {table.name.replace('archived_', ''): db.session.execute(select([func.count()]).select_from(table)).
+                scalar() for table in tables}
+
+    def test_archives_old_archived_actions(self):
+        with app.app_context():
+            hot = self.counts(HOT_TABLES)
+            self.assertEqual(archive_actions(), [self.archived_id])
+            self.assertEqual(archive_actions(), [])
+
+            action = Action.query.get(self.archived_id)
+            self.assertTrue(action.cold)
+            self.assertEqual(action.analyses_count, 0)
+            self.assertEqual(action.action_status_id, ModelStatus.draft_id())
+            self.assertEqual(Action.query.get(self.active_id).analyses_count, 1)
+            archived = self.counts(ARCHIVE_TABLES)
+            for name, count in self.counts(HOT_TABLES).items():
+                self.assertGreater(archived[name], 0)
+                self.assertEqual(count + archived[name], hot[name])
+
+    def test_recent_actions_stay_hot(self):
+        with app.app_context():
+            self.assertEqual(archive_actions(older_than=self.past), [])
+
+    def test_opening_cold_action_restores_it(self):
+        with app.app_context():
+            hot = self.counts(HOT_TABLES)
+            archive_actions()
+        response = self.app.get('{}/actions/{}'.format(SERVER_PATH, self.archived_id))
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf8'))
+        self.assertEqual(len(data['analyses']), 1)
+        self.assertEqual(len(data['analyses'][0]['models']), 9)
+        with app.app_context():
+            self.assertFalse(Action.query.get(self.archived_id).cold)
+            self.assertEqual(self.counts(HOT_TABLES), hot)
+            self.assertEqual(set(self.counts(ARCHIVE_TABLES).values()), {0})
+
+    def test_children_of_cold_action_restore_it(self):
+        with app.app_context():
+            analysis = Action.query.get(self.archived_id).analyses.one()
+            analysis_id, model_id = analysis.id, analysis.models.first().id
+            archive_actions()
+        response = self.app.get('{}/analyses/{}'.format(SERVER_PATH, analysis_id))
+        self.assertEqual(response.status_code, 200)
+        with app.app_context():
+            self.assertFalse(Action.query.get(self.archived_id).cold)
+            self.assertIsNotNone(Model.query.get(model_id))
+
+    def test_adding_analysis_restores_cold_action(self):
+        with app.app_context():
+            archive_actions()
+        response = self.app.post('{}/analyses'.format(SERVER_PATH), content_type='application/json',
+                                 data=json.dumps({'name': 'New', 'action_id': self.archived_id}))
+        self.assertEqual(response.status_code, 201)
+        with app.app_context():
+            action = Action.query.get(self.archived_id)
+            self.assertFalse(action.cold)
+            self.assertEqual(action.analyses_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
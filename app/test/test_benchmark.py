@@ -0,0 +1,72 @@
+import unittest
+
+from app.benchmark import run_benchmark, compare
+from app.database import db, setup_db
+from app.processor.models import Action, Analysis, Model, ModelWeight, Profile, ResultLayers
+from app.seed import DatasetSeeder
+from testing import app
+
+
+class SeedTest(unittest.TestCase):
+
+    def setUp(self):
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def test_seeded_counts(self):
+        with app.app_context():
+            counts = DatasetSeeder(db.session, analyses=3, profiles=2).insert(10, chunk=4)
+            self.assertEqual(Action.query.count(), 10)
+            self.assertEqual(Analysis.query.count(), 30)
+            self.assertEqual(Model.query.count(), 30 * 9)
+            self.assertEqual(ModelWeight.query.count(), 30 * 7 * 2)
+            self.assertEqual(Profile.query.count(), 30 * 2)
+            self.assertEqual(ResultLayers.query.count(), counts['result_layers'])
+            self.assertGreater(counts['result_layers'], 0)
+
+    def test_seeding_is_repeatable(self):
+        with app.app_context():
+            first = DatasetSeeder(db.session, random_seed=1).rows(5)
+            second = DatasetSeeder(db.session, random_seed=1).rows(5)
+            self.assertEqual(first, second)
+
+    def test_seeding_continues_ids(self):
+        with app.app_context():
+            DatasetSeeder(db.session).insert(2)
+            DatasetSeeder(db.session).insert(2)
+            self.assertEqual(Action.query.count(), 4)
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def setUp(self):
+        app.config['ARCGIS_PATH_PREFIX'] = 'http://127.0.0.1:11000'
+        app.config['ARCGIS_PATH_SUFFIX'] = '/maps'
+        app.config['PROPAGATE_EXCEPTIONS'] = False     # failed requests are counted as errors
+
+    def tearDown(self):
+        app.config['PROPAGATE_EXCEPTIONS'] = None
+        with app.app_context():
+            db.session.close()
+
+    def test_report(self):
+        report = run_benchmark(app, [2], requests=2, analyses=2)
+        results = {result['endpoint']: result for result in report['results']}
+        for endpoint in ('GET /actions', 'GET /analyses', 'GET /analyses/<id>'):
+            self.assertEqual(results[endpoint]['errors'], 0)
+            self.assertGreater(results[endpoint]['queries'], 0)
+            self.assertLessEqual(results[endpoint]['p50_ms'], results[endpoint]['p95_ms'])
+            self.assertGreater(results[endpoint]['peak_kib'], 0)
+        self.assertEqual(len(compare(report, report)), len(report['results']) + 1 - sum(
+            result['p95_ms'] is None for result in report['results']))
+
+
+if __name__ == '__main__':
+    unittest.main()
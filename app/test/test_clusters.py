@@ -0,0 +1,123 @@
+import datetime
+import json
+import unittest
+from unittest import mock
+
+from app.database import db, setup_db
+from app.instrumentation import collect
+from app.processor import clusters
+from app.processor.models import Action, Model, ModelStatus, touch
+from test.fixtures import add_analysis_with_coordinates, add_simple_model
+from testing import app
+
+SERVER_PATH = '/app/api/v1'
+LOST_TIME = datetime.datetime(2026, 5, 1, 12, 0)
+BBOX = '19.0,49.0,21.0,51.0'
+
+
+class ClustersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            points = [(50.0, 20.0), (50.001, 20.001), (50.002, 20.002), (49.5, 19.5)]
+            db.session.add_all([Action(name='Action {}'.format(i), lost_time=LOST_TIME,
+                                       ipp_latitude=latitude, ipp_longitude=longitude)
+                                for i, (latitude, longitude) in enumerate(points)])
+            db.session.add(Action(name='Deleted', lost_time=LOST_TIME, ipp_latitude=50.0, ipp_longitude=20.0,
+                                  deleted=True))
+            db.session.commit()
+        clusters.invalidate()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def get(self, **args):
+        response = self.app.get(SERVER_PATH + '/actions/clusters', query_string=args)
+        return response, json.loads(response.data.decode('utf8'))
+
+    def test_tiles(self):
+        self.assertEqual(clusters.tiles_in(0, -180, -90, 180, 90), [(0, 0)])
+        self.assertEqual(len(clusters.tiles_in(2, -180, -90, 180, 90)), 16)
+        west, south, east, north = clusters.tile_box(10, *clusters.tiles_in(10, 20.0, 50.0, 20.0, 50.0)[0])
+        self.assertTrue(west <= 20.0 <= east and south <= 50.0 <= north)
+
+    def test_clusters(self):
+        response, data = self.get(bbox=BBOX, zoom=8)
+        self.assertEqual(response.status_code, 200)
+        data.sort(key=lambda cluster: cluster['count'])
+        self.assertEqual([cluster['count'] for cluster in data], [1, 3])
+        self.assertEqual(data[1]['statuses'], {'draft': 3})
+        self.assertAlmostEqual(data[1]['latitude'], 50.001)
+        self.assertNotIn('action_id', data[1])
+        self.assertIn('action_id', data[0])
+        _, data = self.get(bbox=BBOX, zoom=1)
+        self.assertEqual([cluster['count'] for cluster in data], [4])
+
+    def test_cache_and_invalidation(self):
+        self.get(bbox=BBOX, zoom=8)
+        with app.app_context():
+            with collect(record=True) as stats:
+                self.assertEqual(len(clusters.clusters(8, (19.0, 49.0, 21.0, 51.0))), 2)
+            self.assertEqual(stats.count, 1)    # changed actions only
+            action = Action.query.filter_by(name='Action 3').one()
+            action.ipp_latitude, action.ipp_longitude = 50.0, 20.0
+            db.session.commit()
+        _, data = self.get(bbox=BBOX, zoom=8)
+        self.assertEqual([cluster['count'] for cluster in data], [4])
+
+    def test_only_changed_tiles_are_dropped(self):
+        self.get(bbox=BBOX, zoom=8)
+        cached = dict(clusters._cache)
+        with app.app_context():
+            action = Action.query.filter_by(name='Action 0').one()
+            model = add_simple_model(db.session, add_analysis_with_coordinates(db.session, action.id).id)
+            db.session.commit()
+            self.assertEqual(action.effective_status_id, ModelStatus.draft_id())
+            Model.query.filter_by(id=model.id).update({'status_id': ModelStatus.by_name(ModelStatus.WAITING).id})
+            touch(db.session, model_ids=[model.id])     # as the poller does
+            db.session.commit()
+            self.assertEqual(action.effective_status_id, ModelStatus.by_name(ModelStatus.WAITING).id)
+            with collect(record=True) as stats:
+                found = clusters.clusters(8, (19.0, 49.0, 21.0, 51.0))
+            self.assertEqual(stats.count, 3)    # changed actions, statuses and the changed tile
+        self.assertEqual(sorted(cluster['statuses'].get('waiting', 0) for cluster in found), [0, 1])
+        self.assertEqual(len([key for key, value in cached.items() if clusters._cache[key] is not value]), 1)
+
+    def test_tiles_computed_during_a_change_are_not_cached(self):
+        compute = clusters._compute
+
+        def compute_during_change(zoom, tiles):
+            computed = compute(zoom, tiles)
+            clusters.invalidate()   # as by a request reading a change meanwhile
+            return computed
+
+        with mock.patch.object(clusters, '_compute', side_effect=compute_during_change):
+            self.get(bbox=BBOX, zoom=8)
+        self.assertEqual(len(clusters._cache), 0)
+        self.get(bbox=BBOX, zoom=8)
+        self.assertGreater(len(clusters._cache), 0)
+
+    def test_antimeridian(self):
+        with app.app_context():
+            db.session.add(Action(name='Pacific', lost_time=LOST_TIME, ipp_latitude=0.0, ipp_longitude=179.9))
+            db.session.add(Action(name='Pacific', lost_time=LOST_TIME, ipp_latitude=0.0, ipp_longitude=-179.9))
+            db.session.commit()
+        _, data = self.get(bbox='179.0,-1.0,-179.0,1.0', zoom=6)
+        self.assertEqual(sorted(round(cluster['longitude'], 1) for cluster in data), [-179.9, 179.9])
+
+    def test_bounded_response(self):
+        response, data = self.get(bbox='-180,-85,180,85', zoom=10)
+        self.assertEqual(response.status_code, 422)
+        self.assertIn('bbox', data['invalid_fields'])
+        response, _ = self.get(bbox=BBOX)
+        self.assertEqual(response.status_code, 422)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import datetime
+import unittest
+
+from app.database import db, setup_db
+from app.instrumentation import collect
+from app.processor.models import Action, Analysis
+from testing import app
+
+LOST_TIME = datetime.datetime(2026, 5, 1, 12, 0)
+
+
+class EffectiveValuesTest(unittest.TestCase):
+
+    def setUp(self):
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            action = Action(name='Example', lost_time=LOST_TIME, ipp_latitude=50.0, ipp_longitude=20.0)
+            db.session.add(action)
+            db.session.flush()
+            inheriting = Analysis(name='Inheriting', action_id=action.id)
+            own = Analysis(name='Own', action_id=action.id, ipp_latitude=49.0, lost_time=LOST_TIME.replace(day=2))
+            db.session.add_all([inheriting, own])
+            db.session.commit()
+            self.action_id, self.inheriting_id, self.own_id = action.id, inheriting.id, own.id
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def test_values_are_inherited_on_insert(self):
+        with app.app_context():
+            inheriting, own = Analysis.query.get(self.inheriting_id), Analysis.query.get(self.own_id)
+            self.assertEqual((inheriting.effective_ipp_latitude, inheriting.effective_lost_time), (50.0, LOST_TIME))
+            self.assertEqual((own.effective_ipp_latitude, own.effective_ipp_longitude), (49.0, 20.0))
+            self.assertEqual(own.effective_lost_time, LOST_TIME.replace(day=2))
+
+    def test_reading_does_not_load_action(self):
+        with app.app_context():
+            analysis = Analysis.query.get(self.inheriting_id)
+            with collect(record=True) as stats:
+                self.assertEqual(analysis.lost_time, LOST_TIME)
+                self.assertEqual(analysis.ipp_longitude, 20.0)
+            self.assertEqual(stats.count, 0)
+
+    def test_action_changes_are_propagated(self):
+        with app.app_context():
+            action = Action.query.get(self.action_id)
+            action.lost_time = LOST_TIME.replace(day=5)
+            action.ipp_longitude = 21.0
+            db.session.commit()
+            db.session.close()
+            inheriting, own = Analysis.query.get(self.inheriting_id), Analysis.query.get(self.own_id)
+            self.assertEqual((inheriting.effective_lost_time, inheriting.effective_ipp_longitude),
+                             (LOST_TIME.replace(day=5), 21.0))
+            self.assertEqual((own.effective_lost_time, own.effective_ipp_longitude),
+                             (LOST_TIME.replace(day=2), 21.0))
+
+    def test_own_value_removed(self):
+        with app.app_context():
+            own = Analysis.query.get(self.own_id)
+            own.lost_time = None
+            db.session.commit()
+            self.assertEqual(own.effective_lost_time, LOST_TIME)
+
+    def test_lost_time_filter(self):
+        with app.app_context():
+            ids = [analysis.id for analysis in
+                   Analysis.filtered(lost_from=LOST_TIME.replace(day=2), lost_to=LOST_TIME.replace(day=3))]
+            self.assertEqual(ids, [self.own_id])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import datetime
+import json
+import unittest
+
+from app.database import db, setup_db
+from app.processor import geo
+from app.processor.models import Action, Analysis
+from testing import app
+
+SERVER_PATH = '/app/api/v1'
+LOST_TIME = datetime.datetime(2026, 5, 1, 12, 0)
+
+
+class GeoTest(unittest.TestCase):
+
+    def test_haversine(self):
+        distances = geo.haversine_km(50.0, 20.0, [50.0, 51.0, 50.0], [20.0, 20.0, 21.0])
+        self.assertAlmostEqual(distances[0], 0)
+        self.assertAlmostEqual(distances[1], geo.KM_PER_DEGREE, places=6)
+        self.assertAlmostEqual(distances[2], 71.5, delta=0.1)
+
+    def test_bounding_box(self):
+        west, south, east, north = geo.bounding_box(50.0, 20.0, 10)
+        self.assertTrue(west < 20.0 < east and south < 50.0 < north)
+        self.assertAlmostEqual(north - 50.0, 10 / geo.KM_PER_DEGREE)
+        west, _, east, _ = geo.bounding_box(0.0, 179.99, 10)
+        self.assertTrue(west > east)
+        self.assertEqual(geo.bounding_box(89.99, 0.0, 10)[::2], (-180.0, 180.0))
+
+    def test_cells(self):
+        self.assertEqual(geo.cell(-90.0, -180.0), 0)
+        self.assertIsNone(geo.cell(None, 20.0))
+        cells = geo.cells_in(19.95, 49.95, 20.15, 50.05)
+        self.assertIn(geo.cell(50.0, 20.1), cells)
+        self.assertEqual(len(cells), 2 * 3)
+        self.assertIsNone(geo.cells_in(-180, -90, 180, 90))
+
+
+class SpatialSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            near = Action(name='Near', lost_time=LOST_TIME, ipp_latitude=50.0, ipp_longitude=20.0,
+                          rp_latitude=50.3, rp_longitude=20.0)
+            far = Action(name='Far', lost_time=LOST_TIME, ipp_latitude=50.0, ipp_longitude=21.0,
+                         rp_latitude=50.0, rp_longitude=20.01)
+            db.session.add_all([near, far])
+            db.session.flush()
+            db.session.add_all([Analysis(name='Inheriting', action_id=near.id),
+                                Analysis(name='Own', action_id=far.id, ipp_latitude=50.05, ipp_longitude=20.0)])
+            db.session.commit()
+            self.near_id, self.far_id = near.id, far.id
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def get(self, path, **args):
+        response = self.app.get(SERVER_PATH + path, query_string=args)
+        return response, json.loads(response.data.decode('utf8'))
+
+    def test_cells_are_stored(self):
+        with app.app_context():
+            action = Action.query.get(self.near_id)
+            self.assertEqual((action.ipp_cell, action.rp_cell), (geo.cell(50.0, 20.0), geo.cell(50.3, 20.0)))
+            action.ipp_longitude = 21.0
+            db.session.commit()
+            self.assertEqual(action.ipp_cell, geo.cell(50.0, 21.0))
+            analysis = Analysis.query.filter_by(action_id=self.near_id).one()
+            self.assertEqual(analysis.effective_ipp_cell, geo.cell(50.0, 21.0))
+
+    def test_actions_near(self):
+        response, data = self.get('/actions', near='50.0,20.0', radius_km=20)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([action['id'] for action in data], [self.near_id])
+        self.assertEqual(data[0]['distance_km'], 0)
+        _, data = self.get('/actions', near='50.0,20.0', radius_km=20, point='rp')
+        self.assertEqual([action['id'] for action in data], [self.far_id])
+        self.assertAlmostEqual(data[0]['distance_km'], 0.715, places=2)
+
+    def test_analyses_near(self):
+        _, data = self.get('/analyses', near='50.0,20.0', radius_km=10)
+        self.assertEqual({analysis['name']: round(analysis['distance_km']) for analysis in data},
+                         {'Inheriting': 0, 'Own': 6})
+
+    def test_page_of_radius_search(self):
+        with app.app_context():
+            db.session.add_all([Action(name='Corner {}'.format(i), lost_time=LOST_TIME, ipp_latitude=50.13,
+                                       ipp_longitude=20.2) for i in range(3)])   # in the box, outside of 15 km
+            db.session.commit()
+        _, data = self.get('/actions', near='50.0,20.0', radius_km=15, per_page=1, page_ts=4102444800)
+        self.assertEqual([action['id'] for action in data], [self.near_id])
+
+    def test_bbox(self):
+        _, data = self.get('/actions', bbox='19.5,49.5,20.5,50.5')
+        self.assertEqual([action['id'] for action in data], [self.near_id])
+        self.assertNotIn('distance_km', data[0])
+        _, data = self.get('/analyses', bbox='20.5,49.5,21.5,50.5')
+        self.assertEqual(data, [])
+
+    def test_invalid_parameters(self):
+        for args in ({'near': '50.0'}, {'near': '95,20'}, {'bbox': '1,2,3'}, {'point': 'lkp'}, {'radius_km': -1}):
+            response, _ = self.get('/actions', **args)
+            self.assertEqual(response.status_code, 422, args)
+
+
+if __name__ == '__main__':
+    unittest.main()
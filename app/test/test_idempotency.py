@@ -0,0 +1,108 @@
+import datetime
+import hashlib
+import json
+import unittest
+from unittest import mock
+
+from app.database import db, setup_db
+from app.processor.models import IdempotencyKey, PersonType, Profile
+from app.processor.purge import purge
+from app.processor.schemas import ProfileSchema
+from test.fixtures import add_simple_action, add_analysis_with_coordinates
+from testing import app
+
+SERVER_PATH = '/app/api/v1'
+
+
+class IdempotencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            action = add_simple_action(db.session)
+            analysis_id = add_analysis_with_coordinates(db.session, action.id).id
+            self.profile = {'analysis_id': analysis_id, 'person_type_id': PersonType.query.first().id,
+                            'weight': 5}
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def post(self, data, key):
+        response = self.app.post(SERVER_PATH + '/profiles', data=json.dumps(data), content_type='application/json',
+                                 headers={'Idempotency-Key': key})
+        return response, json.loads(response.data.decode('utf8'))
+
+    def test_retry_is_replayed(self):
+        response, data = self.post(self.profile, 'key-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response.headers)
+        retry, retry_data = self.post(self.profile, 'key-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry_data, data)
+        with app.app_context():
+            self.assertEqual(Profile.query.count(), 1)
+
+    def test_key_reused_with_other_body(self):
+        self.post(self.profile, 'key-1')
+        response, data = self.post(dict(self.profile, weight=7), 'key-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data['internal_code'], 'error_idempotency_key_reused')
+
+    def test_request_in_progress(self):
+        with app.app_context():
+            db.session.add(IdempotencyKey(key='key-1', path=SERVER_PATH + '/profiles',
+                                          request_hash='0' * 64))
+            db.session.commit()
+        response, data = self.post(self.profile, 'key-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(data['internal_code'], 'error_request_in_progress')
+
+    def test_stale_request_is_taken_over(self):
+        with app.app_context():
+            stale = datetime.datetime.now() - datetime.timedelta(seconds=app.config['IDEMPOTENCY_LEASE_SEC'] + 1)
+            db.session.add(IdempotencyKey(key='key-1', path=SERVER_PATH + '/profiles', claimed_at=stale,
+                                          request_hash=hashlib.sha256(json.dumps(self.profile).encode()).hexdigest()))
+            db.session.commit()
+        response, data = self.post(self.profile, 'key-1')
+        self.assertEqual(response.status_code, 201)
+        retry, retry_data = self.post(self.profile, 'key-1')
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry_data, data)
+        with app.app_context():
+            self.assertEqual(Profile.query.count(), 1)
+
+    def test_failed_requests_are_not_stored(self):
+        response, _ = self.post(dict(self.profile, weight='x'), 'key-1')
+        self.assertEqual(response.status_code, 422)
+        with app.app_context():
+            self.assertEqual(IdempotencyKey.query.count(), 0)
+
+    def test_committed_failure_is_replayed(self):
+        with mock.patch.object(ProfileSchema, 'dump', side_effect=RuntimeError('after commit')):
+            with self.assertRaises(RuntimeError):
+                self.post(self.profile, 'key-1')
+        retry, data = self.post(self.profile, 'key-1')
+        self.assertEqual(retry.status_code, 500)
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        with app.app_context():
+            self.assertEqual(Profile.query.count(), 1)
+
+    def test_expired_keys(self):
+        self.post(self.profile, 'key-1')
+        with app.app_context():
+            expired = datetime.datetime.now() - datetime.timedelta(seconds=app.config['IDEMPOTENCY_KEY_TTL_SEC'] + 1)
+            IdempotencyKey.query.update({'created_at': expired})
+            db.session.commit()
+            self.assertEqual(purge(pause=0).get('idempotency_keys'), 1)
+            self.assertEqual(IdempotencyKey.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import unittest
+
+import httpretty
+from app.database import db, setup_db
+from app.instrumentation import max_queries, collect
+from app.processor.models import Model, ModelStatus
+from app.processor.poller import poll_unfinished_models
+from test.fixtures import add_simple_action, add_simple_models_analysis
+from testing import app
+
+SERVER_PATH = '/app/api/v1'
+
+# statement budgets of hot endpoints, measured counts plus a margin of two, the same for any size of the dataset
+ACTION_DETAIL_BUDGET = 8            # action, analyses, models, weights, profiles, status
+ACTION_LIST_BUDGET = 4              # actions, statuses
+ANALYSIS_LIST_BUDGET = 7            # analyses, models, weights, profiles, actions
+POLLER_BUDGET = 20                  # plus one guarded UPDATE per model on databases other than PostgreSQL
+
+
+class QueryBudgetTest(unittest.TestCase):
+
+    actions = 3
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            app.config['MONTRACKER_SERVER_ADDR'] = 'http://127.0.0.1:10000'
+            app.config['MONTRACKER_SERVER_API_VERSION'] = 'v1'
+            self.action_id = self.add_actions(self.actions)
+            ModelStatus.cached_id(ModelStatus.DRAFT)
+
+    def add_actions(self, count):
+        for _ in range(count):
+            action = add_simple_action(db.session)
+            add_simple_models_analysis(db.session, action.id)
+        db.session.commit()
+        return action.id
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def get(self, path, budget):
+        with max_queries(budget):
+            response = self.app.get(SERVER_PATH + path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_response_headers(self):
+        response = self.app.get(SERVER_PATH + '/actions/{}'.format(self.action_id))
+        self.assertGreater(int(response.headers['X-DB-Query-Count']), 0)
+        self.assertGreaterEqual(float(response.headers['X-DB-Time-Ms']), 0)
+
+    def test_max_queries_fails_over_budget(self):
+        with self.assertRaises(AssertionError) as context:
+            self.get('/actions/{}'.format(self.action_id), 1)
+        self.assertIn('SELECT', str(context.exception))
+
+    def test_action_detail(self):
+        self.get('/actions/{}'.format(self.action_id), ACTION_DETAIL_BUDGET)
+
+    def test_action_list(self):
+        self.get('/actions', ACTION_LIST_BUDGET)
+
+    def test_analysis_list(self):
+        self.get('/analyses', ANALYSIS_LIST_BUDGET)
+
+    def test_counts_do_not_grow_with_data(self):
+        paths = ['/actions/{}'.format(self.action_id), '/actions', '/analyses']
+
+        def counts():
+            result = []
+            for path in paths:
+                with collect() as stats:
+                    self.assertEqual(self.app.get(SERVER_PATH + path).status_code, 200)
+                result.append(stats.count)
+            return result
+
+        before = counts()
+        with app.app_context():     # from 3 to 6 actions with an analysis, and a second analysis of the detailed one
+            self.add_actions(self.actions)
+            add_simple_models_analysis(db.session, self.action_id)
+            db.session.commit()
+        self.assertEqual(counts(), before)
+
+    @httpretty.activate
+    def test_poller_tick(self):
+        httpretty.register_uri(httpretty.GET, 'http://127.0.0.1:10000/v1/analysis/1001',
+                               body=json.dumps({'status': 'finished', 'layer_ids': ['1', '2']}),
+                               content_type='application/json')
+        with app.app_context():
+            for model in Model.query:
+                model.update_result('1001')
+            db.session.commit()
+
+            budget = POLLER_BUDGET
+            if db.engine.dialect.name != 'postgresql':
+                budget += Model.query.count()
+            with max_queries(budget):
+                updated = poll_unfinished_models()
+            self.assertEqual(len(updated), Model.query.count())
+            with collect() as stats:
+                poll_unfinished_models()
+            self.assertLess(stats.count, budget)
+
+
+if __name__ == '__main__':
+    unittest.main()
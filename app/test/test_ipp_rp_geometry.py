@@ -0,0 +1,94 @@
+import datetime
+import json
+import unittest
+
+from app.database import db, setup_db
+from app.processor import geo
+from app.processor.backfill import backfill
+from app.processor.models import Action, Analysis
+from testing import app
+
+SERVER_PATH = '/app/api/v1'
+LOST_TIME = datetime.datetime(2026, 5, 1, 12, 0)
+
+
+class IppRpGeometryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            action = Action(name='Example', lost_time=LOST_TIME, ipp_latitude=50.0, ipp_longitude=20.0,
+                            rp_latitude=50.1, rp_longitude=20.0)
+            db.session.add(action)
+            db.session.flush()
+            db.session.add_all([
+                Analysis(name='North', action_id=action.id),
+                Analysis(name='East', action_id=action.id, rp_latitude=50.0, rp_longitude=20.5),
+                Analysis(name='West', action_id=action.id, rp_latitude=50.0, rp_longitude=19.9)])
+            db.session.commit()
+            self.action_id = action.id
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def get(self, **args):
+        response = self.app.get(SERVER_PATH + '/analyses', query_string=args)
+        return response, json.loads(response.data.decode('utf8'))
+
+    def geometry(self):
+        return {analysis.name: (round(analysis.ipp_rp_distance_km, 1), round(analysis.ipp_rp_bearing))
+                for analysis in Analysis.query}
+
+    def test_vectorized_geometry(self):
+        distances, bearings = geo.ipp_rp([0.0, 0.0, None], [0.0, 0.0, 1.0], [1.0, -1.0, 1.0], [0.0, 0.0, 1.0])
+        self.assertAlmostEqual(distances[0], geo.KM_PER_DEGREE)
+        self.assertEqual([round(bearing) for bearing in bearings[:2]], [0, 180])
+        self.assertEqual((distances[2], bearings[2]), (None, None))
+
+    def test_persisted_on_write(self):
+        with app.app_context():
+            self.assertEqual(self.geometry(), {'North': (11.1, 0), 'East': (35.7, 90), 'West': (7.1, 270)})
+            action = Action.query.get(self.action_id)
+            action.rp_latitude = 49.9
+            db.session.commit()
+            self.assertEqual(self.geometry()['North'], (11.1, 180))
+
+    def test_filter_and_sort(self):
+        _, data = self.get(sort='ipp_rp_distance_km')
+        self.assertEqual([analysis['name'] for analysis in data], ['West', 'North', 'East'])
+        _, data = self.get(sort='-ipp_rp_bearing', ipp_rp_distance_min=10)
+        self.assertEqual([analysis['name'] for analysis in data], ['East', 'North'])
+        _, data = self.get(ipp_rp_bearing_from=260, ipp_rp_bearing_to=10)
+        self.assertEqual({analysis['name'] for analysis in data}, {'North', 'West'})
+        response, _ = self.get(sort='name')
+        self.assertEqual(response.status_code, 422)
+
+    def test_sort_with_page_ts(self):
+        response, data = self.get(sort='ipp_rp_distance_km', per_page=2, page_ts=4102444800)
+        self.assertEqual(response.status_code, 422)
+        self.assertIn('sort', data['invalid_fields'])
+        response, data = self.get(sort='-creation_time', per_page=2, page_ts=4102444800)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data), 2)
+
+    def test_backfill(self):
+        with app.app_context():
+            analyses = Analysis.__table__
+            db.session.execute(analyses.update().values(ipp_rp_distance_km=None, ipp_rp_bearing=None,
+                                                        effective_ipp_cell=None))
+            db.session.commit()
+            updated_at = {row.id: row.updated_at for row in db.session.execute(analyses.select())}
+            self.assertEqual(backfill(batch_size=2), {'analyses': 3, 'archived_analyses': 0, 'actions': 1})
+            db.session.expire_all()
+            self.assertEqual(self.geometry(), {'North': (11.1, 0), 'East': (35.7, 90), 'West': (7.1, 270)})
+            self.assertEqual({analysis.effective_ipp_cell for analysis in Analysis.query}, {geo.cell(50.0, 20.0)})
+            self.assertEqual({row.id: row.updated_at for row in db.session.execute(analyses.select())}, updated_at)
+
+
+if __name__ == '__main__':
+    unittest.main()
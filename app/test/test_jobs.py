@@ -0,0 +1,146 @@
+import datetime
+import unittest
+
+from app.database import db, setup_db
+from app.jobs import LeaderElection, JobWorker, task, enqueue
+from app.jobs.models import Job
+from testing import app
+
+executed = []
+
+
+@task('test_job')
+def record_job(payload):
+    executed.append(payload)
+
+
+@task('test_failing_job')
+def failing_job(payload):
+    raise RuntimeError('Job failure')
+
+
+class JobsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+
+class LeaderElectionTest(JobsTest):
+
+    def setUp(self):
+        super(LeaderElectionTest, self).setUp()
+        self.now = datetime.datetime(2016, 10, 1, 12, 0, 0)
+        self.first = self.election('first')
+        self.second = self.election('second')
+
+    def election(self, holder):
+        election = LeaderElection(ttl=15, clock=lambda: self.now)
+        election.holder = holder
+        return election
+
+    def test_single_leader(self):
+        with app.app_context():
+            self.assertTrue(self.first.acquire())
+            self.assertFalse(self.second.acquire())
+            self.now += datetime.timedelta(seconds=10)
+            self.assertTrue(self.first.acquire())
+            self.assertFalse(self.second.acquire())
+            self.assertTrue(self.first.is_leader)
+            self.assertFalse(self.second.is_leader)
+
+    def test_failover_after_ttl(self):
+        with app.app_context():
+            self.assertTrue(self.first.acquire())
+            self.now += datetime.timedelta(seconds=16)
+            self.assertFalse(self.first.is_leader)
+            self.assertTrue(self.second.acquire())
+            self.assertFalse(self.first.acquire())
+
+    def test_release(self):
+        with app.app_context():
+            self.assertTrue(self.first.acquire())
+            self.first.release()
+            self.assertTrue(self.second.acquire())
+
+    def test_leader_in_metrics(self):
+        with app.app_context():
+            self.now = datetime.datetime.utcnow()
+            self.first.acquire()
+        result = self.app.get('/metrics')
+        self.assertEqual(result.status_code, 200)
+        body = result.data.decode('utf8')
+        self.assertIn('montracker_scheduler_leader{holder="first",name="scheduler"} 1.0', body)
+        self.assertIn('montracker_scheduler_is_leader{holder="first"} 1.0', body)
+
+
+class JobQueueTest(JobsTest):
+
+    def setUp(self):
+        super(JobQueueTest, self).setUp()
+        del executed[:]
+        self.now = datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+        self.worker = JobWorker(app, name='worker', clock=lambda: self.now)
+
+    def test_jobs_by_priority(self):
+        with app.app_context():
+            enqueue('test_job', {'value': 'low'}, priority=0)
+            enqueue('test_job', {'value': 'high'}, priority=5)
+        self.assertTrue(self.worker.run_once())
+        self.assertTrue(self.worker.run_once())
+        self.assertFalse(self.worker.run_once())
+        self.assertEqual(executed, [{'value': 'high'}, {'value': 'low'}])
+        with app.app_context():
+            self.assertEqual(Job.query.filter_by(status=Job.DONE).count(), 2)
+
+    def test_unique_job(self):
+        with app.app_context():
+            self.assertIsNotNone(enqueue('test_job', unique=True))
+            self.assertIsNone(enqueue('test_job', unique=True))
+            self.assertEqual(Job.query.count(), 1)
+
+    def test_claimed_job_invisible_until_timeout(self):
+        other = JobWorker(app, name='other', clock=lambda: self.now)
+        with app.app_context():
+            enqueue('test_job', {'value': 1})
+            job = self.worker.claim()
+            self.assertEqual(job.locked_by, 'worker')
+            self.assertIsNone(other.claim())
+            self.now += datetime.timedelta(seconds=app.config['JOB_VISIBILITY_TIMEOUT_SEC'] + 1)
+            job = other.claim()
+            self.assertEqual(job.locked_by, 'other')
+            self.assertEqual(job.attempts, 2)
+
+    def test_own_visibility_timeout(self):
+        other = JobWorker(app, name='other', clock=lambda: self.now)
+        with app.app_context():
+            enqueue('test_job', unique=True, visibility_timeout=20)
+            self.worker.claim()
+            self.assertIsNone(enqueue('test_job', unique=True))
+            self.now += datetime.timedelta(seconds=21)
+            self.assertEqual(other.claim().locked_by, 'other')
+
+    def test_failed_job_retried(self):
+        with app.app_context():
+            enqueue('test_failing_job', max_attempts=2)
+        self.assertTrue(self.worker.run_once())
+        self.assertFalse(self.worker.run_once())    # waits for retry delay
+        self.now += datetime.timedelta(seconds=app.config['JOB_RETRY_DELAY_SEC'])
+        self.assertTrue(self.worker.run_once())
+        with app.app_context():
+            job = Job.query.one()
+            self.assertEqual(job.status, Job.FAILED)
+            self.assertEqual(job.attempts, 2)
+            self.assertIn('Job failure', job.last_error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import httpretty
+from app.database import db, setup_db
+from app.metrics import Counter, Gauge, Histogram
+from app.metrics.registry import Registry
+from app.processor import cs_utils
+from app.processor.models import Model
+from app.processor.poller import poll_unfinished_models, detection_lag
+from test.fixtures import add_simple_action, add_simple_models_analysis
+from testing import app
+
+
+def unused_pid():
+    pid = 4000000
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return pid
+        except PermissionError:
+            pass
+        pid -= 1
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = Histogram('test_seconds', 'Test', ('kind',), register=False, buckets=(1, 5))
+        for value in (0.5, 2, 7):
+            histogram.observe(value, kind='a')
+        lines = [sample.render() for sample in histogram.samples()]
+        self.assertEqual(lines, ['test_seconds_bucket{kind="a",le="1.0"} 1.0',
+                                 'test_seconds_bucket{kind="a",le="5.0"} 2.0',
+                                 'test_seconds_bucket{kind="a",le="+Inf"} 3.0',
+                                 'test_seconds_sum{kind="a"} 9.5',
+                                 'test_seconds_count{kind="a"} 3.0'])
+
+
+class MultiprocessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.registry = Registry()
+        self.registry.configure(self.directory, flush_interval=0)
+        self.counter = Counter('test_total', 'Test', ('kind',), register=False)
+        self.gauge = Gauge('test_live', 'Test', register=False, multiprocess_mode='sum')
+        self.histogram = Histogram('test_seconds', 'Test', register=False, buckets=(1,))
+        for metric in (self.counter, self.gauge, self.histogram):
+            self.registry.register(metric)
+
+    def tearDown(self):
+        self.registry.configure(None)
+        shutil.rmtree(self.directory)
+
+    def write(self, pid, data):
+        with open(os.path.join(self.directory, '{}.json'.format(pid)), 'w') as output:
+            json.dump(data, output)
+
+    def test_values_of_processes_are_merged(self):
+        self.counter.inc(2, kind='a')
+        self.gauge.set(3)
+        self.histogram.observe(0.5)
+        self.write(os.getppid(), {'test_total': [[['a'], 5]], 'test_live': [[[], 4]],
+                                  'test_seconds': [[[], [0, 1, 2.0]]]})
+        self.write(unused_pid(), {'test_total': [[['a'], 1]], 'test_live': [[[], 100]]})
+        body = self.registry.render()
+        self.assertIn('test_total{kind="a"} 8.0', body)      # exited processes count too
+        self.assertIn('test_live 7.0', body)                  # gauges only of live processes
+        self.assertIn('test_seconds_count 2.0', body)
+        self.assertIn('test_seconds_sum 2.5', body)
+
+    def test_changes_are_flushed_by_timer(self):
+        self.registry.configure(self.directory, flush_interval=0.1)
+        for _ in range(2):      # metrics not registered globally notify the module registry
+            self.counter.inc(kind='a')
+            self.registry.changed()     # the second one within the interval, left to the timer
+        files = [name for name in os.listdir(self.directory) if name.endswith('.json')]
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].startswith('{}-'.format(os.getpid())))
+        time.sleep(0.3)
+        with open(os.path.join(self.directory, files[0])) as source:
+            self.assertEqual(json.load(source)['test_total'], [[['a'], 2]])
+
+    def test_reused_pid_keeps_file_of_exited_process(self):
+        self.write('{}-0123456789ab'.format(os.getpid()), {'test_total': [[['a'], 5]]})
+        self.counter.inc(kind='a')
+        self.assertIn('test_total{kind="a"} 6.0', self.registry.render())
+
+
+class AppMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            app.config['MONTRACKER_SERVER_ADDR'] = 'http://127.0.0.1:10000'
+            app.config['MONTRACKER_SERVER_API_VERSION'] = 'v1'
+            action = add_simple_action(db.session)
+            add_simple_models_analysis(db.session, action.id)
+            for model in Model.query:
+                model.update_result('1001')
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def metrics(self):
+        return self.app.get('/metrics').data.decode('utf8')
+
+    def test_request_latency_and_unfinished_models(self):
+        self.app.get('/app/api/v1/actions')
+        body = self.metrics()
+        self.assertIn('montracker_request_duration_seconds_count{endpoint="processor.actions",method="GET",'
+                      'status="200"}', body)
+        self.assertIn('montracker_unfinished_models{status="waiting"} 7.0', body)
+
+    @httpretty.activate
+    def test_poller_metrics(self):
+        httpretty.register_uri(httpretty.GET, 'http://127.0.0.1:10000/v1/analysis/1001',
+                               body=json.dumps({'status': 'finished', 'layer_ids': ['1'],
+                                                'finished_time': time.time() - 3}),
+                               content_type='application/json')
+        lags = detection_lag.count(source='poll')
+        errors = cs_utils.request_errors.get(operation='get_layers')
+        with app.app_context():
+            poll_unfinished_models()
+        self.assertEqual(detection_lag.count(source='poll'), lags + 7)
+        self.assertGreaterEqual(detection_lag.values()[('poll',)][-1], 7 * 3)
+        self.assertEqual(cs_utils.request_errors.get(operation='get_layers'), errors)
+        self.assertIn('montracker_poll_duration_seconds_count', self.metrics())
+
+    @httpretty.activate
+    def test_server_errors(self):
+        httpretty.register_uri(httpretty.GET, 'http://127.0.0.1:10000/v1/analysis/1001', status=500)
+        errors = cs_utils.request_errors.get(operation='get_layers')
+        with app.app_context():
+            poll_unfinished_models()
+        self.assertEqual(cs_utils.request_errors.get(operation='get_layers'), errors + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
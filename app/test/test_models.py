@@ -1,10 +1,11 @@
+import json
 import unittest
 import time
 import datetime
 import random
 from app.database import db, setup_db
 from app.helpers import AnalysisDataIncomplete
-from app.processor.models import Action, Analysis, Profile, Model, ModelType, PersonType, ModelStatus
+from app.processor.models import Action, Analysis, Profile, Model, ModelType, PersonType, ModelStatus, touch
 from sqlalchemy.exc import IntegrityError
 from test.fixtures import add_simple_action, add_analysis_with_coordinates, add_simple_model, add_complex_model_comb, \
     add_complex_model_seg, add_simple_models_analysis
@@ -612,5 +613,124 @@ class ActionTest(ModelsTest):
             self.assertEquals(action.action_status_id, processing_id)
 
 
+class ModelLoadingTest(ModelsTest):
+
+    def test_preloaded_models_need_no_queries(self):
+        from app.instrumentation import collect
+        with app.app_context():
+            analysis_ids = []
+            for _ in range(3):
+                action = add_simple_action(db.session)
+                analysis_ids.append(add_simple_models_analysis(db.session, action.id).id)
+            db.session.commit()
+            db.session.expire_all()
+
+            analyses = Analysis.query.filter(Analysis.id.in_(analysis_ids)).all()
+            with collect() as stats:
+                Analysis.preload_models(analyses)
+            self.assertEqual(stats.count, 2)    # models with types and layers, weights
+            with collect() as stats:
+                for analysis in analyses:
+                    self.assertEqual(len(analysis.simple_models()), len(analysis.model_list()))
+                    self.assertEqual(analysis.complex_models(), [])
+                    for model in analysis.model_list():
+                        self.assertIsNotNone(model.name)
+                        self.assertIsNotNone(model.weight)
+                        model.layer_urls()
+            self.assertEqual(stats.count, 0)
+
+    def test_preloaded_page_dumps_without_queries(self):
+        from app.instrumentation import collect
+        from app.processor.schemas import AnalysisSchema
+        with app.app_context():
+            analysis_ids = []
+            for _ in range(3):
+                action = add_simple_action(db.session)
+                analysis_ids.append(add_simple_models_analysis(db.session, action.id).id)
+            db.session.commit()
+            expected, _ = AnalysisSchema(many=True).dump(Analysis.query.filter(Analysis.id.in_(analysis_ids)))
+            ModelStatus.cached_id(ModelStatus.DRAFT)
+            db.session.expire_all()
+
+            analyses = Analysis.query.filter(Analysis.id.in_(analysis_ids)).all()
+            with collect() as stats:
+                Analysis.preload(analyses)
+            self.assertEqual(stats.count, 4)    # models, weights, profiles, actions
+            with collect() as stats:
+                data, _ = AnalysisSchema(many=True).dump(analyses)
+            self.assertEqual(stats.count, 0)
+            self.assertEqual(data, expected)
+
+
+class UpdatedAtTest(ModelsTest):
+
+    past = datetime.datetime(2000, 1, 1)
+
+    def add_analysis(self):
+        action = add_simple_action(db.session)
+        analysis = add_analysis_with_coordinates(db.session, action.id)
+        model = add_simple_model(db.session, analysis.id)
+        db.session.commit()
+        return action.id, analysis.id, model.id
+
+    def rewind(self):
+        for table in (Action.__table__, Analysis.__table__, Model.__table__):
+            db.session.execute(table.update().values(updated_at=self.past))
+        db.session.commit()
+        db.session.expire_all()
+
+    def updated(self, cls, row_id):
+        return cls.query.get(row_id).updated_at > self.past
+
+    def test_model_change_bumps_parents(self):
+        with app.app_context():
+            action_id, analysis_id, model_id = self.add_analysis()
+            self.rewind()
+            Model.query.get(model_id).update_result('1234')
+            db.session.commit()
+            self.assertTrue(self.updated(Model, model_id))
+            self.assertTrue(self.updated(Analysis, analysis_id))
+            self.assertTrue(self.updated(Action, action_id))
+
+    def test_touch_by_model_ids(self):
+        with app.app_context():
+            action_id, analysis_id, model_id = self.add_analysis()
+            other_action_id, other_analysis_id, _ = self.add_analysis()
+            self.rewind()
+            touch(db.session, model_ids=[model_id])
+            db.session.commit()
+            self.assertTrue(self.updated(Analysis, analysis_id))
+            self.assertTrue(self.updated(Action, action_id))
+            self.assertFalse(self.updated(Analysis, other_analysis_id))
+            self.assertFalse(self.updated(Action, other_action_id))
+
+    def test_updated_since_includes_removed(self):
+        with app.app_context():
+            action_id, analysis_id, _ = self.add_analysis()
+            archived_action_id, archived_analysis_id, _ = self.add_analysis()
+            unchanged_action_id, _, _ = self.add_analysis()
+            self.rewind()
+            since = datetime.datetime(2010, 1, 1)
+            Action.query.get(action_id).deleted = True
+            Action.query.get(archived_action_id).archived = True
+            db.session.commit()
+
+            actions = Action.filtered(deleted=None, updated_since=since).all()
+            self.assertEqual(sorted(action.id for action in actions), [action_id, archived_action_id])
+            analyses = Analysis.filtered(deleted=None, archived=None, updated_since=since).all()
+            self.assertEqual(sorted(analysis.id for analysis in analyses), [analysis_id, archived_analysis_id])
+            self.assertEqual(Analysis.filtered(updated_since=since).all(), [])
+
+    def test_updated_since_overlap(self):
+        with app.app_context():
+            action_id, _, _ = self.add_analysis()
+            self.rewind()
+        overlap = app.config['DELTA_SYNC_OVERLAP_SEC']
+        for seconds, expected in ((overlap - 10, [action_id]), (overlap + 10, [])):
+            since = int((self.past + datetime.timedelta(seconds=seconds)).timestamp())
+            response = self.app.get('/app/api/v1/actions?updated_since={}'.format(since))
+            self.assertEqual([action['id'] for action in json.loads(response.data.decode('utf8'))], expected)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,98 @@
+import json
+import unittest
+
+from app.database import db, setup_db
+from app.instrumentation import collect
+from app.processor.models import Action, Analysis, ModelStatus
+from test.fixtures import add_simple_action, add_simple_models_analysis
+from testing import app
+
+SERVER_PATH = '/app/api/v1'
+
+
+class PartialUpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            action = add_simple_action(db.session)
+            self.action_id = action.id
+            self.analysis_id = add_simple_models_analysis(db.session, action.id).id
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def patch(self, path, data):
+        response = self.app.patch(SERVER_PATH + path, data=json.dumps(data), content_type='application/json')
+        return response, json.loads(response.data.decode('utf8'))
+
+    def test_action_fields_are_updated_with_version(self):
+        with collect() as stats:
+            response, data = self.patch('/actions/%s' % self.action_id, {'archived': True, 'version': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['version'], 2)
+        self.assertTrue(data['archived'])
+        self.assertNotIn('analyses', data)
+        self.assertLessEqual(stats.count, 4)      # select, update, touch of analyses, refresh
+        with app.app_context():
+            action = Action.query.get(self.action_id)
+            self.assertTrue(action.archived)
+            self.assertEqual(action.name, 'Example')
+
+    def test_stale_version_is_rejected(self):
+        response, _ = self.patch('/actions/%s' % self.action_id, {'name': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+        response, data = self.patch('/actions/%s' % self.action_id, {'name': 'Again', 'version': 1})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(data['internal_code'], 'error_conflict')
+        with app.app_context():
+            self.assertEqual(Action.query.get(self.action_id).name, 'Renamed')
+
+    def test_only_given_fields_are_validated(self):
+        response, data = self.patch('/actions/%s' % self.action_id, {'name': ''})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(list(data['invalid_fields']), ['name'])
+        response, data = self.patch('/actions/%s' % self.action_id, {'version': 'x'})
+        self.assertEqual(response.status_code, 422)
+
+    def test_invalid_nested_objects_are_rejected(self):
+        response, data = self.patch('/analyses/%s' % self.analysis_id, {'models': [{'weight': 'x'}]})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(list(data['invalid_fields']), ['models'])
+        response, data = self.patch('/analyses/%s' % self.analysis_id, {'profiles': [{'person_type_id': -1}]})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(list(data['invalid_fields']), ['profiles'])
+        with app.app_context():
+            self.assertEqual(Analysis.query.get(self.analysis_id).version, 1)
+
+    def test_analysis_keeps_models_not_given(self):
+        with app.app_context():
+            models = Analysis.query.get(self.analysis_id).models.count()
+        response, data = self.patch('/analyses/%s' % self.analysis_id, {'name': 'Renamed', 'version': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['version'], 2)
+        with app.app_context():
+            analysis = Analysis.query.get(self.analysis_id)
+            self.assertEqual(analysis.name, 'Renamed')
+            self.assertEqual(analysis.models.count(), models)
+
+    def test_status_name(self):
+        with app.app_context():
+            analysis = Analysis.query.get(self.analysis_id)
+            status = ModelStatus.query.get(analysis.analysis_status_id)
+            self.assertEqual(analysis.status_name(), status.name)
+            for model in analysis.models:
+                model.status_id = ModelStatus.by_name(ModelStatus.WAITING).id
+            db.session.flush()
+            self.assertEqual(analysis.status_name(), ModelStatus.WAITING)
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from app import create_app
+from app.profiling import init_profiling, list_profiles, rotate, read_folded, render_folded, render_pstats, \
+    flamegraph_svg
+
+TOKEN = 'profile-secret'
+
+
+def create_profiled_app(directory, mode):
+    app = create_app('config.TestConfig', config_pyfile='test.py')
+    app.config.update(PROFILING_ENABLED=True, PROFILING_TOKEN=TOKEN, PROFILING_DIR=directory, PROFILING_MODE=mode,
+                      PROFILING_SAMPLE_INTERVAL_SEC=0.001)
+    init_profiling(app)
+
+    @app.route('/slow')
+    def slow():
+        deadline = time.time() + 0.05
+        while time.time() < deadline:
+            sum(range(1000))
+        return 'done'
+    return app
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get(self, app, headers=None):
+        return app.test_client().get('/slow', headers=headers or {})
+
+    def test_requests_without_token_are_not_profiled(self):
+        app = create_profiled_app(self.directory, 'cprofile')
+        for headers in (None, {'X-Profile': 'wrong'}):
+            response = self.get(app, headers)
+            self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(list_profiles(self.directory), [])
+
+    def test_cprofile(self):
+        app = create_profiled_app(self.directory, 'cprofile')
+        response = self.get(app, {'X-Profile': TOKEN})
+        name = response.headers['X-Profile-Id']
+        self.assertTrue(name.endswith('.pstats'))
+        self.assertEqual([profile[0] for profile in list_profiles(self.directory)], [name])
+        self.assertIn('slow', render_pstats(os.path.join(self.directory, name)))
+
+    def test_sampling(self):
+        app = create_profiled_app(self.directory, 'sample')
+        response = self.get(app, {'X-Profile': TOKEN})
+        path = os.path.join(self.directory, response.headers['X-Profile-Id'])
+        self.assertTrue(path.endswith('.folded'))
+        stacks = read_folded(path)
+        self.assertIn(':slow', render_folded(path))
+        self.assertIn('<svg', flamegraph_svg(stacks))
+
+    def test_rotation(self):
+        for index in range(5):
+            path = os.path.join(self.directory, 'profile-{}.pstats'.format(index))
+            with open(path, 'w') as profile:
+                profile.write('x' * 100)
+            os.utime(path, (index, index))
+        rotate(self.directory, 250)
+        self.assertEqual(sorted(profile[0] for profile in list_profiles(self.directory)),
+                         ['profile-3.pstats', 'profile-4.pstats'])
+
+
+if __name__ == '__main__':
+    unittest.main()
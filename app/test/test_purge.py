@@ -0,0 +1,107 @@
+import datetime
+import unittest
+
+from sqlalchemy import event, select, func
+from app.database import db, setup_db
+from app.processor.archive import archive_actions, ARCHIVE_TABLES, HOT_TABLES
+from app.processor.models import Action, Analysis, ResultLayers
+from app.processor.purge import purge, purged_rows
+from test.fixtures import add_simple_action, add_complete_analysis
+from testing import app
+
+
+class PurgeTest(unittest.TestCase):
+
+    past = datetime.datetime(2000, 1, 1)
+
+    def setUp(self):
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            self.action_id = add_simple_action(db.session).id
+            self.kept_id = add_complete_analysis(db.session, self.action_id).id
+            self.deleted_id = add_complete_analysis(db.session, self.action_id).id
+            Analysis.query.get(self.deleted_id).deleted = True
+            db.session.commit()
+            self.rewind()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def rewind(self):
+        for table in (Action.__table__, Analysis.__table__):
+            db.session.execute(table.update().values(updated_at=self.past))
+        db.session.commit()
+
+    @staticmethod
+    def count(table):
+        return db.session.execute(select([func.count()]).select_from(table)).scalar()
+
+    def test_purges_old_deleted_analyses(self):
+        with app.app_context():
+            analyses, models = self.count(HOT_TABLES[0]), self.count(HOT_TABLES[1])
+            reclaimed = purge(pause=0)
+            self.assertEqual(reclaimed['analyses'], 1)
+            self.assertEqual(reclaimed['models'], 9)
+            self.assertEqual(reclaimed['profiles'], 2)
+            self.assertEqual(self.count(HOT_TABLES[0]), analyses - 1)
+            self.assertEqual(self.count(HOT_TABLES[1]), models - 9)
+            self.assertIsNotNone(Analysis.query.get(self.kept_id))
+            self.assertEqual(purge(pause=0), {})
+
+    def test_dry_run_removes_nothing(self):
+        with app.app_context():
+            counts = [self.count(table) for table in HOT_TABLES]
+            self.assertEqual(purge(dry_run=True, pause=0), purge(dry_run=True, pause=0))
+            self.assertEqual(purge(dry_run=True, pause=0)['analyses'], 1)
+            self.assertEqual([self.count(table) for table in HOT_TABLES], counts)
+
+    def test_retention(self):
+        with app.app_context():
+            self.assertEqual(purge(retention_days=365 * 100, pause=0), {})
+
+    def test_purges_archived_actions_and_unused_layers(self):
+        with app.app_context():
+            db.session.execute(ResultLayers.__table__.insert().values(result_id='unused', layer_ids='[]'))
+            action = Action.query.get(self.action_id)
+            action.deleted = True
+            db.session.commit()
+            self.rewind()
+            self.assertEqual(archive_actions(), [self.action_id])
+            purged = purged_rows.get(table='actions')
+
+            reclaimed = purge(pause=0)
+            self.assertEqual(reclaimed['actions'], 1)
+            self.assertEqual(reclaimed['result_layers'], 1)
+            self.assertEqual(purged_rows.get(table='actions'), purged + 1)
+            for table in HOT_TABLES + ARCHIVE_TABLES + (Action.__table__, ResultLayers.__table__):
+                self.assertEqual(self.count(table), 0, table.name)
+
+    def test_purges_deleted_actions_with_hot_analyses(self):
+        def enforce_foreign_keys(connection, record):
+            connection.execute('PRAGMA foreign_keys=ON')
+
+        with app.app_context():
+            # hot analyses not purged on their own are removed with their action
+            db.session.execute(Action.__table__.update().values(deleted=True))
+            Analysis.query.get(self.deleted_id).deleted = False
+            db.session.commit()
+            self.rewind()
+            db.session.close()
+            event.listen(db.engine, 'connect', enforce_foreign_keys)
+            try:
+                reclaimed = purge(retention_days=0, pause=0)    # not archived yet
+            finally:
+                db.session.close()
+                event.remove(db.engine, 'connect', enforce_foreign_keys)
+            self.assertEqual(reclaimed['actions'], 1)
+            self.assertEqual(reclaimed['models'], 18)
+            for table in HOT_TABLES + (Action.__table__,):
+                self.assertEqual(self.count(table), 0, table.name)
+
+
+if __name__ == '__main__':
+    unittest.main()
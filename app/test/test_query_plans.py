@@ -0,0 +1,127 @@
+import datetime
+import json
+import unittest
+
+from app.database import db, setup_db
+from app.processor.models import Action, Analysis, Model, ModelType, ModelStatus, ResultLayers, Profile, \
+    ModelWeight, PersonType
+from app.processor.poller import unfinished_models_query
+from testing import app
+
+POSTGRESQL = app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql')
+
+ACTIONS = 2000
+ANALYSES_PER_ACTION = 5
+MODELS_PER_ANALYSIS = 4
+LARGE_TABLES = {'actions', 'analyses', 'models', 'result_layers', 'profiles', 'model_weights'}
+
+
+def seed(session):
+    """
+    Bulk inserts a dataset large enough for the planner to prefer indexes: most items
+    are not deleted and nearly all models are finished, as in production.
+    """
+    statuses = {status.name: status.id for status in ModelStatus.query}
+    model_type_ids = [model_type.id for model_type in ModelType.query.filter_by(complex=False)]
+    person_type_id = PersonType.query.first().id
+    start = datetime.datetime(2016, 1, 1)
+
+    session.execute(Action.__table__.insert(), [
+        {'id': i + 1, 'name': 'Action {}'.format(i), 'lost_time': start, 'deleted': i % 50 == 0,
+         'archived': i % 3 == 0, 'creation_time': start + datetime.timedelta(minutes=i), 'updated_at': start}
+        for i in range(ACTIONS)])
+    analyses = [{'id': i + 1, 'action_id': i // ANALYSES_PER_ACTION + 1, 'name': 'Analysis {}'.format(i),
+                 'active': True, 'deleted': i % 40 == 0, 'creation_time': start + datetime.timedelta(seconds=i),
+                 'updated_at': start}
+                for i in range(ACTIONS * ANALYSES_PER_ACTION)]
+    session.execute(Analysis.__table__.insert(), analyses)
+    models = [{'id': i + 1, 'analysis_id': i // MODELS_PER_ANALYSIS + 1,
+               'model_type_id': model_type_ids[i % MODELS_PER_ANALYSIS % len(model_type_ids)],
+               'status_id': statuses[ModelStatus.WAITING] if i % 2000 == 0 else statuses[ModelStatus.FINISHED],
+               'result_id': str(i), 'updated_at': start}
+              for i in range(len(analyses) * MODELS_PER_ANALYSIS)]
+    session.execute(Model.__table__.insert(), models)
+    session.execute(ResultLayers.__table__.insert(), [{'result_id': model['result_id'], 'layer_ids': '["1", "2"]'}
+                                                      for model in models])
+    session.execute(ModelWeight.__table__.insert(), [{'model_id': model['id'], 'child_model_id': model['id'],
+                                                      'weight': 1} for model in models])
+    session.execute(Profile.__table__.insert(), [{'analysis_id': analysis['id'], 'person_type_id': person_type_id,
+                                                  'weight': 1} for analysis in analyses])
+    session.commit()
+    for table in sorted(LARGE_TABLES):
+        session.execute('ANALYZE {}'.format(table))
+    session.commit()
+
+
+def seq_scans(plan):
+    """Yields names of large tables read by sequential scan anywhere in the plan."""
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in LARGE_TABLES:
+        yield plan['Relation Name']
+    for child in plan.get('Plans', []):
+        for relation in seq_scans(child):
+            yield relation
+
+
+@unittest.skipUnless(POSTGRESQL, 'query plans are checked on PostgreSQL only')
+class QueryPlanTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            seed(db.session)
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+
+    def explain(self, query):
+        statement = query.statement.compile(dialect=db.engine.dialect)
+        result = db.session.connection().execute('EXPLAIN (FORMAT JSON) ' + str(statement), statement.params)
+        plan = result.scalar()
+        return (json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan']
+
+    def assertIndexed(self, query):
+        plan = self.explain(query)
+        self.assertEqual(list(seq_scans(plan)), [], msg=json.dumps(plan, indent=2))
+
+    def test_action_list(self):
+        with app.app_context():
+            page_ts = datetime.datetime(2016, 1, 2)
+            for archived in (None, False):
+                query = Action.filtered(archived=archived).filter(Action.creation_time <= page_ts).\
+                    order_by(Action.creation_time.desc()).limit(20)
+                self.assertIndexed(query)
+
+    def test_analysis_list(self):
+        with app.app_context():
+            self.assertIndexed(Analysis.filtered().order_by(Analysis.creation_time.desc()).limit(20))
+
+    def test_action_detail(self):
+        with app.app_context():
+            action = Action.query.get(ACTIONS // 2)
+            self.assertIndexed(Action.query.filter(Action.id == action.id))
+            self.assertIndexed(action.analyses)
+
+    def test_analysis_detail(self):
+        with app.app_context():
+            analysis = Analysis.query.get(ACTIONS)
+            model = analysis.models.first()
+            result_layers = ResultLayers.query.filter(ResultLayers.result_id == model.result_id)
+            for query in (analysis.models, analysis.profiles, result_layers, model.model_weights,
+                          model.child_model_weights):
+                self.assertIndexed(query)
+
+    def test_poller(self):
+        with app.app_context():
+            statuses = {status.name: status.id for status in ModelStatus.query}
+            self.assertIndexed(unfinished_models_query(statuses))
+
+
+if __name__ == '__main__':
+    unittest.main()
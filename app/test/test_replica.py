@@ -0,0 +1,93 @@
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+from app.database import db, setup_db, configure_replica, REPLICA
+from app.processor.models import Action
+from testing import app
+
+SERVER_PATH = '/app/api/v1'
+
+
+class ReplicaRoutingTest(unittest.TestCase):
+    """
+    Primary and replica are two independent SQLite databases, so the database
+    that served a read is recognized by the name of the returned action.
+    """
+
+    def setUp(self):
+        self.app = app.test_client()
+        handle, self.replica_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        app.config['SQLALCHEMY_READ_REPLICA_URI'] = 'sqlite:///' + self.replica_path
+        configure_replica(app)
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            state = db.get_app().extensions['sqlalchemy']
+            state.connectors.pop(REPLICA, None)     # new replica file for every test
+            replica = db.get_engine(app, bind=REPLICA)
+            db.metadata.create_all(replica)
+            self.action_id = self.add_action(db.engine, 'primary')
+            self.add_action(replica, 'replica')
+        db.replica_monitor.reset()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+            db.get_engine(app, bind=REPLICA).dispose()
+        app.config['SQLALCHEMY_READ_REPLICA_URI'] = None
+        app.config['SQLALCHEMY_BINDS'] = None
+        db.replica_monitor.__dict__.pop('lag', None)
+        db.replica_monitor.reset()
+        os.remove(self.replica_path)
+
+    @staticmethod
+    def add_action(engine, name):
+        now = datetime.datetime.now()
+        return engine.execute(Action.__table__.insert().values(
+            id=1, name=name, lost_time=now, creation_time=now, updated_at=now, deleted=False, archived=False)).\
+            inserted_primary_key[0]
+
+    def action_name(self, client=None):
+        response = (client or self.app).get('{}/actions/{}'.format(SERVER_PATH, self.action_id))
+        if response.status_code == 404:
+            return None     # deleted on primary
+        return json.loads(response.data.decode('utf8'))['name']
+
+    def delete_action(self):
+        response = self.app.delete('{}/actions/{}'.format(SERVER_PATH, self.action_id))
+        self.assertEqual(response.status_code, 204)
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.action_name(), 'replica')
+
+    def test_writes_go_to_primary(self):
+        self.delete_action()
+        with app.app_context():
+            self.assertTrue(Action.query.get(self.action_id).deleted)
+
+    def test_read_your_writes(self):
+        self.delete_action()
+        self.assertIsNone(self.action_name())
+        self.assertEqual(self.action_name(app.test_client()), 'replica')
+
+    def test_cold_action_is_checked_on_primary(self):
+        with app.app_context():
+            db.session.execute(Action.__table__.update().values(cold=True))
+            db.session.commit()
+        self.assertEqual(self.action_name(), 'primary')     # restored, the rest read from primary
+        with app.app_context():
+            self.assertFalse(Action.query.get(self.action_id).cold)
+
+    def test_lagging_replica_is_not_used(self):
+        db.replica_monitor.lag = lambda connection: app.config['REPLICA_MAX_LAG_SEC'] + 1
+        self.assertEqual(self.action_name(), 'primary')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,16 @@
+import datetime
 import json
 import unittest
 
 import requests
 from app.processor import cs_utils
-from app.processor.models import ModelStatus, Model, ModelType
+from app.processor.models import ModelStatus, Model, Analysis, ResultLayers, StatusTransition
 from flask import current_app
 from test.fixtures import add_simple_action, add_analysis_with_coordinates, add_complete_analysis, \
     add_simple_models_analysis, add_complex_models_analysis, add_simple_model
 from testing import app
 from app.database import db, setup_db
+from app.simulator import CalculationServerSimulator, SimulatorSettings, SimulatorServer
 import httpretty
 
 SERVER_PATH = 'app/api/v1'
@@ -84,8 +86,8 @@ class AnalysisComputationTest(ModelsTest):
             analysis = add_complex_models_analysis(db.session, action.id)
             for model in analysis.simple_models():
                 model.update_result(result_ids[model.name])
-            draft_simple_models = analysis.draft_models().join(Model.model_type).filter(ModelType.complex == False)
-            assert draft_simple_models.count() == 0
+            draft_simple_models = analysis.simple_models(analysis.draft_models())
+            assert len(draft_simple_models) == 0
             analysis.start_computation()
             for model in analysis.complex_models():
                 self.assertEquals(model.result_id, expected_content[model.name])
@@ -168,9 +170,268 @@ class AnalysisComputationTest(ModelsTest):
             assert model.status_id == finished_id
             assert analysis.analysis_status_id == finished_id
             assert len(model.layer_urls()) == layers_count
-            layer_paths = [layer_path(layers_id) for layers_id in expected_content['layer_ids']]
             for l in model.layer_urls():
-                assert l in layer_paths
+                assert l in expected_content['layer_ids']
+
+
+class PollerTest(ModelsTest):
+
+    @httpretty.activate
+    def test_poller_batch(self):
+        finished = {"status": "finished", "layer_ids": ["432542345", "785642345"]}
+        for result_id in ('1001', '1002'):
+            httpretty.register_uri(httpretty.GET, server_path('analysis/%s' % result_id),
+                                   body=json.dumps(finished), content_type="application/json")
+        httpretty.register_uri(httpretty.GET, server_path('analysis/1003'),
+                               body=json.dumps({"status": "computing"}), content_type="application/json")
+
+        with app.app_context():
+            action = add_simple_action(db.session)
+            analysis = add_simple_models_analysis(db.session, action.id)
+            models = analysis.simple_models()[:3]
+            for model, result_id in zip(models, ('1001', '1002', '1003')):
+                model.update_result(result_id)
+            db.session.commit()
+            model_ids = [model.id for model in models]
+
+            updated = Model.update_state_from_server()
+            self.assertEqual(updated, set(model_ids))
+            self.assertEqual(Model.update_state_from_server(), set())
+
+            finished_id = ModelStatus.by_name(ModelStatus.FINISHED).id
+            processing_id = ModelStatus.by_name(ModelStatus.PROCESSING).id
+            statuses = [Model.query.get(model_id).status_id for model_id in model_ids]
+            self.assertEqual(statuses, [finished_id, finished_id, processing_id])
+            self.assertEqual([len(Model.query.get(model_id).layer_urls()) for model_id in model_ids], [2, 2, 0])
+
+    @httpretty.activate
+    def test_result_layers_are_shared(self):
+        httpretty.register_uri(httpretty.GET, server_path('analysis/1001'),
+                               body=json.dumps({"status": "finished", "layer_ids": ["1", "2"]}),
+                               content_type="application/json")
+        with app.app_context():
+            action = add_simple_action(db.session)
+            analysis = add_analysis_with_coordinates(db.session, action.id)
+            model = add_simple_model(db.session, analysis.id)
+            model.update_result('1001')
+            duplicate = model.duplicate(add_analysis_with_coordinates(db.session, action.id).id)
+            db.session.commit()
+
+            self.assertEqual(Model.update_state_from_server(), {model.id, duplicate.id})
+            model.apply_server_result({"status": "finished", "layer_ids": ["1", "2"]})
+            self.assertEqual(ResultLayers.query.count(), 1)
+            self.assertEqual(model.layer_urls(), ["1", "2"])
+            self.assertEqual(duplicate.layer_urls(), ["1", "2"])
+
+    @httpretty.activate
+    def test_poller_keeps_concurrent_transition(self):
+        httpretty.register_uri(httpretty.GET, server_path('analysis/1001'),
+                               body=json.dumps({"status": "finished", "layer_ids": ["1"]}),
+                               content_type="application/json")
+        with app.app_context():
+            from app.processor.poller import collect_results
+            action = add_simple_action(db.session)
+            analysis = add_analysis_with_coordinates(db.session, action.id)
+            model = add_simple_model(db.session, analysis.id)
+            model.update_result('1001')
+            db.session.commit()
+
+            statuses = {status.name: status.id for status in ModelStatus.query}
+            batch = collect_results(statuses)
+            model.apply_server_result({"status": "finished", "layer_ids": ["1"]})   # e.g. by callback
+            db.session.commit()
+
+            self.assertEqual(batch.apply(db.session), set())
+            db.session.commit()
+            self.assertEqual(len(model.layer_urls()), 1)
+
+
+class SimulatorTest(ModelsTest):
+
+    def setUp(self):
+        super(SimulatorTest, self).setUp()
+        self.now = 1000.0
+        settings = SimulatorSettings(stage_durations={stage: 1 for stage in ('waiting', 'computing',
+                                                                             'loading', 'converting')},
+                                     layers=(2, 2), seed=1)
+        self.server = SimulatorServer(CalculationServerSimulator(settings, clock=lambda: self.now)).start()
+        app.config['MONTRACKER_SERVER_ADDR'] = self.server.url
+
+    def tearDown(self):
+        self.server.stop()
+        super(SimulatorTest, self).tearDown()
+
+    def test_status_progression(self):
+        simulator = self.server.simulator
+        result_id = simulator.submit(['HorDistIPP'])['HorDistIPP']
+        statuses = []
+        for _ in range(5):
+            statuses.append(simulator.result(result_id)['status'])
+            self.now += 1
+        self.assertEqual(statuses, ['waiting', 'computing', 'loading', 'converting', 'finished'])
+        self.assertEqual(len(simulator.result(result_id)['layer_ids']), 2)
+
+    def test_error_rate(self):
+        self.server.simulator.settings.error_rate = 1.0
+        result_id = self.server.simulator.submit(['HorDistIPP'])['HorDistIPP']
+        self.now += 10
+        self.assertEqual(self.server.simulator.result(result_id), {'status': 'error', 'finished_time': 1002.0})
+
+    def test_computation_end_to_end(self):
+        with app.app_context():
+            action = add_simple_action(db.session)
+            analysis = add_complex_models_analysis(db.session, action.id)
+            analysis.start_computation()
+            waiting_id = ModelStatus.by_name(ModelStatus.WAITING).id
+            self.assertEqual(analysis.analysis_status_id, waiting_id)
+
+            self.now += 10
+            Model.update_state_from_server()
+
+            finished_id = ModelStatus.by_name(ModelStatus.FINISHED).id
+            self.assertEqual(analysis.analysis_status_id, finished_id)
+            for model in analysis.models:
+                self.assertEqual(len(model.layer_urls()), 2)
+
+
+class ResultCallbackTest(ModelsTest):
+
+    token = 'callback_secret'
+
+    def setUp(self):
+        super(ResultCallbackTest, self).setUp()
+        app.config['MONTRACKER_CALLBACK_TOKEN'] = self.token
+        self.now = 1000.0
+        settings = SimulatorSettings(stage_durations={stage: 1 for stage in ('waiting', 'computing',
+                                                                             'loading', 'converting')},
+                                     layers=(3, 3), seed=2)
+        self.simulator = CalculationServerSimulator(settings, clock=lambda: self.now)
+
+    def tearDown(self):
+        app.config['MONTRACKER_CALLBACK_TOKEN'] = None
+        super(ResultCallbackTest, self).tearDown()
+
+    def callback(self, result_id, data, token=None):
+        return self.app.post('/{}/results/{}'.format(SERVER_PATH, result_id),
+                             data=json.dumps(data), content_type='application/json',
+                             headers={'Authorization': 'Token {}'.format(token or self.token)})
+
+    def add_waiting_model(self, result_id):
+        with app.app_context():
+            action = add_simple_action(db.session)
+            analysis = add_analysis_with_coordinates(db.session, action.id)
+            model = add_simple_model(db.session, analysis.id)
+            model.update_result(result_id)
+            db.session.commit()
+            return model.id
+
+    def test_callback_requires_token(self):
+        model_id = self.add_waiting_model('1234')
+        response = self.callback('1234', {'status': 'finished', 'layer_ids': ['1']}, token='invalid')
+        self.assertEqual(response.status_code, 401)
+        with app.app_context():
+            self.assertEqual(Model.query.get(model_id).status_id, ModelStatus.by_name(ModelStatus.WAITING).id)
+
+    def test_callback_unknown_result(self):
+        response = self.callback('4321', {'status': 'finished', 'layer_ids': ['1']})
+        self.assertEqual(response.status_code, 404)
+
+    def test_callback_is_idempotent(self):
+        model_id = self.add_waiting_model('1234')
+        finished = {'status': 'finished', 'layer_ids': ['1', '2']}
+        for data in (finished, finished, {'status': 'computing'}):
+            self.assertEqual(self.callback('1234', data).status_code, 200)
+        with app.app_context():
+            model = Model.query.get(model_id)
+            self.assertEqual(model.status_id, ModelStatus.by_name(ModelStatus.FINISHED).id)
+            self.assertEqual(len(model.layer_urls()), 2)
+
+    def test_simulator_pushes_transitions(self):
+        with app.app_context():
+            action = add_simple_action(db.session)
+            analysis = add_simple_models_analysis(db.session, action.id)
+            result_ids = self.simulator.submit(analysis.cs_simple_models(), callback_url='http://app/results')
+            for model in analysis.simple_models():
+                model.update_result(result_ids[model.name])
+            db.session.commit()
+            analysis_id = analysis.id
+
+        for _ in range(6):
+            for url, payload in self.simulator.due_callbacks():
+                self.assertEqual(self.callback(url.rsplit('/', 1)[1], payload).status_code, 200)
+            self.now += 1
+
+        with app.app_context():
+            analysis = Analysis.query.get(analysis_id)
+            self.assertEqual(analysis.analysis_status_id, ModelStatus.by_name(ModelStatus.FINISHED).id)
+            for model in analysis.models:
+                self.assertEqual(len(model.layer_urls()), 3)
+
+
+class NotificationsTest(ResultCallbackTest):
+
+    def notifications(self, query=''):
+        response = self.app.get('/{}/notifications{}'.format(SERVER_PATH, query))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data.decode('utf8'))
+
+    def test_transitions_are_logged(self):
+        model_id = self.add_waiting_model('1234')
+        self.callback('1234', {'status': 'computing'})
+        self.callback('1234', {'status': 'finished', 'layer_ids': ['1']})
+        self.callback('1234', {'status': 'finished', 'layer_ids': ['1']})
+
+        with app.app_context():
+            statuses = {status.name: status.id for status in ModelStatus.query}
+        transitions = [(t['kind'], t['previous_status_id'], t['status_id'])
+                       for t in self.notifications('?since=0') if t['model_id'] == model_id]
+        self.assertEqual(transitions, [
+            ('model', statuses[ModelStatus.DRAFT], statuses[ModelStatus.WAITING]),
+            ('model', statuses[ModelStatus.WAITING], statuses[ModelStatus.PROCESSING]),
+            ('model', statuses[ModelStatus.PROCESSING], statuses[ModelStatus.FINISHED]),
+        ])
+        analysis_statuses = [t['status_id'] for t in self.notifications('?since=0') if t['kind'] == 'analysis']
+        self.assertEqual(analysis_statuses[-1], statuses[ModelStatus.FINISHED])
+
+    def test_since_and_limit(self):
+        self.add_waiting_model('1234')
+        self.callback('1234', {'status': 'computing'})
+        all_transitions = self.notifications('?since=0')
+        ids = [t['id'] for t in all_transitions]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(self.notifications('?since={}'.format(ids[0])), all_transitions[1:])
+        self.assertEqual(self.notifications('?since=0&limit=1'), all_transitions[:1])
+        self.assertEqual(self.notifications('?since={}'.format(ids[-1])), [])
+
+    def test_transitions_after_gap_wait_for_it(self):
+        self.add_waiting_model('1234')
+        self.callback('1234', {'status': 'computing'})
+        ids = [t['id'] for t in self.notifications('?since=0')]
+        self.assertGreater(len(ids), 2)
+        with app.app_context():
+            StatusTransition.query.filter_by(id=ids[1]).delete()     # uncommitted yet
+            db.session.commit()
+        self.assertEqual([t['id'] for t in self.notifications('?since=0')], ids[:1])
+        with app.app_context():
+            StatusTransition.query.update({'time': datetime.datetime(2026, 1, 1)})     # committed long ago
+            db.session.commit()
+        self.assertEqual([t['id'] for t in self.notifications('?since=0')], ids[:1] + ids[2:])
+
+    def test_stream_resumes_after_last_event_id(self):
+        timeout, app.config['NOTIFICATIONS_STREAM_TIMEOUT_SEC'] = app.config['NOTIFICATIONS_STREAM_TIMEOUT_SEC'], 0
+        try:
+            self.add_waiting_model('1234')
+            self.callback('1234', {'status': 'computing'})
+            first_id = self.notifications('?since=0')[0]['id']
+            response = self.app.get('/{}/notifications/stream'.format(SERVER_PATH),
+                                    headers={'Last-Event-ID': str(first_id)})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            events = [chunk for chunk in response.data.decode('utf8').split('\n\n') if chunk.startswith('id:')]
+            self.assertTrue(events)
+            self.assertNotIn('id: {}\n'.format(first_id), events)
+        finally:
+            app.config['NOTIFICATIONS_STREAM_TIMEOUT_SEC'] = timeout
 
 
 def server_path(endpoint):
@@ -0,0 +1,75 @@
+import re
+import time
+import unittest
+
+from flask import g
+from app import instrumentation
+from app.database import db, setup_db
+from app.timing import Timings, timed
+from test.fixtures import add_simple_action, add_simple_models_analysis
+from testing import app
+
+
+def parse(header):
+    timings = {}
+    for metric in header.split(', '):
+        name = metric.split(';')[0]
+        timings[name] = float(re.search(r'dur=([0-9.]+)', metric).group(1))
+    return timings
+
+
+class ServerTimingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            action = add_simple_action(db.session)
+            add_simple_models_analysis(db.session, action.id)
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def test_breakdown(self):
+        response = self.app.get('/app/api/v1/actions')
+        timings = parse(response.headers['Server-Timing'])
+        self.assertEqual(set(timings), {'db', 'validation', 'serialization', 'cs', 'total'})
+        self.assertGreater(timings['db'], 0)
+        self.assertGreater(timings['serialization'], 0)
+        self.assertEqual(timings['cs'], 0)
+        # statements run during serialization (lazy loads) count in db only
+        self.assertGreaterEqual(timings['total'], timings['db'] + timings['serialization'])
+        self.assertIn('db;desc="', response.headers['Server-Timing'])
+
+    def test_nested_phases_are_counted_once(self):
+        with app.test_request_context():
+            g.timings = Timings()
+            try:
+                with timed('cs'):
+                    with timed('cs'):
+                        time.sleep(0.05)
+                    self.assertIn('cs', g.timings.active)
+                self.assertGreaterEqual(g.timings.durations['cs'], 0.05)
+                self.assertLess(g.timings.durations['cs'], 0.1)
+            finally:
+                instrumentation.pop(g.timings.sql_stats)
+        with app.app_context():
+            with timed('cs'):       # outside of timed requests
+                pass
+
+    def test_other_blueprints_and_disabled(self):
+        self.assertNotIn('Server-Timing', self.app.get('/metrics').headers)
+        app.config['SERVER_TIMING'] = False
+        try:
+            self.assertNotIn('Server-Timing', self.app.get('/app/api/v1/actions').headers)
+        finally:
+            app.config['SERVER_TIMING'] = True
+
+
+if __name__ == '__main__':
+    unittest.main()
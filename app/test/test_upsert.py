@@ -0,0 +1,77 @@
+import unittest
+
+from sqlalchemy.exc import IntegrityError
+from app.database import db, setup_db, upsert
+from app.instrumentation import collect
+from app.processor.models import Analysis, Model, ModelType, PersonType, Profile
+from test.fixtures import add_simple_action, add_complex_models_analysis
+from testing import app
+
+
+class UpsertTest(unittest.TestCase):
+
+    def setUp(self):
+        with app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+            setup_db(db.session)
+            action = add_simple_action(db.session)
+            self.analysis_id = add_complex_models_analysis(db.session, action.id).id
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.close()
+
+    def person_type_id(self, name):
+        return PersonType.query.filter_by(name=name).one().id
+
+    def test_upsert(self):
+        with app.app_context():
+            table = Profile.__table__
+            tourist, hunter = self.person_type_id('tourist'), self.person_type_id('hunter')
+            upsert(db.session, table, [{'analysis_id': self.analysis_id, 'person_type_id': tourist, 'weight': 9},
+                                       {'analysis_id': self.analysis_id, 'person_type_id': hunter, 'weight': 4}],
+                   index_elements=('analysis_id', 'person_type_id'), update_columns=('weight',))
+            weights = {profile.person_type.name: profile.weight
+                       for profile in Profile.query.filter_by(analysis_id=self.analysis_id)}
+            self.assertEqual(weights, {'tourist': 9, 'hunter': 4, 'climber': 7})
+
+    def test_profiles_are_replaced(self):
+        with app.app_context():
+            analysis = Analysis.query.get(self.analysis_id)
+            analysis.create_or_update_profiles([{'person_type_id': self.person_type_id('tourist'), 'weight': 1},
+                                                {'person_type_id': self.person_type_id('hunter'), 'weight': 2}])
+            db.session.commit()
+            weights = {profile.person_type.name: profile.weight for profile in analysis.profiles}
+            self.assertEqual(weights, {'tourist': 1, 'hunter': 2})
+
+    def test_weights_are_updated_with_one_statement(self):
+        with app.app_context():
+            analysis = Analysis.query.get(self.analysis_id)
+            models = [{'model_type_id': model.model_type_id, 'weight': None if model.complex else index}
+                      for index, model in enumerate(analysis.models)]
+            with collect(record=True) as stats:
+                analysis.create_or_update_models(models)
+            self.assertEqual(len([s for s in stats.statements if s.startswith('UPDATE model_weights')]), 1)
+            db.session.commit()
+            expected = {m['model_type_id']: m['weight'] for m in models if m['weight'] is not None}
+            for model in analysis.simple_models():
+                self.assertEqual(model.weight, expected[model.model_type_id])
+                self.assertEqual({weight.weight for weight in model.model_weights}, {model.weight})
+
+    def test_unique_models_and_profiles(self):
+        with app.app_context():
+            model_type = ModelType.query.filter_by(name='Mobility').one()
+            db.session.add(Model(analysis_id=self.analysis_id, model_type_id=model_type.id))
+            self.assertRaises(IntegrityError, db.session.flush)
+            db.session.rollback()
+            db.session.add(Profile(analysis_id=self.analysis_id, person_type_id=self.person_type_id('tourist'),
+                                   weight=1))
+            self.assertRaises(IntegrityError, db.session.flush)
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    unittest.main()